@@ -0,0 +1,520 @@
+"""
+Columnar in-memory snapshot of incidents and SOS alerts for ad-hoc slicing.
+
+Each table is held as NumPy columns: categorical text (type, status,
+district, ...) is dictionary-encoded into integer codes, coordinates and
+numbers are float arrays and ``created_at`` is epoch seconds. A query
+combines predicates into one boolean mask:
+
+* ``status=active,resolved`` becomes a lookup table over the column's
+  dictionary indexed by the codes, so an IN list costs the same as ``=``;
+* time windows and bounding boxes are plain array comparisons;
+
+then counts matches per group (``np.bincount`` over codes) and/or per hour
+or day, and returns the newest matching rows. Writes made through this
+process are applied to the snapshot as they happen. Writes from other
+instances and rows archived by the retention job arrive with the periodic
+refresh, which only reads rows changed (``updated_at``) or archived
+(``archived_at``) since the last one; the full load happens at startup:
+
+    python -m app.columnar bench --rows 2000000
+"""
+import argparse
+import asyncio
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from app.dedup import parse_timestamp
+
+# Columns kept per table: dictionary-encoded text and numeric columns
+SNAPSHOT_SCHEMAS = {
+    "incidents": {
+        "strings": ("incident_type", "status", "district", "state"),
+        "numbers": ("latitude", "longitude", "report_count"),
+        # Duplicate reports are folded into their canonical incident
+        "flags": ("canonical_incident_id",),
+    },
+    "sos_alerts": {
+        "strings": ("emergency_type", "status", "district", "state", "priority"),
+        "numbers": ("latitude", "longitude", "escalation_level"),
+        "flags": (),
+    },
+}
+
+# A refresh re-reads this far behind its watermark: updated_at is set when a
+# transaction starts, so a slow one can commit a row stamped before it
+REFRESH_OVERLAP_SECONDS = 120
+
+TIME_BUCKETS = {"hour": 3600, "day": 86400}
+DEFAULT_ROW_LIMIT = 50
+MAX_ROW_LIMIT = 1000
+
+
+class SnapshotError(ValueError):
+    """A snapshot query names an unknown table, column or bucket"""
+
+
+class DictionaryColumn:
+    """Text column stored as int32 codes into a list of distinct values (code 0 is None)"""
+
+    def __init__(self, capacity: int):
+        self.codes = np.zeros(capacity, dtype=np.int32)
+        self.values: List[Optional[str]] = [None]
+        self.lookup: Dict[Optional[str], int] = {None: 0}
+
+    def encode(self, value) -> int:
+        code = self.lookup.get(value)
+        if code is None:
+            code = self.lookup[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def matcher(self, wanted: Iterable) -> np.ndarray:
+        """Boolean table indexed by code: True for the wanted values"""
+        table = np.zeros(len(self.values), dtype=bool)
+        for value in wanted:
+            code = self.lookup.get(value)
+            if code is not None:
+                table[code] = True
+        return table
+
+
+class ColumnarTable:
+    """
+    One table's rows as growable NumPy columns
+
+    Rows are addressed by id; an upsert overwrites the row in place (only
+    the columns present in the update) and a delete clears its ``live``
+    bit, so neither moves other rows.
+    """
+
+    def __init__(self, name: str, capacity: int = 1024):
+        if name not in SNAPSHOT_SCHEMAS:
+            raise SnapshotError(f"No snapshot for table {name}")
+        schema = SNAPSHOT_SCHEMAS[name]
+        self.name = name
+        self.count = 0
+        self.ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.live = np.zeros(capacity, dtype=bool)
+        self.created = np.zeros(capacity, dtype=np.float64)
+        self.strings = {column: DictionaryColumn(capacity) for column in schema["strings"]}
+        self.numbers = {column: np.full(capacity, np.nan) for column in schema["numbers"]}
+        self.flags = {column: np.zeros(capacity, dtype=bool) for column in schema["flags"]}
+
+    def __len__(self):
+        return int(self.live[:self.count].sum())
+
+    def _grow(self, needed: int):
+        capacity = len(self.live)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+
+        def grown(array: np.ndarray, fill=0) -> np.ndarray:
+            bigger = np.full(capacity, fill, dtype=array.dtype)
+            bigger[:len(array)] = array
+            return bigger
+
+        self.live = grown(self.live)
+        self.created = grown(self.created)
+        for column in self.strings.values():
+            column.codes = grown(column.codes)
+        for name, array in self.numbers.items():
+            self.numbers[name] = grown(array, np.nan)
+        for name, array in self.flags.items():
+            self.flags[name] = grown(array)
+
+    def upsert(self, row: dict):
+        """Insert a row, or update the columns it carries if its id is known"""
+        row_id = str(row["id"])
+        index = self.rows.get(row_id)
+        if index is None:
+            index = self.count
+            self._grow(index + 1)
+            self.rows[row_id] = index
+            self.ids.append(row_id)
+            self.count += 1
+            self.created[index] = parse_timestamp(row["created_at"]) if row.get("created_at") else time.time()
+        self.live[index] = True
+        for name, column in self.strings.items():
+            if name in row:
+                column.codes[index] = column.encode(row[name])
+        for name, array in self.numbers.items():
+            if name in row:
+                array[index] = np.nan if row[name] is None else float(row[name])
+        for name, array in self.flags.items():
+            if name in row:
+                array[index] = bool(row[name])
+
+    def delete(self, row_id: str) -> bool:
+        index = self.rows.get(str(row_id))
+        if index is None or not self.live[index]:
+            return False
+        self.live[index] = False
+        return True
+
+    def load(self, rows: List[dict]):
+        """Replace the table's contents with ``rows`` (column-at-a-time, for warm-up)"""
+        self.__init__(self.name, max(len(rows), 1024))
+        count = len(rows)
+        self.ids = [str(row["id"]) for row in rows]
+        self.rows = {row_id: index for index, row_id in enumerate(self.ids)}
+        self.count = len(self.ids)
+        self.live[:count] = True
+        self.created[:count] = [parse_timestamp(row["created_at"]) if row.get("created_at") else time.time() for row in rows]
+        for name, column in self.strings.items():
+            column.codes[:count] = [column.encode(row.get(name)) for row in rows]
+        for name, array in self.numbers.items():
+            array[:count] = [np.nan if row.get(name) is None else float(row[name]) for row in rows]
+        for name, array in self.flags.items():
+            array[:count] = [bool(row.get(name)) for row in rows]
+
+    def column_names(self) -> List[str]:
+        return ["created_at", *self.strings, *self.numbers, *self.flags]
+
+    def query(
+        self,
+        where: Optional[Dict[str, Iterable]] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        bbox: Optional[tuple] = None,
+        group_by: Optional[str] = None,
+        bucket: Optional[str] = None,
+        limit: int = DEFAULT_ROW_LIMIT,
+        exclude_flags: Iterable[str] = (),
+    ) -> dict:
+        """
+        Filter and aggregate the snapshot
+
+        Args:
+            where: Dictionary column -> accepted values (None matches empty)
+            since, until: Created-at window in epoch seconds (until exclusive)
+            bbox: (min_lon, min_lat, max_lon, max_lat)
+            group_by: Dictionary column to count matches by
+            bucket: "hour" or "day" to count matches over time
+            limit: Newest matching rows to return
+            exclude_flags: Flag columns whose set rows are skipped
+
+        Returns:
+            dict: matched, groups/buckets when asked for, rows, elapsed_ms
+        """
+        started = time.perf_counter()
+        # This runs in the threadpool while upserts may grow (replace) the
+        # arrays: take the row count, then every array, once
+        count = self.count
+        created = self.created[:count]
+        codes = {name: column.codes[:count] for name, column in self.strings.items()}
+        numbers = {name: array[:count] for name, array in self.numbers.items()}
+        flags = {name: array[:count] for name, array in self.flags.items()}
+        mask = self.live[:count].copy()
+        for name, values in (where or {}).items():
+            if name not in self.strings:
+                raise SnapshotError(f"Cannot filter {self.name} by {name}")
+            mask &= self.strings[name].matcher(values)[codes[name]]
+        if since is not None:
+            mask &= created >= since
+        if until is not None:
+            mask &= created < until
+        if bbox is not None:
+            min_lon, min_lat, max_lon, max_lat = bbox
+            latitudes, longitudes = numbers["latitude"], numbers["longitude"]
+            mask &= (latitudes >= min_lat) & (latitudes <= max_lat) & (longitudes >= min_lon) & (longitudes <= max_lon)
+        for name in exclude_flags:
+            mask &= ~flags[name]
+        matched = np.flatnonzero(mask)
+
+        result = {"table": self.name, "matched": int(len(matched)), "total": len(self)}
+        if group_by is not None:
+            if group_by not in self.strings:
+                raise SnapshotError(f"Cannot group {self.name} by {group_by}")
+            column = self.strings[group_by]
+            counts = np.bincount(codes[group_by][matched], minlength=len(column.values))
+            groups = {column.values[code] if code else None: int(counts[code]) for code in np.flatnonzero(counts)}
+            result["groups"] = dict(sorted(groups.items(), key=lambda item: -item[1]))
+        if bucket is not None:
+            if bucket not in TIME_BUCKETS:
+                raise SnapshotError(f"bucket must be one of {', '.join(TIME_BUCKETS)}")
+            width = TIME_BUCKETS[bucket]
+            starts, counts = np.unique(np.floor(created[matched] / width).astype(np.int64), return_counts=True)
+            result["buckets"] = [
+                {"start": datetime.fromtimestamp(int(start) * width, tz=timezone.utc).isoformat(), "count": int(n)}
+                for start, n in zip(starts, counts)
+            ]
+        limit = max(0, min(limit, MAX_ROW_LIMIT))
+        if limit and len(matched):
+            newest = matched
+            if len(matched) > limit:
+                newest = matched[np.argpartition(created[matched], -limit)[-limit:]]
+            newest = newest[np.argsort(created[newest])[::-1]]
+            result["rows"] = [self.row(index) for index in newest]
+        else:
+            result["rows"] = []
+        result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return result
+
+    def row(self, index: int) -> dict:
+        """The snapshot's columns of one row (not the full database row)"""
+        row = {
+            "id": self.ids[index],
+            "created_at": datetime.fromtimestamp(self.created[index], tz=timezone.utc).isoformat(),
+        }
+        for name, column in self.strings.items():
+            row[name] = column.values[column.codes[index]]
+        for name, array in self.numbers.items():
+            row[name] = None if np.isnan(array[index]) else float(array[index])
+        return row
+
+    def stats(self) -> dict:
+        count = self.count
+        arrays = [self.live, self.created, *self.numbers.values(), *self.flags.values(),
+                  *(column.codes for column in self.strings.values())]
+        return {
+            "rows": len(self),
+            "deleted": count - len(self),
+            "distinct": {name: len(column.values) - 1 for name, column in self.strings.items()},
+            "bytes": sum(array.nbytes for array in arrays),
+        }
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+
+
+class ColumnarSnapshot:
+    """
+    The incidents and sos_alerts snapshots, kept up to date from writes
+
+    ``warm`` loads each table once. ``refresh`` then reads, in a worker
+    thread, the rows updated since the table's ``updated_at`` watermark and
+    the ids archived since its ``archived_at`` one (both keyset-paged, see
+    migration 0015), and applies them; writes applied while it is reading
+    are replayed on top so they are not overwritten by older copies.
+    """
+
+    def __init__(self, tables: Iterable[str] = tuple(SNAPSHOT_SCHEMAS), page_size: int = 1000):
+        self.tables = {name: ColumnarTable(name) for name in tables}
+        self.page_size = page_size
+        self.built_at: Dict[str, float] = {}
+        self.refreshed_at: Dict[str, float] = {}
+        # table -> {"updated_at": epoch seconds, "archived_at": epoch seconds}
+        self.watermarks: Dict[str, dict] = {}
+        self.applied = 0
+        self.refreshed_rows = 0
+        self.archived_rows = 0
+        # Writes seen while a refresh of that table is reading
+        self._refreshing: Dict[str, List[tuple]] = {}
+
+    def table(self, name: str) -> ColumnarTable:
+        if name not in self.tables:
+            raise SnapshotError(f"No snapshot for table {name}; choose from {', '.join(self.tables)}")
+        return self.tables[name]
+
+    def apply(self, name: str, row: Optional[dict]):
+        """Apply an inserted or updated row (partial updates are fine if they carry the id)"""
+        if not row or name not in self.tables:
+            return
+        self.tables[name].upsert(row)
+        self.applied += 1
+        if name in self._refreshing:
+            self._refreshing[name].append(("upsert", row))
+
+    def remove(self, name: str, row_id: str):
+        if name not in self.tables:
+            return
+        self.tables[name].delete(row_id)
+        if name in self._refreshing:
+            self._refreshing[name].append(("delete", row_id))
+
+    def _pages(self, supabase, relation: str, columns: str, order_column: str = "id",
+               since: Optional[float] = None) -> Iterator[List[dict]]:
+        """Keyset pages of a relation in (order_column, id) order, from ``since`` on"""
+        last = None
+        while True:
+            query = supabase.table(relation).select(columns)
+            if since is not None:
+                query = query.gte(order_column, _iso(since))
+            if last is not None:
+                if order_column == "id":
+                    query = query.gt("id", last["id"])
+                else:
+                    value = last[order_column]
+                    query = query.or_(f'{order_column}.gt."{value}",and({order_column}.eq."{value}",id.gt.{last["id"]})')
+            if order_column != "id":
+                query = query.order(order_column)
+            page = query.order("id").limit(self.page_size).execute().data or []
+            if page:
+                yield page
+            if len(page) < self.page_size:
+                return
+            last = page[-1]
+
+    @staticmethod
+    def _columns(name: str) -> str:
+        schema = SNAPSHOT_SCHEMAS[name]
+        return ", ".join(["id", "created_at", "updated_at", *schema["strings"], *schema["numbers"], *schema["flags"]])
+
+    def _latest(self, supabase, relation: str, column: str) -> Optional[float]:
+        rows = supabase.table(relation).select(column).not_.is_(column, "null").order(column, desc=True).limit(1).execute().data
+        return parse_timestamp(rows[0][column]) if rows and rows[0].get(column) else None
+
+    def warm(self, supabase):
+        """Load every table in full (blocking; for startup)"""
+        for name in self.tables:
+            started = time.time()
+            rows = [row for page in self._pages(supabase, name, self._columns(name)) for row in page]
+            self.tables[name].load(rows)
+            self.watermarks[name] = {
+                "updated_at": self._latest(supabase, name, "updated_at") or started,
+                "archived_at": self._latest(supabase, f"{name}_archive", "archived_at") or started,
+            }
+            self.built_at[name] = self.refreshed_at[name] = time.time()
+        print(f"Built columnar snapshot: {', '.join(f'{len(table)} {name}' for name, table in self.tables.items())}")
+
+    def _changes(self, supabase, name: str) -> tuple:
+        """Rows updated and ids archived since the watermarks (with overlap)"""
+        marks = self.watermarks[name]
+        updated = [
+            row for page in self._pages(supabase, name, self._columns(name), "updated_at",
+                                        marks["updated_at"] - REFRESH_OVERLAP_SECONDS)
+            for row in page
+        ]
+        archived = [
+            row for page in self._pages(supabase, f"{name}_archive", "id, archived_at", "archived_at",
+                                        marks["archived_at"] - REFRESH_OVERLAP_SECONDS)
+            for row in page
+        ]
+        return updated, archived
+
+    async def refresh(self, supabase, name: str):
+        """Apply rows changed or archived since the last refresh, read off the event loop"""
+        from fastapi.concurrency import run_in_threadpool
+
+        if name not in self.watermarks:
+            return
+        self._refreshing[name] = []
+        try:
+            updated, archived = await run_in_threadpool(self._changes, supabase, name)
+            table = self.tables[name]
+            for row in updated:
+                table.upsert(row)
+            for row in archived:
+                table.delete(row["id"])
+            for action, value in self._refreshing[name]:
+                if action == "upsert":
+                    table.upsert(value)
+                else:
+                    table.delete(value)
+        finally:
+            del self._refreshing[name]
+        marks = self.watermarks[name]
+        for column, rows in (("updated_at", updated), ("archived_at", archived)):
+            stamps = [parse_timestamp(row[column]) for row in rows if row.get(column)]
+            if stamps:
+                marks[column] = max(marks[column], max(stamps))
+        self.refreshed_rows += len(updated)
+        self.archived_rows += len(archived)
+        self.refreshed_at[name] = time.time()
+
+    async def refresh_periodically(self, supabase, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            for name in list(self.tables):
+                try:
+                    await self.refresh(supabase, name)
+                except Exception as e:
+                    print(f"Error refreshing {name} snapshot: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "tables": {
+                name: {**table.stats(), "built_at": self.built_at.get(name), "refreshed_at": self.refreshed_at.get(name)}
+                for name, table in self.tables.items()
+            },
+            "applied_writes": self.applied,
+            "refreshed_rows": self.refreshed_rows,
+            "archived_rows": self.archived_rows,
+        }
+
+
+def _synthetic_rows(count: int, rng) -> List[dict]:
+    types = ["flood", "fire", "landslide", "medical", "earthquake", "cyclone", "general"]
+    statuses = ["active", "active", "active", "resolved", "false_alarm"]
+    districts = [f"District {i}" for i in range(700)]
+    now = time.time()
+    created = now - rng.uniform(0, 30 * 86400, count)
+    type_codes = rng.integers(0, len(types), count)
+    status_codes = rng.integers(0, len(statuses), count)
+    district_codes = rng.integers(0, len(districts), count)
+    latitudes = rng.uniform(8, 35, count)
+    longitudes = rng.uniform(68, 97, count)
+    return [
+        {
+            "id": str(i),
+            "created_at": float(created[i]),
+            "emergency_type": types[type_codes[i]],
+            "status": statuses[status_codes[i]],
+            "district": districts[district_codes[i]],
+            "state": None,
+            "priority": "normal",
+            "latitude": float(latitudes[i]),
+            "longitude": float(longitudes[i]),
+            "escalation_level": 0,
+        }
+        for i in range(count)
+    ]
+
+
+def bench(rows: int, repeat: int = 5) -> dict:
+    """Time a combined type/status/window/bbox query grouped by district"""
+    rng = np.random.default_rng(7)
+    data = _synthetic_rows(rows, rng)
+    table = ColumnarTable("sos_alerts")
+    started = time.perf_counter()
+    table.load(data)
+    load_seconds = time.perf_counter() - started
+    since = time.time() - 7 * 86400
+    bbox = (85.0, 20.0, 93.0, 28.0)
+    query = dict(where={"emergency_type": ["flood", "cyclone"], "status": ["active"]}, since=since, bbox=bbox,
+                 group_by="district", bucket="day", limit=50)
+    timings = []
+    for _ in range(repeat):
+        result = table.query(**query)
+        timings.append(result["elapsed_ms"])
+    # Reference: the same predicate over the row dicts
+    started = time.perf_counter()
+    python_matches = sum(
+        1 for row in data
+        if row["emergency_type"] in ("flood", "cyclone") and row["status"] == "active" and row["created_at"] >= since
+        and bbox[0] <= row["longitude"] <= bbox[2] and bbox[1] <= row["latitude"] <= bbox[3]
+    )
+    python_ms = (time.perf_counter() - started) * 1000
+    return {
+        "rows": rows,
+        "load_seconds": round(load_seconds, 2),
+        "bytes": table.stats()["bytes"],
+        "matched": result["matched"],
+        "python_matched": python_matches,
+        "query_ms_best": min(timings),
+        "query_ms_median": sorted(timings)[len(timings) // 2],
+        "python_filter_ms": round(python_ms, 1),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Columnar incident/SOS snapshot")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    bench_parser = subcommands.add_parser("bench", help="Time filter/aggregate queries over synthetic alerts")
+    bench_parser.add_argument("--rows", type=int, default=2000000)
+    args = parser.parse_args(argv)
+    print(bench(args.rows))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
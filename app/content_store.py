@@ -0,0 +1,242 @@
+"""
+Content-addressed image storage with reference counts.
+
+Uploads are hashed (SHA-256) while they are read, and stored under a path
+derived from the hash alone (``sha256/ab/abcdef...``), so every copy of a
+forwarded photo maps to one object and one public URL. Each use of an
+object takes a reference in ``stored_objects`` (see migration 0012); only
+the first one writes to storage, and releasing the last one deletes the
+object. The two RPCs do the counting inside the database, so concurrent
+uploads and deletes from several instances stay consistent.
+"""
+import asyncio
+import contextlib
+import hashlib
+import re
+from typing import AsyncIterator, Dict, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+from fastapi.concurrency import run_in_threadpool
+
+HASH_READ_CHUNK = 1024 * 1024
+CONTENT_PREFIX = "sha256"
+# Supabase public URLs, and LocalUploadBackend's (relative when PUBLIC_BASE_URL is unset)
+_CONTENT_PATH = re.compile(r"(?:/storage/v1/object/public|/api/uploads/local/files)/([^/]+)/("
+                           + CONTENT_PREFIX + r"/[0-9a-f]{2}/([0-9a-f]{64}))$")
+
+
+async def read_and_hash(file) -> Tuple[bytes, str]:
+    """Read an UploadFile in chunks, hashing as it streams in; returns (content, hex digest)"""
+    digest = hashlib.sha256()
+    chunks = []
+    while True:
+        chunk = await file.read(HASH_READ_CHUNK)
+        if not chunk:
+            break
+        digest.update(chunk)
+        chunks.append(chunk)
+    return b"".join(chunks), digest.hexdigest()
+
+
+async def iter_file(path: str, chunk_size: int = HASH_READ_CHUNK) -> AsyncIterator[bytes]:
+    """Stream a local file in chunks without blocking the event loop"""
+    file = await run_in_threadpool(open, path, "rb")
+    try:
+        while True:
+            chunk = await run_in_threadpool(file.read, chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        file.close()
+
+
+def _already_exists(error: Exception) -> bool:
+    return "409" in str(error) or "Duplicate" in str(error)
+
+
+def content_path(digest: str) -> str:
+    """Object path for content with this SHA-256 (the same in every bucket)"""
+    return f"{CONTENT_PREFIX}/{digest[:2]}/{digest}"
+
+
+def parse_content_url(url: Optional[str]) -> Optional[Tuple[str, str, str]]:
+    """(bucket, path, digest) of a content-addressed public URL, or None for other URLs"""
+    match = _CONTENT_PATH.search(unquote(url or ""))
+    return match.groups() if match else None
+
+
+class ContentStore:
+    """
+    Reference-counted, de-duplicated uploads over the pooled storage client
+
+    Args:
+        supabase: Client used for the acquire/release RPCs
+        storage: PooledStorageClient doing the storage writes and deletes
+    """
+
+    def __init__(self, supabase, storage):
+        self.supabase = supabase
+        self.storage = storage
+        # (bucket, digest) -> upload or delete in progress; the others for
+        # the same content in this process wait for it instead of racing it
+        self._uploading: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.stored = 0
+        self.deduplicated = 0
+        self.bytes_saved = 0
+        self.released = 0
+        self.deleted = 0
+
+    def public_url(self, bucket: str, digest: str) -> str:
+        return self.storage.public_url(bucket, content_path(digest))
+
+    @contextlib.asynccontextmanager
+    async def _exclusive(self, bucket: str, digest: str):
+        key = (bucket, digest)
+        while key in self._uploading:
+            await asyncio.shield(self._uploading[key])
+        owner = self._uploading[key] = asyncio.get_running_loop().create_future()
+        try:
+            yield
+        finally:
+            owner.set_result(None)
+            self._uploading.pop(key, None)
+
+    async def _acquire(self, bucket: str, digest: str, size: int, content_type: str) -> dict:
+        acquired = await run_in_threadpool(lambda: self.supabase.rpc("acquire_stored_object", {
+            "p_bucket": bucket,
+            "p_content_hash": digest,
+            "p_path": content_path(digest),
+            "p_size": size,
+            "p_content_type": content_type,
+        }).execute())
+        row = (acquired.data or [{}])[0]
+        if not row.get("created"):
+            self.deduplicated += 1
+            self.bytes_saved += size
+        return row
+
+    async def store(self, bucket: str, content, digest: str, content_type: str = "application/octet-stream",
+                    size: Optional[int] = None) -> Tuple[str, bool]:
+        """
+        Take a reference to ``content`` in ``bucket``, uploading it if it is new
+
+        Args:
+            content: Bytes, or an async iterator of byte chunks (then pass ``size``)
+
+        Returns:
+            tuple: (public URL, True if an existing object was reused)
+        """
+        size = len(content) if size is None else size
+        path = content_path(digest)
+        async with self._exclusive(bucket, digest):
+            row = await self._acquire(bucket, digest, size, content_type)
+            if not row.get("created"):
+                return self.storage.public_url(bucket, row.get("path") or path), True
+            try:
+                url = await self.storage.upload(bucket, path, content, content_type)
+            except Exception as e:
+                # The object outlived its row (e.g. a release racing an upload)
+                if not _already_exists(e):
+                    await self._release(bucket, digest)
+                    raise
+                url = self.storage.public_url(bucket, path)
+            self.stored += 1
+            return url, False
+
+    async def adopt(self, bucket: str, staged_path: str, digest: str, size: int,
+                    content_type: str = "application/octet-stream") -> Tuple[str, bool]:
+        """
+        Take a reference to an object already uploaded to ``staged_path``
+
+        The staged object is moved to its content path inside storage when
+        the content is new, and deleted when an object with the same hash
+        exists; its bytes never pass through this process. The caller must
+        have checked that the staged object hashes to ``digest``.
+
+        Returns:
+            tuple: (public URL, True if an existing object was reused)
+        """
+        path = content_path(digest)
+        async with self._exclusive(bucket, digest):
+            row = await self._acquire(bucket, digest, size, content_type)
+            created = bool(row.get("created"))
+            if created:
+                try:
+                    await self.storage.move(bucket, staged_path, path)
+                    self.stored += 1
+                    return self.storage.public_url(bucket, path), False
+                except Exception as e:
+                    # An object that outlived its row already holds these bytes
+                    if not _already_exists(e):
+                        await self._release(bucket, digest)
+                        raise
+                self.stored += 1
+            try:
+                await self.storage.remove(bucket, [staged_path])
+            except Exception as e:
+                print(f"Error deleting staged upload {bucket}/{staged_path}: {e}")
+            return self.storage.public_url(bucket, row.get("path") or path), not created
+
+    async def _referenced(self, bucket: str, digest: str) -> bool:
+        rows = await run_in_threadpool(lambda: self.supabase.table("stored_objects").select("ref_count")
+                                       .eq("bucket", bucket).eq("content_hash", digest).execute())
+        return bool(rows.data)
+
+    async def release(self, bucket: str, digest: str) -> bool:
+        """Drop one reference; deletes the object when it was the last. Returns True if deleted."""
+        async with self._exclusive(bucket, digest):
+            return await self._release(bucket, digest)
+
+    async def _release(self, bucket: str, digest: str) -> bool:
+        released = await run_in_threadpool(lambda: self.supabase.rpc("release_stored_object", {
+            "p_bucket": bucket,
+            "p_content_hash": digest,
+        }).execute())
+        self.released += 1
+        row = (released.data or [{}])[0]
+        if not row or row.get("ref_count", 1) > 0:
+            return False
+        try:
+            # Another instance may have taken a new reference since, and
+            # found the object still there instead of uploading it
+            if await self._referenced(bucket, digest):
+                return False
+        except Exception as e:
+            # Leaving an unreferenced object behind is the safe side
+            print(f"Error re-checking {bucket}/{row['path']} before deleting it: {e}")
+            return False
+        try:
+            await self.storage.remove(bucket, [row["path"]])
+        except Exception as e:
+            # The reference is gone already; raising would have a retry release it twice
+            print(f"Error deleting unreferenced object {bucket}/{row['path']}: {e}")
+            return False
+        self.deleted += 1
+        return True
+
+    def serves(self, url: Optional[str]) -> bool:
+        """True if ``url`` is a content-addressed URL of this store's storage backend"""
+        parsed = parse_content_url(url)
+        if parsed is None:
+            return False
+        bucket, path, _ = parsed
+        return urlparse(self.storage.public_url(bucket, path)).path == urlparse(unquote(url)).path
+
+    async def release_url(self, url: Optional[str]) -> bool:
+        """Release the object behind a public URL (URLs from before content addressing are left alone)"""
+        parsed = parse_content_url(url)
+        if parsed is None:
+            return False
+        bucket, _, digest = parsed
+        return await self.release(bucket, digest)
+
+    def stats(self) -> dict:
+        return {
+            "stored": self.stored,
+            "deduplicated": self.deduplicated,
+            "bytes_saved": self.bytes_saved,
+            "released": self.released,
+            "deleted": self.deleted,
+            "uploading": len(self._uploading),
+        }
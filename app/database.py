@@ -3,8 +3,9 @@ import os
 from dotenv import load_dotenv
 from typing import Optional
 import io
-import uuid
 from fastapi import UploadFile
+from app.storage_client import public_object_url
+from app.content_store import content_path, read_and_hash
 
 # Load environment variables
 load_dotenv()
@@ -39,34 +40,35 @@ class SupabaseStorage:
         Args:
             file: FastAPI UploadFile object
             bucket_name: Name of the storage bucket
-            folder: Optional folder within bucket
+            folder: Unused; files are stored under their content hash
             
         Returns:
             str: URL of the uploaded file
         """
         try:
-            # Generate unique filename
-            file_extension = file.filename.split('.')[-1] if file.filename else 'jpg'
-            unique_filename = f"{uuid.uuid4()}.{file_extension}"
-            file_path = f"{folder}/{unique_filename}" if folder else unique_filename
-            
-            # Read file content
-            file_content = await file.read()
+            # Stored under its content hash, so re-uploaded copies share one object
+            file_content, digest = await read_and_hash(file)
+            file_path = content_path(digest)
             
             # Upload to Supabase Storage
-            response = self.client.storage.from_(bucket_name).upload(
-                path=file_path,
-                file=file_content,
-                file_options={
-                    "content-type": file.content_type,
-                    "cache-control": "3600"
-                }
-            )
+            try:
+                response = self.client.storage.from_(bucket_name).upload(
+                    path=file_path,
+                    file=file_content,
+                    file_options={
+                        "content-type": file.content_type,
+                        "cache-control": "3600"
+                    }
+                )
+            except Exception as e:
+                if "Duplicate" not in str(e) and "409" not in str(e):
+                    raise
+                # Same content is already stored
+                return public_object_url(SUPABASE_URL, bucket_name, file_path)
             
             if response.status_code == 200:
-                # Get public URL
-                public_url = self.client.storage.from_(bucket_name).get_public_url(file_path)
-                return public_url
+                # Public URL is built locally; no second storage request
+                return public_object_url(SUPABASE_URL, bucket_name, file_path)
             else:
                 raise Exception(f"Upload failed: {response}")
                 
@@ -102,7 +104,7 @@ class SupabaseStorage:
         Returns:
             str: Public URL of the file
         """
-        return self.client.storage.from_(bucket_name).get_public_url(file_path)
+        return public_object_url(SUPABASE_URL, bucket_name, file_path)
     
     async def ensure_buckets_exist(self):
         """Create storage buckets if they don't exist"""
@@ -0,0 +1,342 @@
+import asyncio
+import math
+import random
+import re
+import threading
+import time
+import zlib
+from collections import defaultdict, deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# MinHash parameters: 16 bands of 4 rows puts the LSH threshold near 0.5 Jaccard
+NUM_PERMUTATIONS = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERMUTATIONS // BANDS
+SHINGLE_SIZE = 4
+
+# How long a duplicate waits for its canonical incident's insert before it
+# becomes a canonical incident of its own
+CONFIRM_TIMEOUT_SECONDS = 10.0
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_rng = random.Random(0x5EED)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERMUTATIONS)
+]
+
+_NON_WORD = re.compile(r"[^\w]+", re.UNICODE)
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase and collapse punctuation/whitespace so trivial edits don't matter"""
+    return _NON_WORD.sub(" ", (text or "").lower()).strip()
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    """Character shingles of normalized text"""
+    text = normalize_text(text)
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def minhash_signature(shingle_set: set) -> tuple:
+    """MinHash signature of a shingle set"""
+    if not shingle_set:
+        return tuple([_MAX_HASH] * NUM_PERMUTATIONS)
+    hashes = [zlib.crc32(shingle.encode("utf-8")) for shingle in shingle_set]
+    return tuple(
+        min(((a * value + b) % _MERSENNE_PRIME) & _MAX_HASH for value in hashes)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def estimated_similarity(first: tuple, second: tuple) -> float:
+    """Estimated Jaccard similarity from two MinHash signatures"""
+    return sum(1 for x, y in zip(first, second) if x == y) / NUM_PERMUTATIONS
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points in kilometres"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 6371.0 * 2 * math.asin(math.sqrt(a))
+
+
+def parse_timestamp(value) -> float:
+    """Parse a Supabase timestamp (ISO 8601) into epoch seconds"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).replace("Z", "+00:00")
+    # Python < 3.11 only accepts 3 or 6 fractional digits
+    match = re.match(r"(.*?\.)(\d+)(.*)", text)
+    if match:
+        text = f"{match.group(1)}{match.group(2)[:6].ljust(6, '0')}{match.group(3)}"
+    return datetime.fromisoformat(text).timestamp()
+
+
+class _Report:
+    __slots__ = ("incident_id", "canonical_id", "incident_type", "latitude", "longitude", "signature", "created_at")
+
+    def __init__(self, incident_id, canonical_id, incident_type, latitude, longitude, signature, created_at):
+        self.incident_id = incident_id
+        self.canonical_id = canonical_id
+        self.incident_type = incident_type
+        self.latitude = latitude
+        self.longitude = longitude
+        self.signature = signature
+        self.created_at = created_at
+
+
+class IncidentDeduplicator:
+    """
+    Clusters incoming incident reports against recent ones.
+
+    Reports inside the time window are kept in memory with their MinHash
+    signature (over description and location shingles) in LSH band buckets,
+    so a new report is only compared against reports sharing a band. A
+    candidate is a duplicate when it has the same incident type, its text is
+    similar enough and, if both reports carry coordinates, it lies within
+    ``radius_km``. Duplicates are attached to the canonical incident of the
+    report they matched.
+
+    A canonical incident observed live stays pending until ``confirm`` says
+    its row is stored, and its duplicates wait for that in ``resolve``
+    (``canonical_incident_id`` is a foreign key). If its insert fails,
+    ``forget`` promotes the oldest waiting duplicate in its place.
+    """
+
+    def __init__(self, window_seconds: float = 6 * 3600, radius_km: float = 1.0, similarity_threshold: float = 0.5):
+        self.window_seconds = window_seconds
+        self.radius_km = radius_km
+        self.similarity_threshold = similarity_threshold
+        self.reports: Dict[str, _Report] = {}
+        self.buckets: Dict[tuple, set] = defaultdict(set)
+        self.timeline = deque()
+        # canonical id -> {"count": reports in cluster, "live": reports still in window,
+        #                  "confirmed": canonical row is stored}
+        self.clusters: Dict[str, dict] = {}
+        # canonical id -> event set when it is confirmed or forgotten
+        self._waiters: Dict[str, asyncio.Event] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _bands(signature: tuple):
+        for band in range(BANDS):
+            start = band * ROWS_PER_BAND
+            yield (band,) + signature[start:start + ROWS_PER_BAND]
+
+    def _evict(self, now: float):
+        cutoff = now - self.window_seconds
+        while self.timeline and self.timeline[0][0] < cutoff:
+            _, incident_id = self.timeline.popleft()
+            self._remove(incident_id)
+
+    def _remove(self, incident_id: str):
+        report = self.reports.pop(incident_id, None)
+        if report is None:
+            return
+        for key in self._bands(report.signature):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.discard(incident_id)
+                if not bucket:
+                    del self.buckets[key]
+        cluster = self.clusters.get(report.canonical_id)
+        if cluster is not None:
+            cluster["live"] -= 1
+            if cluster["live"] <= 0:
+                del self.clusters[report.canonical_id]
+
+    def _best_match(self, incident_type, latitude, longitude, signature) -> Optional[_Report]:
+        candidates = set()
+        for key in self._bands(signature):
+            candidates.update(self.buckets.get(key, ()))
+
+        best, best_score = None, 0.0
+        for candidate_id in candidates:
+            candidate = self.reports[candidate_id]
+            if candidate.incident_type != incident_type:
+                continue
+            if None not in (latitude, longitude, candidate.latitude, candidate.longitude):
+                if haversine_km(latitude, longitude, candidate.latitude, candidate.longitude) > self.radius_km:
+                    continue
+            score = estimated_similarity(signature, candidate.signature)
+            if score >= self.similarity_threshold and score > best_score:
+                best, best_score = candidate, score
+        return best
+
+    def observe(
+        self,
+        incident_id: str,
+        incident_type: str,
+        description: str,
+        location: str,
+        latitude: Optional[float] = None,
+        longitude: Optional[float] = None,
+        created_at: Optional[float] = None,
+        canonical_id: Optional[str] = None,
+        report_count: Optional[int] = None,
+    ) -> dict:
+        """
+        Cluster a report and register it
+
+        When ``canonical_id`` is given (e.g. when warming from the database)
+        the report is registered under it without matching.
+
+        Returns:
+            dict: canonical_id, duplicate flag and the cluster's report_count
+        """
+        created_at = time.time() if created_at is None else created_at
+        signature = minhash_signature(shingles(f"{description} {location}"))
+
+        with self._lock:
+            self._evict(time.time())
+            # Reports loaded with their canonical id are already stored
+            stored = canonical_id is not None
+            if canonical_id is None:
+                match = self._best_match(incident_type, latitude, longitude, signature)
+                canonical_id = match.canonical_id if match else incident_id
+
+            cluster = self.clusters.setdefault(canonical_id, {"count": 0, "live": 0, "confirmed": stored})
+            if report_count is not None:
+                cluster["count"] = max(cluster["count"], report_count)
+            elif canonical_id != incident_id or cluster["count"] == 0:
+                cluster["count"] += 1
+            cluster["live"] += 1
+            cluster["count"] = max(cluster["count"], cluster["live"])
+
+            self.reports[incident_id] = _Report(incident_id, canonical_id, incident_type, latitude, longitude, signature, created_at)
+            for key in self._bands(signature):
+                self.buckets[key].add(incident_id)
+            self.timeline.append((created_at, incident_id))
+
+            return {
+                "canonical_id": canonical_id,
+                "duplicate": canonical_id != incident_id,
+                "report_count": cluster["count"],
+            }
+
+    def _wake(self, canonical_id: str):
+        event = self._waiters.pop(canonical_id, None)
+        if event is not None:
+            event.set()
+
+    def confirm(self, incident_id: str):
+        """Mark a report's row as stored, releasing duplicates waiting on it"""
+        with self._lock:
+            cluster = self.clusters.get(incident_id)
+            if cluster is not None:
+                cluster["confirmed"] = True
+            self._wake(incident_id)
+
+    def _detach(self, report: _Report):
+        """Move a duplicate into a new cluster of its own, as its canonical incident"""
+        self._remove(report.incident_id)
+        cluster = self.clusters.get(report.canonical_id)
+        if cluster is not None:
+            cluster["count"] -= 1
+        report.canonical_id = report.incident_id
+        self.reports[report.incident_id] = report
+        for key in self._bands(report.signature):
+            self.buckets[key].add(report.incident_id)
+        self.clusters[report.incident_id] = {"count": 1, "live": 1, "confirmed": False}
+
+    async def resolve(self, incident_id: str, timeout: float = CONFIRM_TIMEOUT_SECONDS) -> dict:
+        """
+        Wait until an observed report's canonical incident is stored
+
+        The report may be promoted to canonical meanwhile (its canonical's
+        insert failed), or detached into its own cluster after ``timeout``.
+
+        Returns:
+            dict: canonical_id, duplicate flag and report_count, as ``observe``
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            with self._lock:
+                report = self.reports.get(incident_id)
+                if report is None:
+                    return {"canonical_id": incident_id, "duplicate": False, "report_count": 1}
+                canonical_id = report.canonical_id
+                cluster = self.clusters[canonical_id]
+                if canonical_id == incident_id or cluster["confirmed"]:
+                    return {
+                        "canonical_id": canonical_id,
+                        "duplicate": canonical_id != incident_id,
+                        "report_count": cluster["count"],
+                    }
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    self._detach(report)
+                    continue
+                event = self._waiters.setdefault(canonical_id, asyncio.Event())
+            try:
+                await asyncio.wait_for(event.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    def forget(self, incident_id: str):
+        """
+        Drop a report that was observed but never stored
+
+        A forgotten canonical incident hands its cluster to the oldest of its
+        duplicates, which are still waiting in ``resolve`` and have not been
+        stored either.
+        """
+        with self._lock:
+            report = self.reports.get(incident_id)
+            if report is None:
+                return
+            cluster = self.clusters.get(report.canonical_id)
+            if cluster is not None:
+                cluster["count"] -= 1
+            self._remove(incident_id)
+            if report.canonical_id == incident_id and cluster is not None and cluster["live"] > 0:
+                members = [member for member in self.reports.values() if member.canonical_id == incident_id]
+                heir = min(members, key=lambda member: member.created_at)
+                for member in members:
+                    member.canonical_id = heir.incident_id
+                del self.clusters[incident_id]
+                cluster["confirmed"] = False
+                self.clusters[heir.incident_id] = cluster
+            self._wake(incident_id)
+
+    def warm(self, supabase, page_size: int = 1000):
+        """Load the reports inside the time window from the database"""
+        since = datetime.utcfromtimestamp(time.time() - self.window_seconds).isoformat()
+        rows: List[dict] = []
+        offset = 0
+        while True:
+            result = (
+                supabase.table("incidents")
+                .select("id, incident_type, description, location, latitude, longitude, created_at, canonical_incident_id, report_count")
+                .gte("created_at", since)
+                .order("created_at")
+                .range(offset, offset + page_size - 1)
+                .execute()
+            )
+            batch = result.data or []
+            rows.extend(batch)
+            if len(batch) < page_size:
+                break
+            offset += page_size
+
+        for row in rows:
+            self.observe(
+                incident_id=row["id"],
+                incident_type=row["incident_type"],
+                description=row["description"],
+                location=row["location"],
+                latitude=float(row["latitude"]) if row.get("latitude") is not None else None,
+                longitude=float(row["longitude"]) if row.get("longitude") is not None else None,
+                created_at=parse_timestamp(row["created_at"]),
+                canonical_id=row.get("canonical_incident_id") or row["id"],
+                # Only canonical rows carry the cluster's report count
+                report_count=0 if row.get("canonical_incident_id") else row.get("report_count") or 1,
+            )
+        print(f"Incident de-duplication window loaded with {len(rows)} reports")
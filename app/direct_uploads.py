@@ -0,0 +1,353 @@
+import hashlib
+import os
+import re
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional
+from urllib.parse import quote
+
+import httpx
+from fastapi.concurrency import run_in_threadpool
+from jose import JWTError, jwt
+
+from app.content_store import HASH_READ_CHUNK, content_path, iter_file
+from app.storage_client import public_object_url
+
+# 10MB, same as the storage bucket limit
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+
+# How long a client has to upload and confirm after requesting a target
+UPLOAD_TOKEN_MINUTES = 15
+
+_SHA256 = re.compile(r"^[0-9a-f]{64}$")
+
+# Where each kind of report keeps its photos and which column links them
+# (reports with "multiple" keep every photo in photo_urls; see migrations/0005)
+UPLOAD_TARGETS = {
+    "incident": {"bucket": "incident_images", "folder": "reports", "table": "incidents", "column": "photo_url", "multiple": True},
+    "missing_person": {"bucket": "missing_person_photos", "folder": "reports", "table": "missing_persons", "column": "photo_url", "multiple": True},
+    "community": {"bucket": "community_images", "folder": "posts", "table": "community_posts", "column": "image_url"},
+    "user": {"bucket": "profile_pictures", "folder": "users", "table": "users", "column": "photo_url"},
+}
+
+
+class UploadError(Exception):
+    """Raised when an upload request or confirmation is invalid"""
+
+
+class SupabaseUploadBackend:
+    """Issues signed upload URLs that let clients PUT straight into Supabase Storage"""
+
+    def __init__(self, client, supabase_url: str, service_key: str):
+        self.client = client
+        self.supabase_url = supabase_url
+        self.storage_url = f"{supabase_url.rstrip('/')}/storage/v1"
+        self.service_key = service_key
+
+    def create_target(self, bucket: str, path: str, content_type: str, token: str) -> dict:
+        response = httpx.post(
+            f"{self.storage_url}/object/upload/sign/{bucket}/{path}",
+            headers={"Authorization": f"Bearer {self.service_key}", "apikey": self.service_key},
+            timeout=10,
+        )
+        response.raise_for_status()
+        return {
+            "method": "PUT",
+            "url": f"{self.storage_url}{response.json()['url']}",
+            "headers": {"Content-Type": content_type, "x-upsert": "false"},
+        }
+
+    def stat(self, bucket: str, path: str) -> Optional[dict]:
+        folder, _, filename = path.rpartition("/")
+        entries = self.client.storage.from_(bucket).list(folder, {"search": filename})
+        for entry in entries or []:
+            if entry.get("name") == filename:
+                metadata = entry.get("metadata") or {}
+                return {"size": metadata.get("size"), "content_type": metadata.get("mimetype")}
+        return None
+
+    def public_url(self, bucket: str, path: str) -> str:
+        return public_object_url(self.supabase_url, bucket, path)
+
+    def read(self, bucket: str, path: str) -> bytes:
+        return self.client.storage.from_(bucket).download(path)
+
+    def digest(self, bucket: str, path: str, max_size: int = MAX_UPLOAD_SIZE) -> str:
+        """SHA-256 of a stored object, streamed through the hash without buffering it"""
+        digest = hashlib.sha256()
+        size = 0
+        with httpx.stream(
+            "GET",
+            f"{self.storage_url}/object/{bucket}/{quote(path)}",
+            headers={"Authorization": f"Bearer {self.service_key}", "apikey": self.service_key},
+            timeout=30,
+        ) as response:
+            response.raise_for_status()
+            for chunk in response.iter_bytes(HASH_READ_CHUNK):
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadError("File too large")
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def delete(self, bucket: str, path: str):
+        self.client.storage.from_(bucket).remove([path])
+
+
+class LocalUploadBackend:
+    """
+    Offline stand-in for object storage.
+
+    Upload targets point back at this API (``PUT /api/uploads/local/{token}``)
+    and objects are written under ``directory``. Used for development and for
+    exercising the upload flow without network access.
+    """
+
+    def __init__(self, directory: str, base_url: str = ""):
+        self.directory = directory
+        self.base_url = base_url.rstrip("/")
+
+    def object_path(self, bucket: str, path: str) -> str:
+        full_path = os.path.normpath(os.path.join(self.directory, bucket, path))
+        if not full_path.startswith(os.path.normpath(self.directory) + os.sep):
+            raise UploadError("Invalid object path")
+        return full_path
+
+    def create_target(self, bucket: str, path: str, content_type: str, token: str) -> dict:
+        return {
+            "method": "PUT",
+            "url": f"{self.base_url}/api/uploads/local/{token}",
+            "headers": {"Content-Type": content_type},
+        }
+
+    def stat(self, bucket: str, path: str) -> Optional[dict]:
+        full_path = self.object_path(bucket, path)
+        if not os.path.isfile(full_path):
+            return None
+        return {"size": os.path.getsize(full_path), "content_type": None}
+
+    def public_url(self, bucket: str, path: str) -> str:
+        return f"{self.base_url}/api/uploads/local/files/{bucket}/{path}"
+
+    def read(self, bucket: str, path: str) -> bytes:
+        with open(self.object_path(bucket, path), "rb") as file:
+            return file.read()
+
+    def digest(self, bucket: str, path: str, max_size: int = MAX_UPLOAD_SIZE) -> str:
+        digest = hashlib.sha256()
+        with open(self.object_path(bucket, path), "rb") as file:
+            for block in iter(lambda: file.read(HASH_READ_CHUNK), b""):
+                digest.update(block)
+                if file.tell() > max_size:
+                    raise UploadError("File too large")
+        return digest.hexdigest()
+
+    def delete(self, bucket: str, path: str):
+        full_path = self.object_path(bucket, path)
+        if os.path.exists(full_path):
+            os.remove(full_path)
+
+    def _write(self, bucket: str, path: str, content: bytes):
+        full_path = self.object_path(bucket, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "wb") as file:
+            file.write(content)
+
+    def _move(self, bucket: str, source: str, destination: str):
+        destination_path = self.object_path(bucket, destination)
+        if os.path.exists(destination_path):
+            raise UploadError(f"Duplicate object {bucket}/{destination}")
+        os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+        os.replace(self.object_path(bucket, source), destination_path)
+
+    # Storage interface used by ContentStore, as on PooledStorageClient
+
+    async def upload(self, bucket: str, path: str, content, content_type: str = "application/octet-stream") -> str:
+        if isinstance(content, (bytes, bytearray)):
+            await run_in_threadpool(self._write, bucket, path, content)
+        else:
+            await self.receive(bucket, path, content)
+        return self.public_url(bucket, path)
+
+    async def move(self, bucket: str, source: str, destination: str):
+        await run_in_threadpool(self._move, bucket, source, destination)
+
+    async def remove(self, bucket: str, paths: List[str]):
+        for path in paths:
+            await run_in_threadpool(self.delete, bucket, path)
+
+    async def receive(self, bucket: str, path: str, chunks, max_size: int = MAX_UPLOAD_SIZE) -> int:
+        """Stream an uploaded body to disk chunk by chunk"""
+        full_path = self.object_path(bucket, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        partial_path = f"{full_path}.part"
+        written = 0
+        try:
+            with open(partial_path, "wb") as file:
+                async for chunk in chunks:
+                    written += len(chunk)
+                    if written > max_size:
+                        raise UploadError("File too large")
+                    file.write(chunk)
+            os.replace(partial_path, full_path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        return written
+
+
+class DirectUploadService:
+    """
+    Two-step upload flow that keeps image bytes out of the API process.
+
+    1. ``create_upload`` takes the photo's SHA-256 from the client, picks a
+       staging path and returns a short-lived signed target the client
+       uploads to directly.
+    2. ``confirm_upload`` checks the staged object hashes to what was
+       declared (streamed, never buffered), moves it to its content path
+       inside storage through the content store (so a photo uploaded again
+       is stored once, see ``app.content_store``) and links its public URL
+       to the incident, missing-person, post or user row.
+
+    The upload token is a signed JWT carrying bucket, path, target type and
+    digest, so nothing has to be remembered between the two steps.
+    """
+
+    def __init__(self, supabase, backend, content_store, secret_key: str, algorithm: str = "HS256"):
+        self.supabase = supabase
+        self.backend = backend
+        self.content_store = content_store
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+
+    def create_upload(self, target_type: str, filename: str, content_type: str, sha256: str,
+                      file_size: Optional[int] = None) -> dict:
+        """
+        Create a signed upload target
+
+        Args:
+            target_type: incident, missing_person, community or user
+            filename: Original filename (used for the extension)
+            content_type: MIME type the client will upload
+            sha256: Hex SHA-256 of the file, checked on confirmation
+            file_size: Declared size in bytes, if known
+
+        Returns:
+            dict: upload_token, method, url, headers, expires_at
+        """
+        target = UPLOAD_TARGETS.get(target_type)
+        if target is None:
+            raise UploadError(f"Unknown upload target: {target_type}")
+        if not (content_type or "").startswith("image/"):
+            raise UploadError("File must be an image")
+        if file_size is not None and file_size > MAX_UPLOAD_SIZE:
+            raise UploadError("File too large")
+        sha256 = (sha256 or "").lower()
+        if not _SHA256.match(sha256):
+            raise UploadError("sha256 must be the file's hex SHA-256")
+
+        path = self.object_name(target, filename)
+        expires_at = datetime.utcnow() + timedelta(minutes=UPLOAD_TOKEN_MINUTES)
+        token = jwt.encode(
+            {"scope": "upload", "type": target_type, "bucket": target["bucket"], "path": path, "ct": content_type,
+             "sha256": sha256, "exp": expires_at},
+            self.secret_key,
+            algorithm=self.algorithm,
+        )
+
+        upload = self.backend.create_target(target["bucket"], path, content_type, token)
+        upload.update({"upload_token": token, "path": path, "expires_at": expires_at.isoformat() + "Z"})
+        return upload
+
+    @staticmethod
+    def object_name(target: dict, filename: str) -> str:
+        """Unique path in the target's folder for a signed upload to land at before it is confirmed"""
+        file_extension = filename.split('.')[-1].lower() if filename and '.' in filename else 'jpg'
+        file_extension = re.sub(r"[^a-z0-9]", "", file_extension)[:5] or 'jpg'
+        return f"{target['folder']}/{uuid.uuid4()}.{file_extension}"
+
+    def link(self, target_type: str, target_id: str, public_url: str):
+        """Point a report row's photo column at an uploaded object"""
+        target = UPLOAD_TARGETS[target_type]
+        if target.get("multiple"):
+            result = self.supabase.rpc("attach_report_photo", {"target_table": target["table"], "row_id": target_id, "url": public_url}).execute()
+        else:
+            result = self.supabase.table(target["table"]).update({target["column"]: public_url}).eq("id", target_id).execute()
+        if not result.data:
+            raise UploadError(f"{target_type} {target_id} not found")
+
+    async def _link(self, target_type: str, target_id: Optional[str], digest: str, size: int, stored: tuple) -> dict:
+        """Link a stored object to its row, giving the reference back if that fails"""
+        bucket = UPLOAD_TARGETS[target_type]["bucket"]
+        public_url, reused = stored
+        if target_id:
+            try:
+                await run_in_threadpool(self.link, target_type, target_id, public_url)
+            except Exception:
+                await self.content_store.release(bucket, digest)
+                raise
+        return {
+            "public_url": public_url,
+            "path": content_path(digest),
+            "bucket": bucket,
+            "target_type": target_type,
+            "size": size,
+            "reused": reused,
+            "linked": bool(target_id),
+        }
+
+    async def attach_file(self, target_type: str, target_id: Optional[str], file_path: str, content_type: str,
+                          digest: str, size: int) -> dict:
+        """
+        Store a file that was assembled on local disk and link it to a row
+
+        The file is streamed to storage from disk; ``digest`` is its SHA-256,
+        computed while it was assembled.
+
+        Returns:
+            dict: public_url, path, bucket, size, whether an existing object
+            was reused and whether a row was linked
+        """
+        if target_type not in UPLOAD_TARGETS:
+            raise UploadError(f"Unknown upload target: {target_type}")
+        bucket = UPLOAD_TARGETS[target_type]["bucket"]
+        stored = await self.content_store.store(bucket, iter_file(file_path), digest, content_type, size=size)
+        return await self._link(target_type, target_id, digest, size, stored)
+
+    def decode_token(self, token: str) -> dict:
+        try:
+            claims = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+        except JWTError:
+            raise UploadError("Invalid or expired upload token")
+        if claims.get("scope") != "upload" or not claims.get("sha256"):
+            raise UploadError("Invalid upload token")
+        return claims
+
+    async def confirm_upload(self, token: str, target_id: Optional[str] = None) -> dict:
+        """
+        Verify an uploaded object, store it by content and link it to its row
+
+        Args:
+            token: upload_token returned by ``create_upload``
+            target_id: Row to attach the photo to; if omitted only the URL is returned
+
+        Returns:
+            dict: public_url, path, size, whether an existing object was
+            reused and whether a row was linked
+        """
+        claims = self.decode_token(token)
+        bucket, staged_path = claims["bucket"], claims["path"]
+        info = await run_in_threadpool(self.backend.stat, bucket, staged_path)
+        if info is None:
+            raise UploadError("Upload not found; upload the file before confirming")
+        if info.get("size") and info["size"] > MAX_UPLOAD_SIZE:
+            raise UploadError("File too large")
+
+        # Streamed through the hash inside a worker thread; nothing is buffered
+        digest = await run_in_threadpool(self.backend.digest, bucket, staged_path)
+        if digest != claims["sha256"]:
+            await run_in_threadpool(self.backend.delete, bucket, staged_path)
+            raise UploadError("Uploaded file does not match its sha256; request a new upload")
+
+        stored = await self.content_store.adopt(bucket, staged_path, digest, info.get("size") or 0, claims["ct"])
+        return await self._link(claims["type"], target_id, digest, info.get("size") or 0, stored)
@@ -0,0 +1,327 @@
+"""
+Escalation of unanswered SOS alerts.
+
+Every active alert has a timer. When it fires the alert moves up one
+escalation level (its priority is raised and nearby subscribers are
+notified again), and the timer is re-armed for the next level. Resolving
+the alert, or its sender marking themselves safe, cancels the timer.
+
+Timers live in a hierarchical timing wheel, so arming, cancelling and
+expiring are O(1) and a tick costs the same with 100 or 100,000 alerts
+waiting:
+
+    python -m app.escalation bench --timers 100000
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Set
+
+from app.dedup import parse_timestamp
+
+# Escalate after this many minutes unanswered, then again after each
+# further step; the last step repeats until the alert is resolved
+DEFAULT_ESCALATION_STEPS_MINUTES = (5, 15, 30)
+ESCALATION_PRIORITIES = ("normal", "high", "critical")
+
+WHEEL_TICK_SECONDS = 1.0
+WHEEL_SLOTS = 64
+WHEEL_LEVELS = 4
+
+
+def steps_from_env() -> List[float]:
+    """ESCALATION_STEPS_MINUTES ("5,15,30") as seconds"""
+    text = os.getenv("ESCALATION_STEPS_MINUTES")
+    if not text:
+        return [minutes * 60 for minutes in DEFAULT_ESCALATION_STEPS_MINUTES]
+    return [float(minutes) * 60 for minutes in text.split(",") if minutes.strip()]
+
+
+def priority_for(level: int) -> str:
+    return ESCALATION_PRIORITIES[min(level, len(ESCALATION_PRIORITIES) - 1)]
+
+
+class TimingWheel:
+    """
+    Hierarchical timing wheel (Varghese & Lauck)
+
+    Level 0 has ``slots`` slots of one tick each; every level above covers
+    ``slots`` times the span of the one below. A timer goes in the lowest
+    level whose span reaches its deadline. Each tick expires the current
+    level-0 slot, and when a lower level wraps around, the matching slot of
+    the level above is cascaded down. Each timer is touched at most once per
+    level, so the cost per tick does not depend on how many timers are
+    waiting. Deadlines past the top level's span wait in its slots and are
+    re-inserted until they are in range.
+    """
+
+    def __init__(self, slots: int = WHEEL_SLOTS, levels: int = WHEEL_LEVELS):
+        self.slots = slots
+        self.levels = levels
+        self.now = 0
+        self.wheels: List[List[Dict[str, tuple]]] = [[{} for _ in range(slots)] for _ in range(levels)]
+        # key -> (level, slot), so cancel does not search
+        self.positions: Dict[str, tuple] = {}
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, key: str):
+        return key in self.positions
+
+    def schedule(self, key: str, ticks: int, value=None):
+        """Fire ``key`` after ``ticks`` ticks (replacing any timer with the same key)"""
+        self.cancel(key)
+        self._insert(key, self.now + max(int(ticks), 1), value)
+
+    def _insert(self, key: str, deadline: int, value):
+        # Lowest level where the deadline is less than a full turn ahead, so
+        # it never lands in the slot being cascaded
+        level = 0
+        while level < self.levels - 1 and deadline // self.slots ** level - self.now // self.slots ** level >= self.slots:
+            level += 1
+        slot = (deadline // self.slots ** level) % self.slots
+        self.wheels[level][slot][key] = (deadline, value)
+        self.positions[key] = (level, slot)
+
+    def cancel(self, key: str) -> bool:
+        position = self.positions.pop(key, None)
+        if position is None:
+            return False
+        level, slot = position
+        del self.wheels[level][slot][key]
+        return True
+
+    def tick(self) -> List[tuple]:
+        """Advance one tick; returns the (key, value) pairs that expired"""
+        self.now += 1
+        wrapped = 0
+        while wrapped < self.levels - 1 and self.now % self.slots ** (wrapped + 1) == 0:
+            wrapped += 1
+        # Higher levels first, so their timers can cascade on down
+        for level in range(wrapped, 0, -1):
+            self._cascade(level)
+        bucket = self.wheels[0][self.now % self.slots]
+        expired = []
+        for key, (deadline, value) in list(bucket.items()):
+            if deadline <= self.now:
+                del bucket[key]
+                del self.positions[key]
+                expired.append((key, value))
+        return expired
+
+    def _cascade(self, level: int):
+        slot = (self.now // self.slots ** level) % self.slots
+        bucket, self.wheels[level][slot] = self.wheels[level][slot], {}
+        for key, (deadline, value) in bucket.items():
+            self._insert(key, max(deadline, self.now), value)
+
+
+class EscalationScheduler:
+    """
+    Arms one wheel timer per active SOS alert
+
+    Args:
+        steps: Seconds from creation to each escalation level; the last
+            interval repeats
+        on_escalate: Called with (alert, level) when an alert escalates;
+            may be a coroutine function
+        tick: Wheel resolution in seconds
+    """
+
+    def __init__(self, steps: List[float], on_escalate: Callable, tick: float = WHEEL_TICK_SECONDS):
+        self.steps = sorted(steps) or [DEFAULT_ESCALATION_STEPS_MINUTES[0] * 60]
+        self.on_escalate = on_escalate
+        self.tick = tick
+        self.wheel = TimingWheel()
+        self.alerts: Dict[str, dict] = {}
+        self.by_user: Dict[str, Set[str]] = {}
+        self.escalated = 0
+        self.cancelled = 0
+        self._started = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+
+    def offset(self, level: int) -> float:
+        """Seconds after creation at which an alert reaches ``level``"""
+        if level <= len(self.steps):
+            return self.steps[level - 1]
+        interval = self.steps[-1] - (self.steps[-2] if len(self.steps) > 1 else 0)
+        return self.steps[-1] + interval * (level - len(self.steps))
+
+    def level_due(self, age: float) -> int:
+        """Highest level an alert of this age should have reached"""
+        level = 0
+        while self.offset(level + 1) <= age:
+            level += 1
+        return level
+
+    @staticmethod
+    def _created(alert: dict) -> float:
+        created_at = alert.get("created_at")
+        return parse_timestamp(created_at) if created_at else time.time()
+
+    def arm(self, alert: dict, level: Optional[int] = None):
+        """
+        Track an active alert and arm its next escalation
+
+        ``level`` is the level the alert already has (its stored
+        escalation_level). An alert overdue by several levels is escalated
+        once, straight to the level its age calls for, rather than once per
+        missed level.
+        """
+        alert_id = str(alert["id"])
+        level = (alert.get("escalation_level") or 0) if level is None else level
+        created = self._created(alert)
+        age = time.time() - created
+        due = self.level_due(age)
+        tracked = {
+            "id": alert_id,
+            "user_id": alert.get("user_id"),
+            "user_name": alert.get("user_name"),
+            "emergency_type": alert.get("emergency_type"),
+            "location_description": alert.get("location_description"),
+            "latitude": alert.get("latitude"),
+            "longitude": alert.get("longitude"),
+            "created_at": alert.get("created_at"),
+            "created": created,
+            "level": level,
+        }
+        self.alerts[alert_id] = tracked
+        if tracked["user_id"]:
+            self.by_user.setdefault(tracked["user_id"], set()).add(alert_id)
+        if due > level:
+            # Missed while the process was down: catch up on the next tick
+            self._schedule(alert_id, 0, due)
+        else:
+            self._schedule(alert_id, self.offset(level + 1) - age, level + 1)
+
+    def _schedule(self, alert_id: str, delay: float, level: int):
+        # Rounded up: a timer may fire up to one tick late, never early
+        self.wheel.schedule(alert_id, math.ceil(max(delay, 0) / self.tick), level)
+
+    def cancel(self, alert_id: str) -> bool:
+        alert = self.alerts.pop(str(alert_id), None)
+        if alert is None:
+            return False
+        user_alerts = self.by_user.get(alert["user_id"])
+        if user_alerts is not None:
+            user_alerts.discard(alert["id"])
+            if not user_alerts:
+                del self.by_user[alert["user_id"]]
+        self.wheel.cancel(alert["id"])
+        self.cancelled += 1
+        return True
+
+    def cancel_user(self, user_id: str) -> int:
+        """Cancel every escalation for a user's alerts (they marked themselves safe)"""
+        return sum(self.cancel(alert_id) for alert_id in list(self.by_user.get(user_id, ())))
+
+    async def advance(self, ticks: int = 1):
+        for _ in range(ticks):
+            for alert_id, level in self.wheel.tick():
+                alert = self.alerts.get(alert_id)
+                if alert is None:
+                    continue
+                alert["level"] = level
+                self.escalated += 1
+                self._schedule(alert_id, alert["created"] + self.offset(level + 1) - time.time(), level + 1)
+                try:
+                    result = self.on_escalate(dict(alert), level)
+                    if asyncio.iscoroutine(result):
+                        await result
+                except Exception as e:
+                    print(f"Error escalating SOS alert {alert_id}: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            # Catch up on ticks missed while the loop was busy
+            target = int((time.monotonic() - self._started) / self.tick)
+            if target > self.wheel.now:
+                await self.advance(target - self.wheel.now)
+
+    def start(self):
+        if self._task is None:
+            self._started = time.monotonic() - self.wheel.now * self.tick
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def warm(self, supabase, page_size: int = 1000):
+        """Re-arm timers for every active alert after a restart"""
+        start = 0
+        while True:
+            rows = (
+                supabase.table("sos_alerts")
+                .select("id, user_id, user_name, latitude, longitude, location_description, emergency_type, created_at, escalation_level")
+                .eq("status", "active").order("created_at").range(start, start + page_size - 1).execute().data
+            ) or []
+            for row in rows:
+                self.arm(row)
+            if len(rows) < page_size:
+                break
+            start += page_size
+        print(f"Armed escalation timers for {len(self.alerts)} active SOS alerts")
+
+    def stats(self) -> dict:
+        levels: Dict[int, int] = {}
+        for alert in self.alerts.values():
+            levels[alert["level"]] = levels.get(alert["level"], 0) + 1
+        return {
+            "armed": len(self.wheel),
+            "tracked_alerts": len(self.alerts),
+            "by_level": {priority_for(level) if level < len(ESCALATION_PRIORITIES) else f"level_{level}": count
+                         for level, count in sorted(levels.items())},
+            "escalated": self.escalated,
+            "cancelled": self.cancelled,
+            "steps_minutes": [round(step / 60, 2) for step in self.steps],
+        }
+
+
+def bench(timers: int, ticks: int) -> dict:
+    """Arm ``timers`` random timers over ``ticks`` ticks and time the wheel"""
+    wheel = TimingWheel()
+    started = time.perf_counter()
+    for i in range(timers):
+        wheel.schedule(str(i), random.randint(1, ticks))
+    scheduled = time.perf_counter() - started
+    for i in range(0, timers, 4):
+        wheel.cancel(str(i))
+    expired, worst = 0, 0.0
+    started = time.perf_counter()
+    for _ in range(ticks):
+        tick_started = time.perf_counter()
+        expired += len(wheel.tick())
+        worst = max(worst, time.perf_counter() - tick_started)
+    ticking = time.perf_counter() - started
+    return {
+        "timers": timers,
+        "ticks": ticks,
+        "expired": expired,
+        "schedule_us_per_timer": round(scheduled / timers * 1e6, 2),
+        "tick_us_mean": round(ticking / ticks * 1e6, 1),
+        "tick_us_max": round(worst * 1e6, 1),
+        "expire_us_per_timer": round(ticking / max(expired, 1) * 1e6, 2),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="SOS escalation timing wheel")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    bench_parser = subcommands.add_parser("bench", help="Time the wheel with many timers")
+    bench_parser.add_argument("--timers", type=int, default=100000)
+    bench_parser.add_argument("--ticks", type=int, default=3600)
+    args = parser.parse_args(argv)
+    print(bench(args.timers, args.ticks))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
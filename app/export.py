@@ -0,0 +1,241 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+
+from app.dedup import parse_timestamp
+from app.retention import source_table
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    # Parquet export is only offered when pyarrow is installed
+    pa = None
+    pq = None
+
+EXPORT_PAGE_SIZE = 1000
+
+# Exportable tables: column -> type, and which column the "type" filter applies to
+EXPORT_TABLES = {
+    "incidents": {
+        "type_column": "incident_type",
+        "columns": {
+            "id": "string", "user_id": "string", "incident_type": "string", "description": "string",
+            "location": "string", "latitude": "float", "longitude": "float", "photo_url": "string",
+            "photo_urls": "string_list", "status": "string", "canonical_incident_id": "string", "report_count": "int",
+            "place_name": "string", "district": "string", "state": "string",
+            "created_at": "timestamp", "updated_at": "timestamp",
+        },
+    },
+    "missing_persons": {
+        "type_column": None,
+        "columns": {
+            "id": "string", "user_id": "string", "name": "string", "age": "int",
+            "last_seen_location": "string", "description": "string", "reporter_contact": "string",
+            "photo_url": "string", "photo_urls": "string_list", "status": "string",
+            "created_at": "timestamp", "updated_at": "timestamp",
+        },
+    },
+    "sos_alerts": {
+        "type_column": "emergency_type",
+        "columns": {
+            "id": "string", "user_id": "string", "user_name": "string", "latitude": "float",
+            "longitude": "float", "location_description": "string", "emergency_type": "string",
+            "status": "string", "place_name": "string", "district": "string", "state": "string",
+            "created_at": "timestamp", "updated_at": "timestamp",
+        },
+    },
+}
+
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+class ExportError(Exception):
+    """Raised for an unknown table/format or an unavailable format"""
+
+
+def iter_pages(
+    supabase,
+    table: str,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    record_type: Optional[str] = None,
+    record_status: Optional[str] = None,
+    include_history: bool = False,
+    page_size: int = EXPORT_PAGE_SIZE,
+) -> Iterator[list]:
+    """
+    Page through a table in (created_at, id) order using keyset pagination
+
+    Each page continues strictly after the last row of the previous one, so
+    the cost per page stays constant however deep the export goes (unlike
+    OFFSET) and rows inserted during the export do not shift pages.
+    """
+    spec = EXPORT_TABLES[table]
+    columns = ", ".join(spec["columns"])
+    relation = source_table(table, include_history)
+    last_created_at, last_id = None, None
+
+    while True:
+        query = supabase.table(relation).select(columns)
+        if since:
+            query = query.gte("created_at", since)
+        if until:
+            query = query.lt("created_at", until)
+        if record_type and spec["type_column"]:
+            query = query.eq(spec["type_column"], record_type)
+        if record_status:
+            query = query.eq("status", record_status)
+        if last_created_at is not None:
+            query = query.or_(
+                f'created_at.gt."{last_created_at}",and(created_at.eq."{last_created_at}",id.gt.{last_id})'
+            )
+        result = query.order("created_at").order("id").limit(page_size).execute()
+
+        rows = result.data or []
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        last_created_at, last_id = rows[-1]["created_at"], rows[-1]["id"]
+
+
+def _ndjson(pages: Iterator[list], columns: dict) -> Iterator[bytes]:
+    for rows in pages:
+        yield "".join(
+            json.dumps({column: row.get(column) for column in columns}, ensure_ascii=False, default=str) + "\n"
+            for row in rows
+        ).encode("utf-8")
+
+
+def _csv_value(value, kind: str):
+    if value is None:
+        return ""
+    if kind == "string_list":
+        # One cell: a JSON array, so URLs with commas stay unambiguous
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def _csv(pages: Iterator[list], columns: dict) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(list(columns))
+    for rows in pages:
+        for row in rows:
+            writer.writerow([_csv_value(row.get(column), kind) for column, kind in columns.items()])
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands written bytes back to the generator"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _arrow_schema(columns: dict):
+    types = {
+        "string": pa.string(),
+        "float": pa.float64(),
+        "int": pa.int64(),
+        "timestamp": pa.timestamp("us", tz="UTC"),
+        "string_list": pa.list_(pa.string()),
+    }
+    return pa.schema([(column, types[kind]) for column, kind in columns.items()])
+
+
+def _arrow_value(value, kind: str):
+    if value is None:
+        return None
+    if kind == "timestamp":
+        return datetime.fromtimestamp(parse_timestamp(value), tz=timezone.utc)
+    if kind == "float":
+        return float(value)
+    if kind == "int":
+        return int(value)
+    if kind == "string_list":
+        return [str(item) for item in value]
+    return str(value)
+
+
+def _parquet(pages: Iterator[list], columns: dict) -> Iterator[bytes]:
+    schema = _arrow_schema(columns)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        for rows in pages:
+            # One row group per page keeps memory bounded by the page size
+            data = {column: [_arrow_value(row.get(column), kind) for row in rows] for column, kind in columns.items()}
+            writer.write_table(pa.Table.from_pydict(data, schema=schema))
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def stream_export(supabase, table: str, export_format: str = "ndjson", **filters) -> Iterator[bytes]:
+    """
+    Stream a table as NDJSON, CSV or Parquet
+
+    Args:
+        supabase: Supabase client
+        table: incidents, missing_persons or sos_alerts
+        export_format: ndjson, csv or parquet
+        **filters: since, until, record_type, record_status, include_history, page_size
+
+    Returns:
+        Iterator[bytes]: Encoded output, one chunk per page
+    """
+    if table not in EXPORT_TABLES:
+        raise ExportError(f"Unknown export table: {table}")
+    if export_format not in EXPORT_FORMATS:
+        raise ExportError(f"Unknown export format: {export_format}")
+    if export_format == "parquet" and pq is None:
+        raise ExportError("Parquet export requires pyarrow")
+    if filters.get("record_type") and not EXPORT_TABLES[table]["type_column"]:
+        raise ExportError(f"{table} cannot be filtered by type")
+    # Checked here: a bad value would otherwise fail mid-stream, after the 200
+    for name in ("since", "until"):
+        if filters.get(name):
+            try:
+                parse_timestamp(filters[name])
+            except ValueError:
+                raise ExportError(f"{name} must be an ISO 8601 timestamp")
+
+    columns = EXPORT_TABLES[table]["columns"]
+    pages = iter_pages(supabase, table, **filters)
+    if export_format == "ndjson":
+        return _ndjson(pages, columns)
+    if export_format == "csv":
+        return _csv(pages, columns)
+    return _parquet(pages, columns)
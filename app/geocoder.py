@@ -0,0 +1,343 @@
+"""
+Offline reverse geocoding for Indian coordinates.
+
+``app/data/gazetteer_in.csv`` lists places (name, kind, district, state,
+latitude, longitude). The bundled file holds the Indian towns from GeoNames
+(https://www.geonames.org, CC BY 4.0); a fuller gazetteer including villages
+can be generated from the GeoNames India dump and pointed to with
+GAZETTEER_PATH:
+
+    python -m app.geocoder build IN.txt admin1CodesASCII.txt admin2Codes.txt -o gazetteer_in_full.csv
+
+Places are indexed in a 3-d k-d tree over unit-sphere coordinates, where
+straight-line distance orders points exactly like great-circle distance, so
+no special handling is needed near the poles or the antimeridian.
+"""
+import argparse
+import csv
+import math
+import os
+import re
+import sys
+from typing import Dict, List, Optional
+
+DEFAULT_GAZETTEER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "gazetteer_in.csv")
+
+# Beyond this the nearest place says little about where someone is
+MAX_PLACE_DISTANCE_KM = 75.0
+
+EARTH_RADIUS_KM = 6371.0
+
+# location_description the frontend sends when it only has coordinates
+_COORDINATE_DESCRIPTION = re.compile(r"^\s*(emergency at\s*)?lat\s*:?\s*-?\d", re.IGNORECASE)
+_DISTRICT_SUFFIX = re.compile(r"\s+(district|division)$")
+_LOCATION_SEPARATORS = re.compile(r"[,/;|]")
+
+
+def _unit_vector(latitude: float, longitude: float) -> tuple:
+    lat, lon = math.radians(latitude), math.radians(longitude)
+    cos_lat = math.cos(lat)
+    return (cos_lat * math.cos(lon), cos_lat * math.sin(lon), math.sin(lat))
+
+
+def _chord_to_km(chord_squared: float) -> float:
+    return 2 * EARTH_RADIUS_KM * math.asin(min(math.sqrt(chord_squared) / 2, 1.0))
+
+
+class KDTree:
+    """Static k-d tree over 3-d points with nearest-neighbour search"""
+
+    def __init__(self, points: List[tuple]):
+        self.points = points
+        self.node_point: List[int] = []
+        self.node_axis: List[int] = []
+        self.node_left: List[int] = []
+        self.node_right: List[int] = []
+        self.root = self._build(list(range(len(points))), 0)
+
+    def _build(self, indices: List[int], depth: int) -> int:
+        if not indices:
+            return -1
+        axis = depth % 3
+        indices.sort(key=lambda i: self.points[i][axis])
+        middle = len(indices) // 2
+        node = len(self.node_point)
+        self.node_point.append(indices[middle])
+        self.node_axis.append(axis)
+        self.node_left.append(-1)
+        self.node_right.append(-1)
+        self.node_left[node] = self._build(indices[:middle], depth + 1)
+        self.node_right[node] = self._build(indices[middle + 1:], depth + 1)
+        return node
+
+    def nearest(self, query: tuple) -> tuple:
+        """
+        Closest point to ``query``
+
+        Returns:
+            tuple: (point index, squared distance), or (-1, inf) when empty
+        """
+        points, node_point, node_axis = self.points, self.node_point, self.node_axis
+        best, best_distance = -1, float("inf")
+        stack = [(self.root, 0.0)]
+        while stack:
+            node, bound = stack.pop()
+            if node == -1 or bound >= best_distance:
+                continue
+            point = points[node_point[node]]
+            dx, dy, dz = query[0] - point[0], query[1] - point[1], query[2] - point[2]
+            distance = dx * dx + dy * dy + dz * dz
+            if distance < best_distance:
+                best, best_distance = node_point[node], distance
+            diff = query[node_axis[node]] - point[node_axis[node]]
+            if diff < 0:
+                near, far = self.node_left[node], self.node_right[node]
+            else:
+                near, far = self.node_right[node], self.node_left[node]
+            # The far side can only hold something closer than the split plane
+            stack.append((far, diff * diff))
+            stack.append((near, 0.0))
+        return best, best_distance
+
+
+class ReverseGeocoder:
+    """Nearest named place, district and state for a coordinate"""
+
+    def __init__(self, places: List[dict]):
+        self.places = places
+        self.tree = KDTree([_unit_vector(place["latitude"], place["longitude"]) for place in places])
+        # lower-case district -> (district, state), for validating filters
+        self.district_names: Dict[str, tuple] = {}
+        # ...and the same keyed without a " District"/" Division" suffix
+        self._district_aliases: Dict[str, str] = {}
+        # lower-case place name -> place index (towns win over villages of the same name)
+        self.place_names: Dict[str, int] = {}
+        for index, place in enumerate(places):
+            key = place["name"].lower()
+            if key not in self.place_names or (place["kind"] == "town" and places[self.place_names[key]]["kind"] != "town"):
+                self.place_names[key] = index
+            if place["district"]:
+                key = place["district"].lower()
+                self.district_names.setdefault(key, (place["district"], place["state"]))
+                self._district_aliases.setdefault(_DISTRICT_SUFFIX.sub("", key), key)
+
+    def __len__(self):
+        return len(self.places)
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> "ReverseGeocoder":
+        path = path or os.getenv("GAZETTEER_PATH") or DEFAULT_GAZETTEER
+        places = []
+        with open(path, "r", encoding="utf-8", newline="") as file:
+            for row in csv.DictReader(file):
+                places.append({
+                    "name": row["name"],
+                    "kind": row.get("kind") or "town",
+                    "district": row.get("district") or None,
+                    "state": row.get("state") or None,
+                    "latitude": float(row["latitude"]),
+                    "longitude": float(row["longitude"]),
+                })
+        return cls(places)
+
+    def nearest(self, latitude: float, longitude: float, max_distance_km: float = MAX_PLACE_DISTANCE_KM) -> Optional[dict]:
+        """
+        Closest gazetteer place within ``max_distance_km``
+
+        The district and state are those of the nearest place, which matches
+        the administrative boundary everywhere except close to a border.
+        """
+        index, chord_squared = self.tree.nearest(_unit_vector(latitude, longitude))
+        if index == -1:
+            return None
+        distance_km = _chord_to_km(chord_squared)
+        if distance_km > max_distance_km:
+            return None
+        place = self.places[index]
+        return {
+            "place_name": place["name"],
+            "place_kind": place["kind"],
+            "district": place["district"],
+            "state": place["state"],
+            "distance_km": round(distance_km, 2),
+        }
+
+    def enrich(self, row: dict, description_field: Optional[str] = None) -> dict:
+        """
+        Add place_name, district and state to a row with latitude/longitude
+
+        If ``description_field`` holds only raw coordinates (or nothing), it
+        is replaced with a readable "Near <place>, <district>, <state>".
+        """
+        if row.get("latitude") is None or row.get("longitude") is None:
+            return row
+        place = self.nearest(float(row["latitude"]), float(row["longitude"]))
+        if place is None:
+            return row
+        row["place_name"] = place["place_name"]
+        row["district"] = place["district"]
+        row["state"] = place["state"]
+        if description_field:
+            description = row.get(description_field) or ""
+            if not description.strip() or _COORDINATE_DESCRIPTION.match(description):
+                row[description_field] = describe(place)
+        return row
+
+    def canonical_district(self, name: Optional[str]) -> Optional[str]:
+        """Gazetteer spelling of a district name (case-insensitive), or None if unknown"""
+        if not name:
+            return None
+        key = name.strip().lower()
+        match = self.district_names.get(key) or self.district_names.get(self._district_aliases.get(_DISTRICT_SUFFIX.sub("", key), ""))
+        return match[0] if match else None
+
+    def locate(self, text: Optional[str]) -> Optional[dict]:
+        """
+        District and state named by free-text location ("MG Road, Pune", a user's city)
+
+        Comma-separated parts are tried from the most general (last) one,
+        each as a district name and then as a place name.
+        """
+        for part in reversed(_LOCATION_SEPARATORS.split(text or "")):
+            part = part.strip()
+            if not part:
+                continue
+            district = self.canonical_district(part)
+            if district:
+                return {"district": district, "state": self.district_names[district.lower()][1]}
+            index = self.place_names.get(part.lower())
+            if index is not None and self.places[index]["district"]:
+                return {"district": self.places[index]["district"], "state": self.places[index]["state"]}
+        return None
+
+    def districts(self, state: Optional[str] = None) -> List[dict]:
+        """Known districts, optionally for one state"""
+        return sorted(
+            ({"district": district, "state": district_state} for district, district_state in self.district_names.values()
+             if not state or (district_state or "").lower() == state.strip().lower()),
+            key=lambda entry: (entry["state"] or "", entry["district"]),
+        )
+
+
+def describe(place: dict) -> str:
+    parts = [place["place_name"]]
+    for part in (place.get("district"), place.get("state")):
+        if part and part not in parts:
+            parts.append(part)
+    distance = place.get("distance_km") or 0
+    prefix = "Near " if distance >= 1 else ""
+    return prefix + ", ".join(parts)
+
+
+def _admin2_district(name: str) -> str:
+    """
+    District for a GeoNames admin2 name
+
+    GeoNames still names several Maharashtra districts after the revenue
+    division they head ("Pune Division" for Pune district); the places
+    under them all lie in that one district.
+    """
+    return re.sub(r"\s+Division$", "", name)
+
+
+def fill_missing_districts(places: List[dict], max_distance_km: float = MAX_PLACE_DISTANCE_KM) -> int:
+    """
+    Give places without an admin2 code the district and state of the nearest place that has one
+
+    GeoNames leaves admin2 empty for some towns (and often has a stale
+    admin1 for them too), so both are taken from the neighbour.
+
+    Returns:
+        int: Places filled in
+    """
+    known = [place for place in places if place["district"]]
+    tree = KDTree([_unit_vector(place["latitude"], place["longitude"]) for place in known])
+    filled = 0
+    for place in places:
+        if place["district"]:
+            continue
+        index, chord_squared = tree.nearest(_unit_vector(place["latitude"], place["longitude"]))
+        if index == -1 or _chord_to_km(chord_squared) > max_distance_km:
+            continue
+        place["district"], place["state"] = known[index]["district"], known[index]["state"]
+        filled += 1
+    return filled
+
+
+def build_from_geonames(dump_path: str, admin1_path: str, admin2_path: str, output_path: str, min_population: int = 0) -> int:
+    """
+    Convert GeoNames dumps (IN.txt plus admin code files) into gazetteer CSV
+
+    Keeps populated places (feature class P). Administrative seats and places
+    of 10,000+ people are recorded as towns, everything else as villages.
+    Admin2 names are mapped to districts (see ``_admin2_district``) and places
+    without one are assigned to the district of their nearest neighbour.
+
+    Returns:
+        int: Places written
+    """
+    def admin_names(path):
+        names = {}
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) >= 2:
+                    names[fields[0]] = fields[1]
+        return names
+
+    states, districts = admin_names(admin1_path), admin_names(admin2_path)
+    places = []
+    with open(dump_path, "r", encoding="utf-8") as source:
+        for line in source:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 15 or fields[6] != "P":
+                continue
+            population = int(fields[14] or 0)
+            if population < min_population:
+                continue
+            country, admin1, admin2 = fields[8], fields[10], fields[11]
+            places.append({
+                "name": fields[1],
+                "kind": "town" if fields[7].startswith(("PPLC", "PPLA")) or population >= 10000 else "village",
+                "district": _admin2_district(districts.get(f"{country}.{admin1}.{admin2}", "")) or None,
+                "state": states.get(f"{country}.{admin1}", "") or None,
+                "latitude": round(float(fields[4]), 5),
+                "longitude": round(float(fields[5]), 5),
+            })
+    fill_missing_districts(places)
+    write_gazetteer(places, output_path)
+    return len(places)
+
+
+def write_gazetteer(places: List[dict], output_path: str):
+    with open(output_path, "w", encoding="utf-8", newline="") as target:
+        writer = csv.writer(target, lineterminator="\n")
+        writer.writerow(["name", "kind", "district", "state", "latitude", "longitude"])
+        for place in places:
+            writer.writerow([place["name"], place["kind"], place["district"] or "", place["state"] or "", place["latitude"], place["longitude"]])
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline reverse geocoder tools")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    build = subcommands.add_parser("build", help="Build a gazetteer CSV from GeoNames dumps")
+    build.add_argument("dump")
+    build.add_argument("admin1")
+    build.add_argument("admin2")
+    build.add_argument("-o", "--output", default=DEFAULT_GAZETTEER)
+    build.add_argument("--min-population", type=int, default=0)
+    lookup = subcommands.add_parser("lookup", help="Reverse geocode one coordinate")
+    lookup.add_argument("latitude", type=float)
+    lookup.add_argument("longitude", type=float)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        written = build_from_geonames(args.dump, args.admin1, args.admin2, args.output, args.min_population)
+        print(f"Wrote {written} places to {args.output}")
+    else:
+        print(ReverseGeocoder.load().nearest(args.latitude, args.longitude))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,307 @@
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from collections import defaultdict, deque
+from typing import Callable, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+JOB_WORKERS = 4
+JOB_MAX_ATTEMPTS = 5
+
+# max_attempts for jobs that must eventually succeed (e.g. after an outage)
+RETRY_FOREVER = 0
+
+# Exponential backoff between attempts: base * 2^(attempt-1), capped, with jitter
+JOB_RETRY_DELAY = 1.0
+JOB_MAX_RETRY_DELAY = 60.0
+
+
+class Job:
+    __slots__ = ("id", "name", "payload", "attempts", "enqueued_at", "durable")
+
+    def __init__(self, name: str, payload: dict, durable: bool = False, job_id: Optional[str] = None,
+                 attempts: int = 0, enqueued_at: Optional[float] = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.name = name
+        self.payload = payload
+        self.attempts = attempts
+        self.enqueued_at = enqueued_at or time.time()
+        self.durable = durable
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "payload": self.payload,
+            "attempts": self.attempts,
+            "enqueued_at": self.enqueued_at,
+        }
+
+
+class JobQueue:
+    """
+    In-process queue for work a request does not need to wait for.
+
+    Handlers are registered by name and run on a small pool of asyncio
+    workers; plain functions run in the threadpool so blocking Supabase calls
+    stay off the event loop. A failing job is retried with exponential
+    backoff and, after its last attempt, handed to the optional
+    ``on_failure`` callback; handlers registered with
+    ``max_attempts=RETRY_FOREVER`` are retried until they succeed.
+
+    Jobs queued with ``enqueue_durable`` (JSON payloads only) are also
+    written to ``spool_dir`` until they finish, so work accepted before a
+    crash or restart is picked up again on the next ``start``; the spool is
+    written and fsynced in the threadpool. A queue without a spool directory
+    refuses durable jobs rather than quietly keeping them in memory.
+    """
+
+    def __init__(
+        self,
+        workers: int = JOB_WORKERS,
+        spool_dir: Optional[str] = None,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        retry_delay: float = JOB_RETRY_DELAY,
+        max_retry_delay: float = JOB_MAX_RETRY_DELAY,
+    ):
+        self.workers = workers
+        self.spool_dir = spool_dir
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.handlers: Dict[str, tuple] = {}
+        self.queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._pending: List[Job] = []
+        self._retries: Dict[str, asyncio.TimerHandle] = {}
+        self._in_flight = 0
+        self._lags = deque(maxlen=1000)
+        self.counters = defaultdict(int)
+        if spool_dir:
+            os.makedirs(os.path.join(spool_dir, "failed"), exist_ok=True)
+
+    def register(self, name: str, handler: Callable, on_failure: Optional[Callable] = None,
+                 max_attempts: Optional[int] = None):
+        """
+        Register a handler for jobs named ``name``
+
+        Args:
+            handler: Called with the job payload; async or plain function
+            on_failure: Called with (payload, error) once every attempt has failed
+            max_attempts: Attempts before giving up (default the queue's;
+                RETRY_FOREVER never gives up)
+        """
+        self.handlers[name] = (handler, on_failure, self.max_attempts if max_attempts is None else max_attempts)
+
+    def job(self, name: str, on_failure: Optional[Callable] = None, max_attempts: Optional[int] = None):
+        """Decorator form of ``register``"""
+        def decorator(handler):
+            self.register(name, handler, on_failure, max_attempts)
+            return handler
+        return decorator
+
+    def enqueue(self, name: str, payload: Optional[dict] = None) -> str:
+        """
+        Queue a job and return its id without waiting for it to run
+
+        The job lives in memory only. Jobs enqueued before ``start`` are held
+        and queued when it runs.
+        """
+        job = self._new_job(name, payload, durable=False)
+        self._put(job)
+        return job.id
+
+    async def enqueue_durable(self, name: str, payload: Optional[dict] = None) -> str:
+        """
+        Spool a job to disk, then queue it; returns its id once it is on disk
+
+        Raises:
+            ValueError: if the queue has no spool directory
+        """
+        if not self.spool_dir:
+            raise ValueError(f"Durable job {name} needs a job spool directory")
+        job = self._new_job(name, payload, durable=True)
+        await run_in_threadpool(self._spool, job)
+        self._put(job)
+        return job.id
+
+    def _new_job(self, name: str, payload: Optional[dict], durable: bool) -> Job:
+        if name not in self.handlers:
+            raise ValueError(f"No job handler registered for {name}")
+        return Job(name, payload or {}, durable=durable)
+
+    def _put(self, job: Job):
+        self.counters["enqueued"] += 1
+        if self.queue is None:
+            self._pending.append(job)
+        else:
+            self.queue.put_nowait(job)
+
+    def start(self):
+        if self._tasks:
+            return
+        self.queue = asyncio.Queue()
+        held = {job.id for job in self._pending}
+        recovered = [job for job in self._recover() if job.id not in held]
+        if recovered:
+            print(f"Recovered {len(recovered)} spooled background jobs")
+        for job in recovered + self._pending:
+            self.queue.put_nowait(job)
+        self._pending = []
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 10.0):
+        """
+        Drain queued jobs (up to timeout), then stop the workers
+
+        Jobs waiting for a retry are not waited for; durable ones stay spooled.
+        """
+        if not self._tasks:
+            return
+        for handle in self._retries.values():
+            handle.cancel()
+        if self._retries:
+            print(f"Job queue stopping with {len(self._retries)} jobs awaiting retry")
+        self._retries = {}
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Job queue not drained, {self.queue.qsize()} jobs left")
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self.queue = None
+
+    async def _run(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self._execute(job)
+            finally:
+                self.queue.task_done()
+
+    async def _execute(self, job: Job):
+        handler, on_failure, max_attempts = self.handlers[job.name]
+        self._lags.append(time.time() - job.enqueued_at)
+        self._in_flight += 1
+        job.attempts += 1
+        try:
+            if asyncio.iscoroutinefunction(handler):
+                await handler(job.payload)
+            else:
+                await run_in_threadpool(handler, job.payload)
+        except Exception as e:
+            if max_attempts == RETRY_FOREVER or job.attempts < max_attempts:
+                await self._schedule_retry(job)
+                return
+            print(f"Job {job.name} failed after {job.attempts} attempts: {e}")
+            self.counters["failed"] += 1
+            self.counters[f"failed.{job.name}"] += 1
+            await self._unspool(job, failed=True)
+            if on_failure:
+                try:
+                    if asyncio.iscoroutinefunction(on_failure):
+                        await on_failure(job.payload, e)
+                    else:
+                        await run_in_threadpool(on_failure, job.payload, e)
+                except Exception as callback_error:
+                    print(f"Error in failure handler for job {job.name}: {callback_error}")
+            return
+        finally:
+            self._in_flight -= 1
+        self.counters["completed"] += 1
+        self.counters[f"completed.{job.name}"] += 1
+        await self._unspool(job)
+
+    async def _schedule_retry(self, job: Job):
+        delay = min(self.retry_delay * 2 ** (job.attempts - 1), self.max_retry_delay) * (0.5 + random.random())
+        self.counters["retried"] += 1
+        if job.durable:
+            # Record the attempt count; the earlier spool file still covers the job if this fails
+            try:
+                await run_in_threadpool(self._spool, job)
+            except OSError as e:
+                print(f"Could not update spooled job {job.id}: {e}")
+
+        def requeue():
+            self._retries.pop(job.id, None)
+            if self.queue is not None:
+                # Lag is measured from when the job became runnable again
+                job.enqueued_at = time.time()
+                self.queue.put_nowait(job)
+
+        self._retries[job.id] = asyncio.get_event_loop().call_later(delay, requeue)
+
+    def _spool_path(self, job: Job, failed: bool = False) -> str:
+        name = f"{job.id}.json"
+        return os.path.join(self.spool_dir, "failed", name) if failed else os.path.join(self.spool_dir, name)
+
+    def _spool(self, job: Job):
+        path = self._spool_path(job)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(job.to_dict(), file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+
+    async def _unspool(self, job: Job, failed: bool = False):
+        if job.durable:
+            await run_in_threadpool(self._remove_spooled, job, failed)
+
+    def _remove_spooled(self, job: Job, failed: bool):
+        try:
+            if failed:
+                # Keep the last attempt for inspection
+                os.replace(self._spool_path(job), self._spool_path(job, failed=True))
+            else:
+                os.remove(self._spool_path(job))
+        except FileNotFoundError:
+            pass
+
+    def _recover(self) -> List[Job]:
+        """Durable jobs left in the spool by a previous run, oldest first"""
+        if not self.spool_dir:
+            return []
+        jobs = []
+        for filename in os.listdir(self.spool_dir):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.spool_dir, filename), "r", encoding="utf-8") as file:
+                    data = json.load(file)
+            except (OSError, ValueError) as e:
+                print(f"Skipping unreadable spooled job {filename}: {e}")
+                continue
+            if data.get("name") not in self.handlers:
+                print(f"Skipping spooled job with no handler: {data.get('name')}")
+                continue
+            jobs.append(Job(data["name"], data.get("payload") or {}, durable=True, job_id=data["id"],
+                            attempts=data.get("attempts", 0), enqueued_at=data.get("enqueued_at")))
+        jobs.sort(key=lambda job: job.enqueued_at)
+        return jobs
+
+    def stats(self) -> dict:
+        lags = sorted(self._lags)
+
+        def percentile(fraction):
+            return round(lags[min(int(len(lags) * fraction), len(lags) - 1)] * 1000, 1) if lags else 0.0
+
+        oldest = None
+        if self.queue is not None and self.queue.qsize():
+            # Peek at the head of the queue without consuming it
+            oldest = round((time.time() - self.queue._queue[0].enqueued_at) * 1000, 1)
+        return {
+            "depth": self.queue.qsize() if self.queue is not None else len(self._pending),
+            "in_flight": self._in_flight,
+            "awaiting_retry": len(self._retries),
+            "oldest_queued_ms": oldest,
+            "lag_p50_ms": percentile(0.5),
+            "lag_p95_ms": percentile(0.95),
+            "lag_max_ms": round(lags[-1] * 1000, 1) if lags else 0.0,
+            "counters": dict(self.counters),
+        }
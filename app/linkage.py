@@ -0,0 +1,542 @@
+"""
+Record linkage of missing-person reports against people known to be found.
+
+The "found" side holds registered users, their safe marks, and people
+named in community posts ("Found Ramesh Kumar, about 60, at the Jorhat
+relief camp"). Every record gets a few blocking keys, and a report is only
+scored against records sharing at least one key with it:
+
+* both the first and last name's phonetic codes;
+* one name's phonetic code and the district;
+* one name's phonetic code and a five-year age band (neighbouring bands
+  are probed too).
+
+Phonetic codes fold the usual transliteration variants of Indian names
+(Mohammed / Muhammad / Mohd, Lakshmi / Laxmi) onto one code. Candidates
+are scored with Jaro-Winkler name similarity plus age and district
+agreement, and pairs above ``min_score`` are stored in ``person_matches``
+for volunteers to review. Matching works both ways: a new report is
+checked against everyone found so far, and a new user, safe mark or post
+is checked against every open report.
+
+    python -m app.linkage bench --records 1000000
+"""
+import argparse
+import asyncio
+import random
+import re
+import sys
+import time
+from collections import Counter
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+MISSING = "missing"
+FOUND = "found"
+
+# Weighted score over the fields both records have; the name must also
+# clear NAME_FLOOR on its own
+NAME_WEIGHT = 0.6
+AGE_WEIGHT = 0.25
+AREA_WEIGHT = 0.15
+NAME_FLOOR = 0.82
+DEFAULT_MIN_SCORE = 0.8
+AGE_BAND_YEARS = 5
+
+# Blocks larger than this (a very common name in a big district) are too
+# unselective to be worth scoring and are skipped
+MAX_BLOCK_SIZE = 5000
+
+# Candidates are ranked by how many blocks they share with the record and
+# only this many are scored
+MAX_SCORED_CANDIDATES = 300
+
+HONORIFICS = {"mr", "mrs", "ms", "miss", "dr", "shri", "sri", "shree", "smt", "kumari", "km", "master", "baby", "late"}
+
+# Transliteration variants folded before coding, longest first
+_FOLDS = (
+    ("ksh", "x"), ("aa", "a"), ("ee", "i"), ("ii", "i"), ("oo", "u"), ("ou", "u"),
+    ("sh", "s"), ("ph", "f"), ("th", "t"), ("dh", "d"), ("bh", "b"), ("kh", "k"),
+    ("gh", "g"), ("ch", "c"), ("jh", "j"), ("ck", "k"), ("w", "v"), ("z", "j"), ("q", "k"), ("y", "i"),
+)
+_CONSONANT_GROUPS = {
+    **dict.fromkeys("bfpv", "1"), **dict.fromkeys("cgjkqsx", "2"), **dict.fromkeys("dt", "3"),
+    "l": "4", **dict.fromkeys("mn", "5"), "r": "6",
+}
+PHONETIC_LENGTH = 6
+
+# Community posts are only searched for names when they look like a
+# found/missing notice
+MENTION_HINTS = re.compile(r"\b(found|missing|rescued|safe|shelter|camp|lost|looking for|seen|reunite|identified)\b", re.I)
+_MENTION = re.compile(r"\b([A-Z][a-z]+(?:\s+[A-Z][a-z]+){1,2})\b")
+_MENTION_AGE = re.compile(r"\b(?:aged?\s*(?:about|around)?\s*(\d{1,3})|(\d{1,3})\s*(?:years?|yrs?|y/o|yo)\b)", re.I)
+MENTION_STOPWORDS = {
+    "found", "missing", "please", "near", "the", "at", "in", "relief", "camp", "shelter", "road", "station",
+    "hospital", "district", "police", "contact", "call", "help", "urgent", "rescued", "looking", "we", "he",
+    "she", "his", "her", "today", "yesterday", "government", "school", "temple", "market", "nagar", "colony",
+}
+MAX_MENTIONS_PER_POST = 3
+
+
+def name_tokens(name: Optional[str]) -> List[str]:
+    """Lower-case name parts without honorifics or punctuation"""
+    tokens = re.findall(r"[a-z]+", (name or "").lower())
+    return [token for token in tokens if token not in HONORIFICS and len(token) > 1]
+
+
+def fold_spelling(token: str) -> str:
+    """Token with transliteration variants folded and doubled letters collapsed (Laxmi for Lakshmi)"""
+    text = token.lower()
+    for variant, folded in _FOLDS:
+        text = text.replace(variant, folded)
+    return re.sub(r"(.)\1+", r"\1", text)
+
+
+def phonetic_code(token: str) -> str:
+    """
+    Consonant-skeleton code tolerant of Indian transliteration variants
+
+    Variant spellings are folded first (aa/a, sh/s, w/v, ...), then each
+    consonant maps to a sound group as in Soundex (the first letter too, so
+    Kumar and Cumar agree), vowels and h are dropped and repeats collapse:
+    Mohammed, Muhammad and Mohd all code to "53".
+    """
+    text = fold_spelling(token)
+    code = []
+    for letter in text:
+        group = _CONSONANT_GROUPS.get(letter)
+        if group is not None and (not code or code[-1] != group):
+            code.append(group)
+    if not code:
+        return text[:1]
+    return "".join(code[:PHONETIC_LENGTH])
+
+
+def jaro_winkler(a: str, b: str) -> float:
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    window = max(max(len(a), len(b)) // 2 - 1, 0)
+    a_matched = [False] * len(a)
+    b_matched = [False] * len(b)
+    matches = 0
+    for i, letter in enumerate(a):
+        for j in range(max(0, i - window), min(i + window + 1, len(b))):
+            if not b_matched[j] and b[j] == letter:
+                a_matched[i] = b_matched[j] = True
+                matches += 1
+                break
+    if not matches:
+        return 0.0
+    transpositions, j = 0, 0
+    for i, letter in enumerate(a):
+        if a_matched[i]:
+            while not b_matched[j]:
+                j += 1
+            transpositions += letter != b[j]
+            j += 1
+    jaro = (matches / len(a) + matches / len(b) + (matches - transpositions / 2) / matches) / 3
+    prefix = 0
+    for x, y in zip(a[:4], b[:4]):
+        if x != y:
+            break
+        prefix += 1
+    return jaro + prefix * 0.1 * (1 - jaro)
+
+
+def name_similarity(tokens: List[str], others: List[str]) -> float:
+    """Mean over ``tokens`` of the best Jaro-Winkler against any of ``others`` (word order does not matter)"""
+    return sum(max(jaro_winkler(token, other) for other in others) for token in tokens) / len(tokens)
+
+
+class Person:
+    __slots__ = ("key", "source", "ref", "name", "tokens", "codes", "age", "area", "detail", "folded")
+
+    def __init__(self, source: str, ref: str, name: str, age: Optional[int] = None, area: Optional[str] = None,
+                 detail: Optional[dict] = None):
+        self.key = f"{source}:{ref}"
+        self.source = source
+        self.ref = str(ref)
+        self.name = name
+        self.tokens = name_tokens(name)
+        self.codes = [phonetic_code(token) for token in self.tokens]
+        self.folded = [fold_spelling(token) for token in self.tokens]
+        self.age = age if age is None or 0 < age < 120 else None
+        self.area = area.strip().lower() if area else None
+        self.detail = detail or {}
+
+    def index_keys(self) -> List[str]:
+        """Blocking keys this record is stored under"""
+        keys = []
+        if len(self.codes) >= 2:
+            keys.append("n:" + "|".join(sorted((self.codes[0], self.codes[-1]))))
+        for code in dict.fromkeys(self.codes):
+            if self.area:
+                keys.append(f"a:{code}|{self.area}")
+            if self.age is not None:
+                keys.append(f"g:{code}|{self.age // AGE_BAND_YEARS}")
+        return keys
+
+    def probe_keys(self) -> List[str]:
+        """Blocking keys to look up: as stored, plus the neighbouring age bands"""
+        keys = self.index_keys()
+        if self.age is not None:
+            band = self.age // AGE_BAND_YEARS
+            for code in dict.fromkeys(self.codes):
+                keys.extend((f"g:{code}|{band - 1}", f"g:{code}|{band + 1}"))
+        return keys
+
+
+def score_pair(a: Person, b: Person) -> Tuple[float, dict]:
+    """Weighted agreement of two records (0-1) and what it was made of"""
+    if not a.tokens or not b.tokens:
+        return 0.0, {}
+    name = min(name_similarity(a.folded, b.folded), name_similarity(b.folded, a.folded))
+    if name < NAME_FLOOR:
+        return 0.0, {"name": round(name, 3)}
+    total, weight = NAME_WEIGHT * name, NAME_WEIGHT
+    reasons = {"name": round(name, 3)}
+    if a.age is not None and b.age is not None:
+        difference = abs(a.age - b.age)
+        total += AGE_WEIGHT * (1.0 if difference <= 2 else 0.6 if difference <= 5 else 0.2 if difference <= 10 else 0.0)
+        weight += AGE_WEIGHT
+        reasons["age_difference"] = difference
+    if a.area and b.area:
+        total += AREA_WEIGHT * (a.area == b.area)
+        weight += AREA_WEIGHT
+        reasons["same_area"] = a.area == b.area
+    return total / weight, reasons
+
+
+class _Side:
+    """Records of one side with their blocks (sets of record keys)"""
+
+    def __init__(self):
+        self.people: Dict[str, Person] = {}
+        self.blocks: Dict[str, Set[str]] = {}
+
+    def add(self, person: Person):
+        self.people[person.key] = person
+        for key in person.index_keys():
+            self.blocks.setdefault(key, set()).add(person.key)
+
+    def remove(self, key: str) -> Optional[Person]:
+        person = self.people.pop(key, None)
+        if person is not None:
+            for block_key in person.index_keys():
+                block = self.blocks.get(block_key)
+                if block is not None:
+                    block.discard(key)
+                    if not block:
+                        del self.blocks[block_key]
+        return person
+
+
+class LinkageIndex:
+    """Blocked missing and found records; every add is matched against the other side"""
+
+    def __init__(self, min_score: float = DEFAULT_MIN_SCORE):
+        self.min_score = min_score
+        self.sides = {MISSING: _Side(), FOUND: _Side()}
+        self.compared = 0
+        self.skipped_blocks = 0
+
+    def add(self, side: str, person: Person) -> List[dict]:
+        """Index a record and return its matches on the other side, best first"""
+        self.sides[side].remove(person.key)
+        self.sides[side].add(person)
+        return self.match(side, person)
+
+    def remove(self, side: str, key: str) -> bool:
+        return self.sides[side].remove(key) is not None
+
+    def match(self, side: str, person: Person, limit: int = 20) -> List[dict]:
+        other = self.sides[FOUND if side == MISSING else MISSING]
+        blocks = []
+        for key in person.probe_keys():
+            block = other.blocks.get(key)
+            if not block:
+                continue
+            if len(block) > MAX_BLOCK_SIZE:
+                self.skipped_blocks += 1
+                continue
+            blocks.append(block)
+        # Records sharing more blocks (name, district and age) come first
+        hits = Counter(chain.from_iterable(blocks))
+        hits.pop(person.key, None)
+        candidates = [key for key, _ in hits.most_common(MAX_SCORED_CANDIDATES)]
+        matches = []
+        for key in candidates:
+            candidate = other.people[key]
+            score, reasons = score_pair(person, candidate)
+            if score >= self.min_score:
+                missing, found = (person, candidate) if side == MISSING else (candidate, person)
+                matches.append({
+                    "missing_person_id": missing.ref,
+                    "missing_name": missing.name,
+                    "matched_source_type": found.source,
+                    "matched_id": found.ref,
+                    "matched_name": found.name,
+                    "score": round(score, 3),
+                    "reasons": {**reasons, **found.detail},
+                })
+        self.compared += len(candidates)
+        matches.sort(key=lambda match: -match["score"])
+        return matches[:limit]
+
+    def candidates_for(self, side: str, key: str) -> Optional[List[dict]]:
+        person = self.sides[side].people.get(key)
+        return None if person is None else self.match(side, person)
+
+    def stats(self) -> dict:
+        sources: Dict[str, int] = {}
+        for side in self.sides.values():
+            for person in side.people.values():
+                sources[person.source] = sources.get(person.source, 0) + 1
+        return {
+            "records": sources,
+            "blocks": {name: len(side.blocks) for name, side in self.sides.items()},
+            "compared": self.compared,
+            "skipped_blocks": self.skipped_blocks,
+        }
+
+
+def missing_person_record(row: dict, area: Optional[str]) -> Person:
+    return Person("missing_person", row["id"], row.get("name") or "", row.get("age"), area,
+                  {"last_seen_location": row.get("last_seen_location")})
+
+
+def user_record(row: dict, area: Optional[str]) -> Person:
+    name = " ".join(part for part in (row.get("first_name"), row.get("middle_name"), row.get("last_name")) if part)
+    return Person("user", row["id"], name, None, area, {"city": row.get("city")})
+
+
+def safe_mark_record(row: dict, area: Optional[str]) -> Person:
+    # One record per user: their latest mark replaces the previous one
+    return Person("safe_status", row["user_id"], row.get("user_name") or "", None, area,
+                  {"marked_safe_at": row.get("created_at")})
+
+
+def post_mention_records(row: dict) -> List[Person]:
+    """People named in a community post that reads like a found/missing notice"""
+    message = row.get("message") or ""
+    if not MENTION_HINTS.search(message):
+        return []
+    age_match = _MENTION_AGE.search(message)
+    age = int(age_match.group(1) or age_match.group(2)) if age_match else None
+    people = []
+    for mention in _MENTION.findall(message):
+        words = [word for word in mention.split() if word.lower() not in MENTION_STOPWORDS]
+        if len(words) < 2:
+            continue
+        people.append(Person("community_post", f"{row['id']}#{len(people)}", " ".join(words), age, row.get("district"),
+                             {"post_id": row["id"], "excerpt": message[:200]}))
+        if len(people) >= MAX_MENTIONS_PER_POST:
+            break
+    return people
+
+
+class PersonLinker:
+    """
+    Links missing-person reports to found people in the background
+
+    New records are queued with ``submit`` so matching never delays the
+    request; matches above ``min_score`` are upserted into
+    ``person_matches`` (one row per pair) for review.
+    """
+
+    def __init__(self, supabase, geocoder, min_score: float = DEFAULT_MIN_SCORE):
+        self.supabase = supabase
+        self.geocoder = geocoder
+        self.index = LinkageIndex(min_score)
+        self.flagged = 0
+        self.queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def area_of(self, text: Optional[str]) -> Optional[str]:
+        place = self.geocoder.locate(text)
+        return place["district"] if place else None
+
+    def area_at(self, latitude, longitude) -> Optional[str]:
+        if latitude is None or longitude is None:
+            return None
+        place = self.geocoder.nearest(float(latitude), float(longitude))
+        return place["district"] if place else None
+
+    def _pages(self, table: str, columns: str, page_size: int, **filters) -> Iterable[dict]:
+        offset = 0
+        while True:
+            query = self.supabase.table(table).select(columns)
+            for column, value in filters.items():
+                query = query.eq(column, value)
+            rows = query.order("created_at").range(offset, offset + page_size - 1).execute().data or []
+            yield from rows
+            if len(rows) < page_size:
+                return
+            offset += page_size
+
+    def warm(self, page_size: int = 1000):
+        """Index open reports, users, safe marks and community posts (without matching)"""
+        for row in self._pages("missing_persons", "id, name, age, last_seen_location", page_size, status="missing"):
+            self.index.sides[MISSING].add(missing_person_record(row, self.area_of(row.get("last_seen_location"))))
+        found = self.index.sides[FOUND]
+        for row in self._pages("users", "id, first_name, middle_name, last_name, city", page_size):
+            found.add(user_record(row, self.area_of(row.get("city"))))
+        for row in self._pages("safe_status", "user_id, user_name, latitude, longitude, created_at", page_size):
+            found.remove(f"safe_status:{row['user_id']}")
+            found.add(safe_mark_record(row, self.area_at(row.get("latitude"), row.get("longitude"))))
+        for row in self._pages("community_posts", "id, message, district", page_size):
+            for person in post_mention_records(row):
+                found.add(person)
+        print(f"Linkage index loaded: {len(self.index.sides[MISSING].people)} open reports, {len(found.people)} found records")
+
+    def remove_post(self, post_id: str) -> int:
+        """Forget the people named in a deleted community post"""
+        return sum(self.index.remove(FOUND, f"community_post:{post_id}#{n}") for n in range(MAX_MENTIONS_PER_POST))
+
+    def start(self):
+        if self._worker is None:
+            self.queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    def submit(self, side: str, people: List[Person]):
+        """Queue records for indexing and matching (no-op until started)"""
+        if self.queue is not None and people:
+            self.queue.put_nowait((side, people))
+
+    async def _run(self):
+        while True:
+            side, people = await self.queue.get()
+            try:
+                matches = [match for person in people for match in await run_in_threadpool(self.index.add, side, person)]
+                await self.record(matches)
+            except Exception as e:
+                print(f"Error linking {[person.key for person in people]}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def record(self, matches: List[dict]):
+        if not matches:
+            return
+        rows = [{**match, "status": "pending"} for match in matches]
+        for start in range(0, len(rows), 500):
+            batch = rows[start:start + 500]
+            await run_in_threadpool(lambda: self.supabase.table("person_matches").upsert(
+                batch, on_conflict="missing_person_id,matched_source_type,matched_id", ignore_duplicates=True
+            ).execute())
+        self.flagged += len(rows)
+        print(f"Flagged {len(rows)} candidate person matches")
+
+    def link_all(self) -> List[dict]:
+        """Match every open report against the found side (blocking)"""
+        return [
+            match
+            for person in list(self.index.sides[MISSING].people.values())
+            for match in self.index.match(MISSING, person)
+        ]
+
+    async def run_batch(self) -> int:
+        matches = await run_in_threadpool(self.link_all)
+        await self.record(matches)
+        return len(matches)
+
+    def stats(self) -> dict:
+        return {
+            **self.index.stats(),
+            "min_score": self.index.min_score,
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "flagged": self.flagged,
+        }
+
+
+_FIRST_NAMES = [
+    "Aarav", "Aditya", "Ajay", "Amit", "Anil", "Anita", "Anjali", "Arjun", "Asha", "Deepak", "Devi", "Dinesh", "Ganesh",
+    "Gita", "Gopal", "Harish", "Imran", "Jyoti", "Kavita", "Kiran", "Krishna", "Lakshmi", "Mahesh", "Manoj", "Meena",
+    "Mohammed", "Mukesh", "Nandini", "Neha", "Nikhil", "Pooja", "Prakash", "Priya", "Rahul", "Rajesh", "Ramesh", "Ravi",
+    "Rekha", "Rohit", "Sanjay", "Santosh", "Sarita", "Shanti", "Sita", "Sunil", "Sunita", "Suresh", "Usha", "Vijay", "Vikram",
+]
+_LAST_NAMES = [
+    "Sharma", "Verma", "Gupta", "Singh", "Kumar", "Yadav", "Patel", "Shah", "Reddy", "Rao", "Nair", "Iyer", "Das", "Bose",
+    "Ghosh", "Mukherjee", "Banerjee", "Chatterjee", "Khan", "Ansari", "Sheikh", "Mishra", "Pandey", "Tiwari", "Dubey",
+    "Joshi", "Kulkarni", "Deshmukh", "Patil", "Jadhav", "Pillai", "Menon", "Naidu", "Choudhary", "Thakur", "Rathore",
+    "Chauhan", "Saxena", "Srivastava", "Agarwal", "Bora", "Baruah", "Gogoi", "Saikia", "Kalita", "Hazarika", "Dutta", "Sen",
+]
+
+
+def _respell(name: str, rng: random.Random) -> str:
+    """A plausible alternate spelling (Mohammed -> Muhammad, Lakshmi -> Laxmi)"""
+    swaps = [("ee", "i"), ("i", "ee"), ("sh", "s"), ("aa", "a"), ("ksh", "x"), ("o", "u"), ("v", "w"), ("ph", "f")]
+    rng.shuffle(swaps)
+    for old, new in swaps:
+        if old in name.lower():
+            return name.lower().replace(old, new, 1).title()
+    return name
+
+
+def bench(records: int, queries: int = 200, seed: int = 7) -> dict:
+    """Match ``queries`` new reports against ``records`` found records"""
+    rng = random.Random(seed)
+    districts = [f"district {i}" for i in range(700)]
+    index = LinkageIndex()
+    found = index.sides[FOUND]
+    people = []
+    started = time.perf_counter()
+    for i in range(records):
+        name = f"{rng.choice(_FIRST_NAMES)} {rng.choice(_LAST_NAMES)}"
+        age = rng.randint(1, 90) if rng.random() < 0.5 else None
+        person = Person("user", str(i), name, age, rng.choice(districts))
+        found.add(person)
+        people.append(person)
+    build_seconds = time.perf_counter() - started
+
+    timings, hits = [], 0
+    for q in range(queries):
+        target = rng.choice(people)
+        name = " ".join(_respell(part, rng) for part in target.name.split())
+        age = target.age + rng.randint(-2, 2) if target.age is not None else rng.randint(1, 90)
+        report = Person("missing_person", f"q{q}", name, age, target.area.title())
+        started = time.perf_counter()
+        matches = index.add(MISSING, report)
+        timings.append((time.perf_counter() - started) * 1000)
+        hits += any(match["matched_id"] == target.ref for match in matches)
+    timings.sort()
+    # Reference: scoring one report against every record, no blocking
+    sample = people[:5000]
+    started = time.perf_counter()
+    for person in sample:
+        score_pair(report, person)
+    all_pairs_ms = (time.perf_counter() - started) / len(sample) * records * 1000
+    return {
+        "records": records,
+        "index_seconds": round(build_seconds, 1),
+        "queries": queries,
+        "query_ms_median": round(timings[len(timings) // 2], 2),
+        "query_ms_p99": round(timings[int(len(timings) * 0.99) - 1], 2),
+        "query_ms_max": round(timings[-1], 2),
+        "true_match_found": round(hits / queries, 3),
+        "candidates_per_query": round(index.compared / queries, 1),
+        "unblocked_ms_estimate": round(all_pairs_ms),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Missing-person record linkage")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    bench_parser = subcommands.add_parser("bench", help="Time matching new reports against a synthetic corpus")
+    bench_parser.add_argument("--records", type=int, default=1000000)
+    bench_parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args(argv)
+    print(bench(args.records, args.queries))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
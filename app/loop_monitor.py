@@ -0,0 +1,212 @@
+"""
+Event-loop lag monitor and blocking-call detector.
+
+A heartbeat coroutine sleeps for ``interval`` and measures how late it wakes
+up: that delay is the event-loop lag every request on this worker sees, and
+is kept in a histogram. A watchdog thread notices when the heartbeat is
+overdue by more than ``threshold`` and, while the loop is still stuck,
+captures the loop thread's stack, which is the blocking call itself, and
+the route of the request whose coroutine is on that stack. The stall is
+reported (with its full duration) once the loop runs again.
+
+Strict mode (``strict_ms``) is meant for tests and staging: a request that
+blocks the loop for longer than ``strict_ms`` fails with BlockingCallError
+once it finishes, and ``check`` raises for any stall seen so far.
+"""
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import defaultdict, deque
+from typing import Dict, List, Optional
+
+from app.resilience import LatencyHistogram
+
+DEFAULT_LAG_INTERVAL = 0.05
+DEFAULT_LAG_THRESHOLD = 0.1
+
+# Frames kept from the innermost end of a blocking stack
+STACK_LIMIT = 30
+
+
+class BlockingCallError(RuntimeError):
+    """A coroutine blocked the event loop for longer than strict mode allows"""
+
+
+def route_name(scope: dict) -> str:
+    """Endpoint function name once the router has matched, else method and path"""
+    endpoint = getattr(scope.get("endpoint"), "__name__", None)
+    return endpoint or f"{scope.get('method')} {scope.get('path')}"
+
+
+class _Stall:
+    __slots__ = ("started", "stack", "route", "request", "task", "duration")
+
+    def __init__(self, started: float, stack: List[str], scope: Optional[dict], task):
+        self.started = started
+        self.stack = stack
+        self.route = route_name(scope) if scope else None
+        self.request = f"{scope.get('method')} {scope.get('path')}" if scope else None
+        self.task = task
+        self.duration = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "route": self.route,
+            "request": self.request,
+            "duration_ms": round(self.duration * 1000, 1),
+            "at": self.started,
+            "stack": self.stack,
+        }
+
+
+class LoopMonitor:
+    """
+    Args:
+        interval: Seconds between heartbeats
+        threshold: Lag (seconds) reported as a blocking call
+        strict_ms: Fail requests that block the loop longer than this
+    """
+
+    def __init__(self, interval: float = DEFAULT_LAG_INTERVAL, threshold: float = DEFAULT_LAG_THRESHOLD,
+                 strict_ms: Optional[float] = None):
+        self.strict = strict_ms / 1000 if strict_ms else None
+        # Strict mode has to see stalls shorter than the reporting threshold
+        self.threshold = min(threshold, self.strict) if self.strict else threshold
+        self.interval = min(interval, self.threshold / 2)
+        self.lag = LatencyHistogram()
+        self.current_lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.stalls_by_route: Dict[str, int] = defaultdict(int)
+        self.recent: deque = deque(maxlen=20)
+        self.violations: List[dict] = []
+        # Requests in flight: task -> ASGI scope
+        self.requests: Dict[object, dict] = {}
+        self._beat = 0.0
+        self._loop_thread: Optional[int] = None
+        self._pending: Optional[_Stall] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(now - expected, 0.0)
+            self._beat = now
+            self.current_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self.lag.record(lag)
+            stall, self._pending = self._pending, None
+            if stall is not None and lag >= self.threshold:
+                stall.duration = lag
+                self._report(stall)
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval / 2):
+            overdue = time.monotonic() - self._beat - self.interval
+            if overdue < self.threshold or self._pending is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            scope, task = self._blocking_request(frame)
+            stack = [f"{entry.filename}:{entry.lineno} in {entry.name}" for entry in traceback.extract_stack(frame)[-STACK_LIMIT:]]
+            # Picked up by the heartbeat when the loop runs again
+            self._pending = _Stall(time.time() - overdue, stack, scope, task)
+
+    def _blocking_request(self, frame) -> tuple:
+        """Scope and task of the request whose coroutine is on the blocked stack"""
+        roots = {}
+        for task, scope in list(self.requests.items()):
+            coro_frame = getattr(task.get_coro(), "cr_frame", None)
+            if coro_frame is not None:
+                roots[id(coro_frame)] = (scope, task)
+        while frame is not None:
+            if id(frame) in roots:
+                return roots[id(frame)]
+            frame = frame.f_back
+        return None, None
+
+    def _report(self, stall: _Stall):
+        self.stalls += 1
+        self.stalls_by_route[stall.route or "(no request)"] += 1
+        self.recent.append(stall)
+        print(f"Event loop blocked for {stall.duration * 1000:.0f}ms in {stall.route or 'a background task'}: {stall.stack[-1] if stall.stack else '?'}")
+        if self.strict and stall.duration >= self.strict:
+            self.violations.append(stall.as_dict())
+
+    def check(self):
+        """Raise BlockingCallError if strict mode has seen any blocking call (for tests)"""
+        if self.violations:
+            worst = max(self.violations, key=lambda violation: violation["duration_ms"])
+            raise BlockingCallError(
+                f"{len(self.violations)} blocking calls over {self.strict * 1000:.0f}ms, "
+                f"worst {worst['duration_ms']}ms in {worst['route']} at {worst['stack'][-1] if worst['stack'] else '?'}"
+            )
+
+    def _failed(self, task) -> Optional[_Stall]:
+        if not self.strict:
+            return None
+        for stall in self.recent:
+            if stall.task is task and stall.duration >= self.strict:
+                return stall
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "interval_ms": round(self.interval * 1000, 1),
+            "threshold_ms": round(self.threshold * 1000, 1),
+            "strict_ms": round(self.strict * 1000, 1) if self.strict else None,
+            "current_lag_ms": round(self.current_lag * 1000, 1),
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "lag": self.lag.summary(),
+            "stalls": self.stalls,
+            "stalls_by_route": dict(self.stalls_by_route),
+            "recent_stalls": [stall.as_dict() for stall in reversed(self.recent)],
+        }
+
+
+class LoopMonitorMiddleware:
+    """Pure ASGI middleware recording which route each request task serves"""
+
+    def __init__(self, app, monitor: LoopMonitor):
+        self.app = app
+        self.monitor = monitor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        task = asyncio.current_task()
+        self.monitor.requests[task] = scope
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.monitor.requests.pop(task, None)
+        # The stall is reported on the heartbeat after the blocking call returns
+        if self.monitor.strict:
+            await asyncio.sleep(self.monitor.interval * 2)
+            stall = self.monitor._failed(task)
+            if stall is not None:
+                raise BlockingCallError(f"{stall.route} blocked the event loop for {stall.duration * 1000:.0f}ms at {stall.stack[-1]}")
@@ -0,0 +1,597 @@
+"""
+Geo-targeted notification fan-out.
+
+Volunteers subscribe with a home position and watch radius and/or a city.
+When an SOS alert or a major incident is created the API publishes a
+``Notification``; background workers resolve its recipients through a grid
+spatial index (plus a city map), drop recipients already told about the same
+event, and deliver in batches through a pluggable sink with retries.
+
+Benchmark the engine with synthetic subscribers:
+    python -m app.notifications bench --subscribers 1000000
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+from collections import OrderedDict, defaultdict, deque
+from typing import Dict, Iterable, List, Optional, Set
+
+import httpx
+from fastapi.concurrency import run_in_threadpool
+
+from app.dedup import haversine_km
+
+# Grid cell size for the spatial index (about 5.5 km of latitude)
+GRID_CELL_DEGREES = 0.05
+
+DEFAULT_WATCH_RADIUS_KM = 5.0
+MAX_WATCH_RADIUS_KM = 50.0
+
+NOTIFICATION_BATCH_SIZE = 500
+
+# A recipient is told about the same event at most once in this window
+RECIPIENT_DEDUP_SECONDS = 6 * 3600
+
+_KM_PER_DEGREE = 111.32
+
+
+def _city_key(city: Optional[str]) -> Optional[str]:
+    return city.strip().lower() if city and city.strip() else None
+
+
+class Subscriber:
+    __slots__ = ("user_id", "latitude", "longitude", "radius_km", "city")
+
+    def __init__(self, user_id: str, latitude: Optional[float] = None, longitude: Optional[float] = None,
+                 radius_km: float = DEFAULT_WATCH_RADIUS_KM, city: Optional[str] = None):
+        self.user_id = user_id
+        self.latitude = latitude
+        self.longitude = longitude
+        self.radius_km = min(max(float(radius_km or DEFAULT_WATCH_RADIUS_KM), 0.1), MAX_WATCH_RADIUS_KM)
+        self.city = city
+
+    @property
+    def located(self) -> bool:
+        return self.latitude is not None and self.longitude is not None
+
+
+class SubscriberIndex:
+    """
+    Subscribers bucketed into a lat/lon grid and by city.
+
+    A point lookup only visits the grid cells within the largest watch radius
+    of anyone subscribed, then checks each candidate's own radius, so the
+    cost depends on local density rather than on the total subscriber count.
+    """
+
+    def __init__(self, cell_degrees: float = GRID_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self.subscribers: Dict[str, Subscriber] = {}
+        self.cells: Dict[tuple, Dict[str, Subscriber]] = defaultdict(dict)
+        self.cities: Dict[str, Set[str]] = defaultdict(set)
+        self.max_radius_km = 0.0
+
+    def __len__(self):
+        return len(self.subscribers)
+
+    def _cell(self, latitude: float, longitude: float) -> tuple:
+        return (math.floor(latitude / self.cell_degrees), math.floor(longitude / self.cell_degrees))
+
+    def add(self, subscriber: Subscriber):
+        self.remove(subscriber.user_id)
+        self.subscribers[subscriber.user_id] = subscriber
+        if subscriber.located:
+            self.cells[self._cell(subscriber.latitude, subscriber.longitude)][subscriber.user_id] = subscriber
+            self.max_radius_km = max(self.max_radius_km, subscriber.radius_km)
+        key = _city_key(subscriber.city)
+        if key:
+            self.cities[key].add(subscriber.user_id)
+
+    def remove(self, user_id: str) -> bool:
+        subscriber = self.subscribers.pop(user_id, None)
+        if subscriber is None:
+            return False
+        if subscriber.located:
+            cell = self._cell(subscriber.latitude, subscriber.longitude)
+            self.cells[cell].pop(user_id, None)
+            if not self.cells[cell]:
+                del self.cells[cell]
+        key = _city_key(subscriber.city)
+        if key:
+            self.cities[key].discard(user_id)
+            if not self.cities[key]:
+                del self.cities[key]
+        return True
+
+    def within(self, latitude: float, longitude: float) -> List[str]:
+        """Subscribers whose watch area covers the point"""
+        if not self.cells:
+            return []
+        reach = self.max_radius_km
+        lat_span = reach / _KM_PER_DEGREE
+        lon_span = reach / (_KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+        lat_low, lon_low = self._cell(latitude - lat_span, longitude - lon_span)
+        lat_high, lon_high = self._cell(latitude + lat_span, longitude + lon_span)
+
+        matches = []
+        for i in range(lat_low, lat_high + 1):
+            for j in range(lon_low, lon_high + 1):
+                cell = self.cells.get((i, j))
+                if not cell:
+                    continue
+                # Copied in one step: lookups run in the threadpool while the loop adds subscribers
+                for subscriber in list(cell.values()):
+                    if haversine_km(latitude, longitude, subscriber.latitude, subscriber.longitude) <= subscriber.radius_km:
+                        matches.append(subscriber.user_id)
+        return matches
+
+    def in_city(self, city: Optional[str]) -> Set[str]:
+        return self.cities.get(_city_key(city), set())
+
+    def recipients(self, latitude: Optional[float] = None, longitude: Optional[float] = None,
+                   cities: Iterable[str] = ()) -> Set[str]:
+        """Subscribers targeted by a position and/or any of several city names"""
+        found = set()
+        if latitude is not None and longitude is not None:
+            found.update(self.within(latitude, longitude))
+        for city in cities:
+            found.update(list(self.in_city(city)))
+        return found
+
+    def warm(self, supabase, page_size: int = 1000):
+        """Load active subscriptions from the database"""
+        offset = 0
+        while True:
+            result = (
+                supabase.table("notification_subscriptions")
+                .select("user_id, latitude, longitude, radius_km, city")
+                .eq("active", True)
+                .range(offset, offset + page_size - 1)
+                .execute()
+            )
+            rows = result.data or []
+            for row in rows:
+                self.add(Subscriber(
+                    row["user_id"],
+                    float(row["latitude"]) if row.get("latitude") is not None else None,
+                    float(row["longitude"]) if row.get("longitude") is not None else None,
+                    row.get("radius_km") or DEFAULT_WATCH_RADIUS_KM,
+                    row.get("city"),
+                ))
+            if len(rows) < page_size:
+                break
+            offset += page_size
+        print(f"Notification subscriber index loaded with {len(self)} subscribers")
+
+
+class Notification:
+    """
+    One event to fan out
+
+    ``key`` identifies the event for recipient de-duplication: an SOS alert
+    id, or the canonical incident id so duplicate reports of the same
+    incident do not notify anyone twice. ``recipients``, when given, is the
+    exact audience (geo-fenced broadcasts) and replaces the subscriber
+    lookup.
+    """
+
+    __slots__ = ("key", "kind", "title", "body", "data", "latitude", "longitude", "cities", "exclude", "recipients", "created_at")
+
+    def __init__(self, key: str, kind: str, title: str, body: str, data: Optional[dict] = None,
+                 latitude: Optional[float] = None, longitude: Optional[float] = None,
+                 cities: Iterable[str] = (), exclude: Iterable[str] = (), recipients: Optional[Iterable[str]] = None):
+        self.key = key
+        self.kind = kind
+        self.title = title
+        self.body = body
+        self.data = data or {}
+        self.latitude = latitude
+        self.longitude = longitude
+        self.cities = [city for city in cities if city]
+        self.exclude = set(exclude)
+        self.recipients = set(recipients) if recipients is not None else None
+        self.created_at = time.time()
+
+    def payload(self) -> dict:
+        return {
+            "key": self.key,
+            "kind": self.kind,
+            "title": self.title,
+            "body": self.body,
+            "data": self.data,
+            "latitude": self.latitude,
+            "longitude": self.longitude,
+        }
+
+
+# Incident types that notify subscribers on the first report; other types
+# notify once enough independent reports corroborate them
+MAJOR_INCIDENT_TYPES = {
+    t.strip().lower() for t in os.getenv("NOTIFY_INCIDENT_TYPES", "Flood,Fire,Building Collapse").split(",") if t.strip()
+}
+NOTIFY_INCIDENT_MIN_REPORTS = int(os.getenv("NOTIFY_INCIDENT_MIN_REPORTS", "3"))
+
+
+def sos_notification(alert: dict, city: Optional[str] = None) -> Notification:
+    """Notification for a newly created SOS alert"""
+    return Notification(
+        f"sos:{alert['id']}",
+        "sos",
+        f"SOS: {alert.get('emergency_type', 'general')}",
+        f"{alert.get('user_name', 'Someone')} needs help near {alert.get('location_description', 'their location')}",
+        data={"alert_id": alert["id"], "emergency_type": alert.get("emergency_type")},
+        latitude=alert.get("latitude"),
+        longitude=alert.get("longitude"),
+        cities=[city] if city else (),
+        exclude=[alert.get("user_id")],
+    )
+
+
+def sos_escalation_notification(alert: dict, level: int, minutes: float, city: Optional[str] = None) -> Notification:
+    """
+    Re-notification for an SOS alert still unanswered after ``minutes``
+
+    Keyed per escalation level, so everyone nearby hears about it again.
+    """
+    return Notification(
+        f"sos:{alert['id']}:escalation:{level}",
+        "sos_escalation",
+        f"Still unanswered: SOS {alert.get('emergency_type') or 'general'}",
+        f"{alert.get('user_name') or 'Someone'} near {alert.get('location_description') or 'their location'} "
+        f"has had no response for {minutes:.0f} minutes",
+        data={"alert_id": alert["id"], "emergency_type": alert.get("emergency_type"), "escalation_level": level},
+        latitude=alert.get("latitude"),
+        longitude=alert.get("longitude"),
+        cities=[city] if city else (),
+        exclude=[alert.get("user_id")],
+    )
+
+
+def broadcast_notification(broadcast_id: str, title: str, message: str, severity: str, recipients: Iterable[str]) -> Notification:
+    """Authority broadcast to everyone last seen inside an area"""
+    return Notification(
+        f"broadcast:{broadcast_id}",
+        "broadcast",
+        title,
+        message,
+        data={"broadcast_id": broadcast_id, "severity": severity},
+        recipients=recipients,
+    )
+
+
+def incident_notification(incident: dict, canonical_id: str, report_count: int) -> Optional[Notification]:
+    """
+    Notification for an incident report, or None if it should not notify
+
+    Keyed on the canonical incident so each subscriber hears about an
+    incident once however many duplicate reports arrive.
+    """
+    major = str(incident.get("incident_type", "")).lower() in MAJOR_INCIDENT_TYPES
+    if not (major and report_count == 1) and report_count != NOTIFY_INCIDENT_MIN_REPORTS:
+        return None
+    location = incident.get("location") or ""
+    return Notification(
+        f"incident:{canonical_id}",
+        "incident",
+        f"{incident.get('incident_type', 'Incident')} reported nearby",
+        f"{incident.get('description', '')} ({location})".strip(),
+        data={"incident_id": canonical_id, "incident_type": incident.get("incident_type"), "report_count": report_count},
+        latitude=incident.get("latitude"),
+        longitude=incident.get("longitude"),
+        # Resolved by the geocoder (the free-text location rarely names a city cleanly)
+        cities=[incident.get("place_name"), incident.get("district")],
+        exclude=[incident.get("user_id")],
+    )
+
+
+class LogNotificationSink:
+    """Prints a line per batch (the default when no push provider is configured)"""
+
+    async def send(self, notification: Notification, recipients: List[str]):
+        print(f"Notify {len(recipients)} subscribers: {notification.title}")
+
+
+class LocalNotificationSink:
+    """
+    Records deliveries in memory and optionally appends them to a JSONL file
+
+    Stand-in for a push provider in development and tests.
+    """
+
+    def __init__(self, path: Optional[str] = None, keep: int = 1000):
+        self.path = path
+        self.delivered = 0
+        self.recent = deque(maxlen=keep)
+
+    async def send(self, notification: Notification, recipients: List[str]):
+        self.delivered += len(recipients)
+        self.recent.append({"notification": notification.payload(), "recipients": len(recipients)})
+        if self.path:
+            with open(self.path, "a", encoding="utf-8") as file:
+                for user_id in recipients:
+                    file.write(json.dumps({"user_id": user_id, **notification.payload()}, ensure_ascii=False) + "\n")
+
+
+class WebhookNotificationSink:
+    """
+    POSTs each batch to a push gateway
+
+    A 5xx or network error fails the whole batch (retried); a JSON body with
+    a ``failed`` list of user ids retries just those recipients.
+    """
+
+    def __init__(self, url: str, token: Optional[str] = None, timeout: float = 10.0):
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def send(self, notification: Notification, recipients: List[str]):
+        if self._client is None:
+            headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+            self._client = httpx.AsyncClient(headers=headers, timeout=self.timeout)
+        response = await self._client.post(self.url, json={"notification": notification.payload(), "recipients": recipients})
+        if response.status_code >= 500:
+            raise Exception(f"Push gateway error ({response.status_code}): {response.text}")
+        if response.status_code >= 400:
+            print(f"Push gateway rejected batch ({response.status_code}): {response.text}")
+            return None
+        try:
+            return response.json().get("failed")
+        except ValueError:
+            return None
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def sink_from_env():
+    """NOTIFICATION_SINK=log (default), local or webhook"""
+    kind = os.getenv("NOTIFICATION_SINK", "log")
+    if kind == "local":
+        return LocalNotificationSink(os.getenv("NOTIFICATION_LOCAL_FILE"))
+    if kind == "webhook":
+        return WebhookNotificationSink(os.environ["NOTIFICATION_WEBHOOK_URL"], os.getenv("NOTIFICATION_WEBHOOK_TOKEN"))
+    return LogNotificationSink()
+
+
+class NotificationDispatcher:
+    """
+    Async fan-out queue
+
+    ``publish`` only enqueues, so request handlers never wait on recipient
+    lookup or delivery. Workers resolve recipients, skip anyone already told
+    about the same event key, split the rest into batches and hand them to
+    the sink, retrying failed recipients with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        index: SubscriberIndex,
+        sink=None,
+        workers: int = 4,
+        batch_size: int = NOTIFICATION_BATCH_SIZE,
+        max_attempts: int = 4,
+        retry_delay: float = 0.5,
+        dedup_seconds: float = RECIPIENT_DEDUP_SECONDS,
+        max_queued: int = 10000,
+    ):
+        self.index = index
+        self.sink = sink or LogNotificationSink()
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.dedup_seconds = dedup_seconds
+        self.max_queued = max_queued
+        self.queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # (event key, user id) -> expiry, oldest first
+        self._notified: "OrderedDict[tuple, float]" = OrderedDict()
+        self.counters = defaultdict(int)
+
+    def start(self):
+        if not self._tasks:
+            self.queue = asyncio.Queue(maxsize=self.max_queued)
+            self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 10.0):
+        """Deliver what is queued (up to timeout), then stop the workers"""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Notification queue not drained, {self.queue.qsize()} events dropped")
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if hasattr(self.sink, "aclose"):
+            await self.sink.aclose()
+
+    def publish(self, notification: Notification) -> bool:
+        """Queue an event for fan-out (no-op until started); False when the queue is full"""
+        if self.queue is None:
+            return False
+        try:
+            self.queue.put_nowait(notification)
+        except asyncio.QueueFull:
+            self.counters["dropped_events"] += 1
+            return False
+        self.counters["published"] += 1
+        return True
+
+    def _claim(self, key: str, recipients: Iterable[str]) -> List[str]:
+        """Recipients not yet told about this event; they are marked as told"""
+        now = time.time()
+        while self._notified:
+            oldest, expiry = next(iter(self._notified.items()))
+            if expiry > now:
+                break
+            del self._notified[oldest]
+        fresh = []
+        expiry = now + self.dedup_seconds
+        for user_id in recipients:
+            entry = (key, user_id)
+            if entry in self._notified:
+                continue
+            self._notified[entry] = expiry
+            fresh.append(user_id)
+        return fresh
+
+    def _release(self, key: str, recipients: Iterable[str]):
+        for user_id in recipients:
+            self._notified.pop((key, user_id), None)
+
+    async def _run(self):
+        while True:
+            notification = await self.queue.get()
+            try:
+                await self.dispatch(notification)
+            except Exception as e:
+                print(f"Error dispatching notification {notification.key}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def dispatch(self, notification: Notification) -> int:
+        """
+        Resolve recipients and deliver one event
+
+        Returns:
+            int: Recipients delivered to
+        """
+        if notification.recipients is not None:
+            targeted = notification.recipients - notification.exclude
+        else:
+            # Scanning a dense area is CPU work; keep it off the event loop
+            targeted = await run_in_threadpool(self.index.recipients, notification.latitude, notification.longitude, notification.cities)
+            targeted -= notification.exclude
+        recipients = self._claim(notification.key, targeted)
+        self.counters["deduplicated"] += len(targeted) - len(recipients)
+        delivered = 0
+        for start in range(0, len(recipients), self.batch_size):
+            delivered += await self._deliver(notification, recipients[start:start + self.batch_size])
+        self.counters["lag_ms_total"] += int((time.time() - notification.created_at) * 1000)
+        self.counters["dispatched"] += 1
+        return delivered
+
+    async def _deliver(self, notification: Notification, batch: List[str]) -> int:
+        pending = batch
+        for attempt in range(self.max_attempts):
+            try:
+                failed = await self.sink.send(notification, pending)
+            except Exception as e:
+                print(f"Notification batch failed (attempt {attempt + 1}): {e}")
+                failed = pending
+            pending_set = set(pending)
+            failed = [user_id for user_id in failed or [] if user_id in pending_set]
+            self.counters["batches"] += 1
+            self.counters["delivered"] += len(pending) - len(failed)
+            if not failed:
+                return len(batch)
+            pending = failed
+            self.counters["retries"] += 1
+            if attempt + 1 < self.max_attempts:
+                await asyncio.sleep(self.retry_delay * (2 ** attempt) * (0.5 + random.random()))
+        # Let a later event with the same key try these recipients again
+        self._release(notification.key, pending)
+        self.counters["failed"] += len(pending)
+        return len(batch) - len(pending)
+
+    def stats(self) -> dict:
+        dispatched = self.counters["dispatched"]
+        return {
+            "subscribers": len(self.index),
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "published": self.counters["published"],
+            "dispatched": dispatched,
+            "delivered": self.counters["delivered"],
+            "deduplicated": self.counters["deduplicated"],
+            "retries": self.counters["retries"],
+            "failed": self.counters["failed"],
+            "dropped_events": self.counters["dropped_events"],
+            "avg_lag_ms": round(self.counters["lag_ms_total"] / dispatched, 1) if dispatched else 0.0,
+        }
+
+
+# Population centres used to place synthetic subscribers in the benchmark
+_BENCH_CENTRES = [
+    (28.61, 77.21), (19.08, 72.88), (12.97, 77.59), (13.08, 80.27), (22.57, 88.36),
+    (17.39, 78.49), (18.52, 73.86), (23.02, 72.57), (26.91, 75.79), (26.85, 80.95),
+]
+
+
+class _CountingSink:
+    def __init__(self):
+        self.delivered = 0
+
+    async def send(self, notification, recipients):
+        self.delivered += len(recipients)
+
+
+def benchmark(subscribers: int = 1000000, events: int = 200, seed: int = 7) -> dict:
+    """Build an index of synthetic subscribers and time lookups and fan-out"""
+    rng = random.Random(seed)
+    index = SubscriberIndex()
+
+    started = time.perf_counter()
+    for n in range(subscribers):
+        if n % 2:
+            # Half spread across the country, half around big cities
+            latitude, longitude = rng.uniform(8.0, 35.0), rng.uniform(68.0, 97.0)
+        else:
+            centre = _BENCH_CENTRES[n % len(_BENCH_CENTRES)]
+            latitude, longitude = rng.gauss(centre[0], 0.25), rng.gauss(centre[1], 0.25)
+        index.add(Subscriber(f"u{n}", latitude, longitude, rng.choice((2.0, 5.0, 10.0))))
+    build_seconds = time.perf_counter() - started
+
+    points = [(rng.gauss(c[0], 0.1), rng.gauss(c[1], 0.1)) for c in (rng.choice(_BENCH_CENTRES) for _ in range(events))]
+    started = time.perf_counter()
+    recipients = [len(index.within(latitude, longitude)) for latitude, longitude in points]
+    lookup_seconds = time.perf_counter() - started
+
+    sink = _CountingSink()
+    dispatcher = NotificationDispatcher(index, sink)
+
+    async def fan_out():
+        dispatcher.start()
+        for n, (latitude, longitude) in enumerate(points):
+            dispatcher.publish(Notification(f"bench-{n}", "sos", "SOS", "", latitude=latitude, longitude=longitude))
+        await dispatcher.stop(timeout=600)
+
+    started = time.perf_counter()
+    asyncio.run(fan_out())
+    fan_out_seconds = time.perf_counter() - started
+
+    return {
+        "subscribers": subscribers,
+        "events": events,
+        "index_build_seconds": round(build_seconds, 2),
+        "lookup_ms_per_event": round(lookup_seconds * 1000 / events, 2),
+        "avg_recipients_per_event": round(sum(recipients) / events),
+        "fan_out_seconds": round(fan_out_seconds, 2),
+        "events_per_second": round(events / fan_out_seconds, 1),
+        "deliveries_per_second": round(sink.delivered / fan_out_seconds),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Notification fan-out tools")
+    parser.add_argument("command", choices=["bench"])
+    parser.add_argument("--subscribers", type=int, default=1000000)
+    parser.add_argument("--events", type=int, default=200)
+    args = parser.parse_args(argv)
+    for name, value in benchmark(args.subscribers, args.events).items():
+        print(f"{name:>26}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+import asyncio
+import io
+from collections import defaultdict
+from itertools import combinations
+from typing import Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image, ImageOps
+
+HASH_BITS = 64
+
+# Photos closer than this (in differing bits out of 64) are flagged for review
+DEFAULT_MATCH_DISTANCE = 10
+
+# Searches further out than this visit most of the index and match unrelated photos
+MAX_MATCH_DISTANCE = 2 * DEFAULT_MATCH_DISTANCE
+
+# Map storage buckets to the kind of record the photo belongs to
+BUCKET_SOURCES = {
+    "missing_person_photos": "missing_person",
+    "incident_images": "incident",
+    "community_images": "community",
+    "profile_pictures": "user",
+}
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of differing bits between two hashes"""
+    return bin(a ^ b).count("1")
+
+
+def compute_image_hash(image_bytes: bytes) -> int:
+    """
+    Compute a 64-bit difference hash (dHash) of an image
+
+    The image is reduced to a 9x8 grayscale thumbnail and each bit records
+    whether a pixel is brighter than its right-hand neighbour. Re-encoded,
+    resized or lightly cropped copies of a photo land within a few bits.
+
+    Args:
+        image_bytes: Encoded image (JPEG, PNG, ...)
+
+    Returns:
+        int: 64-bit perceptual hash
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    # JPEG draft mode decodes at reduced scale, which is far cheaper for large photos
+    image.draft("L", (64, 64))
+    image = ImageOps.exif_transpose(image)
+    image = image.convert("L").resize((9, 8), Image.LANCZOS)
+    pixels = list(image.getdata())
+
+    value = 0
+    for row in range(8):
+        offset = row * 9
+        for column in range(8):
+            value = (value << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return value
+
+
+def hash_to_hex(value: int) -> str:
+    return f"{value:016x}"
+
+
+def hex_to_hash(value: str) -> int:
+    return int(value, 16)
+
+
+class MultiIndexHashTable:
+    """
+    Multi-index hashing for Hamming-distance search over 64-bit hashes.
+
+    The hash is split into ``chunks`` substrings, each indexed in its own
+    table. If two hashes differ in at most ``r`` bits then, by the pigeonhole
+    principle, at least one substring differs in at most ``r // chunks`` bits,
+    so a query only probes the few buckets near each of its substrings
+    instead of scanning every stored hash.
+    """
+
+    def __init__(self, bits: int = HASH_BITS, chunks: int = 4):
+        self.bits = bits
+        self.chunks = chunks
+        self.chunk_bits = bits // chunks
+        self.chunk_mask = (1 << self.chunk_bits) - 1
+        self.tables: List[Dict[int, set]] = [defaultdict(set) for _ in range(chunks)]
+        self._flip_masks: Dict[int, List[int]] = {}
+        self.size = 0
+
+    def _chunk(self, value: int, index: int) -> int:
+        return (value >> (index * self.chunk_bits)) & self.chunk_mask
+
+    def _masks(self, radius: int) -> List[int]:
+        """All chunk-sized bitmasks with at most ``radius`` bits set"""
+        if radius not in self._flip_masks:
+            masks = [0]
+            for weight in range(1, radius + 1):
+                for positions in combinations(range(self.chunk_bits), weight):
+                    mask = 0
+                    for position in positions:
+                        mask |= 1 << position
+                    masks.append(mask)
+            self._flip_masks[radius] = masks
+        return self._flip_masks[radius]
+
+    def add(self, value: int):
+        if value in self.tables[0].get(self._chunk(value, 0), ()):
+            return
+        for index, table in enumerate(self.tables):
+            table[self._chunk(value, index)].add(value)
+        self.size += 1
+
+    def remove(self, value: int):
+        bucket = self.tables[0].get(self._chunk(value, 0))
+        if not bucket or value not in bucket:
+            return
+        for index, table in enumerate(self.tables):
+            chunk = self._chunk(value, index)
+            table[chunk].discard(value)
+            if not table[chunk]:
+                del table[chunk]
+        self.size -= 1
+
+    def search(self, value: int, max_distance: int) -> List[tuple]:
+        """
+        Find stored hashes within ``max_distance`` bits of ``value``
+
+        Returns:
+            list: (distance, hash) pairs, closest first
+        """
+        masks = self._masks(max_distance // self.chunks)
+        seen = set()
+        results = []
+        for index, table in enumerate(self.tables):
+            chunk = self._chunk(value, index)
+            for mask in masks:
+                bucket = table.get(chunk ^ mask)
+                if not bucket:
+                    continue
+                for candidate in bucket:
+                    if candidate in seen:
+                        continue
+                    seen.add(candidate)
+                    distance = hamming_distance(value, candidate)
+                    if distance <= max_distance:
+                        results.append((distance, candidate))
+        results.sort()
+        return results
+
+
+class PhotoHashIndex:
+    """In-memory index of photo fingerprints keyed by perceptual hash"""
+
+    def __init__(self):
+        self.table = MultiIndexHashTable()
+        self.photos: Dict[int, Dict[str, dict]] = defaultdict(dict)
+        self.by_url: Dict[str, int] = {}
+
+    def __len__(self):
+        return len(self.by_url)
+
+    def add(self, photo_url: str, image_hash: int, source_type: str):
+        if photo_url in self.by_url:
+            return
+        self.table.add(image_hash)
+        self.photos[image_hash][photo_url] = {"photo_url": photo_url, "source_type": source_type}
+        self.by_url[photo_url] = image_hash
+
+    def remove(self, photo_url: str):
+        image_hash = self.by_url.pop(photo_url, None)
+        if image_hash is None:
+            return
+        self.photos[image_hash].pop(photo_url, None)
+        if not self.photos[image_hash]:
+            del self.photos[image_hash]
+            self.table.remove(image_hash)
+
+    def search(self, image_hash: int, max_distance: int = DEFAULT_MATCH_DISTANCE, limit: int = 50) -> List[dict]:
+        """Photos within ``max_distance`` bits of ``image_hash``, closest first"""
+        matches = []
+        for distance, candidate in self.table.search(image_hash, max_distance):
+            for photo in self.photos[candidate].values():
+                matches.append({**photo, "distance": distance, "hash": hash_to_hex(candidate)})
+                if len(matches) >= limit:
+                    return matches
+        return matches
+
+
+class PhotoMatcher:
+    """
+    Fingerprints uploaded photos in the background and flags likely matches.
+
+    Uploads are queued with ``submit`` so hashing never delays the request.
+    Each photo is hashed, stored in ``photo_hashes`` and compared against the
+    index; any near-duplicate pair that involves a missing-person photo is
+    written to ``photo_matches`` for volunteers to review.
+    """
+
+    def __init__(self, supabase, match_distance: int = DEFAULT_MATCH_DISTANCE):
+        self.supabase = supabase
+        self.match_distance = match_distance
+        self.index = PhotoHashIndex()
+        self.queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def warm(self, page_size: int = 1000):
+        """Load every stored fingerprint into the in-memory index"""
+        offset = 0
+        while True:
+            result = self.supabase.table("photo_hashes").select("photo_url, phash, source_type").range(offset, offset + page_size - 1).execute()
+            rows = result.data or []
+            for row in rows:
+                self.index.add(row["photo_url"], hex_to_hash(row["phash"]), row["source_type"])
+            if len(rows) < page_size:
+                break
+            offset += page_size
+        print(f"Photo hash index loaded with {len(self.index)} photos")
+
+    def start(self):
+        if self._worker is None:
+            self.queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    def submit(self, image_bytes, photo_url: str, source_type: str) -> bool:
+        """
+        Queue an uploaded photo for fingerprinting (no-op until started)
+
+        Args:
+            image_bytes: Image content, or a callable that loads it (run in a worker thread)
+            photo_url: Public URL the photo is stored under
+            source_type: Kind of record the photo belongs to
+
+        Returns:
+            bool: Whether the photo was queued
+        """
+        if self.queue is None or not photo_url:
+            return False
+        self.queue.put_nowait((image_bytes, photo_url, source_type))
+        return True
+
+    async def _run(self):
+        while True:
+            image_bytes, photo_url, source_type = await self.queue.get()
+            try:
+                if callable(image_bytes):
+                    image_bytes = await run_in_threadpool(image_bytes)
+                await self.process(image_bytes, photo_url, source_type)
+            except Exception as e:
+                print(f"Error fingerprinting photo {photo_url}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def process(self, image_bytes: bytes, photo_url: str, source_type: str) -> List[dict]:
+        """Fingerprint one photo, index it and record candidate matches"""
+        image_hash = await run_in_threadpool(compute_image_hash, image_bytes)
+        matches = [
+            match for match in self.index.search(image_hash, self.match_distance)
+            if match["photo_url"] != photo_url
+            and "missing_person" in (source_type, match["source_type"])
+        ]
+        self.index.add(photo_url, image_hash, source_type)
+
+        hash_row = {
+            "photo_url": photo_url,
+            "source_type": source_type,
+            "phash": hash_to_hex(image_hash),
+        }
+        await run_in_threadpool(lambda: self.supabase.table("photo_hashes").insert(hash_row).execute())
+
+        if matches:
+            match_rows = [
+                {
+                    "photo_url": photo_url,
+                    "source_type": source_type,
+                    "matched_photo_url": match["photo_url"],
+                    "matched_source_type": match["source_type"],
+                    "distance": match["distance"],
+                    "status": "pending",
+                }
+                for match in matches
+            ]
+            await run_in_threadpool(lambda: self.supabase.table("photo_matches").insert(match_rows).execute())
+            print(f"Flagged {len(matches)} candidate photo matches for {photo_url}")
+        return matches
@@ -0,0 +1,296 @@
+"""
+Opt-in sampling profiler for live requests.
+
+A request is profiled when it carries ``X-Profile: 1`` with a valid
+``X-Profiler-Token``, or when an admin has turned on sampling of a fraction
+of requests (optionally only for some paths). While at least one profiled
+request is in flight a background thread wakes every ``interval`` seconds
+and records where each of them is:
+
+* if the request's task is running on the event loop, the loop thread's
+  call stack from the task's coroutine down;
+* if the task is suspended, the chain of coroutines it is awaiting through,
+  ending in ``[await <Future>]`` (database calls in the threadpool, sleeps,
+  network I/O).
+
+So a profile shows wall-clock time, not just CPU time. (The sampler needs
+the GIL, so long CPU-bound stretches are sampled at the interpreter's switch
+interval rather than ``interval``.) Stacks are stored in
+the folded format (``frame;frame;frame count``) read by flamegraph.pl,
+speedscope and most flamegraph viewers, one file per request, in a
+directory holding at most ``max_profiles`` of them. Nothing runs when no
+request is being profiled.
+"""
+import asyncio
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Dict, List, Optional
+
+DEFAULT_PROFILE_INTERVAL = 0.005
+DEFAULT_MAX_PROFILES = 200
+
+# Samples further than this from the task's coroutine are cut off
+MAX_STACK_DEPTH = 128
+
+PROFILE_HEADER = b"x-profile"
+TOKEN_HEADER = b"x-profiler-token"
+
+
+def _frame_label(frame) -> str:
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}.{frame.f_code.co_name}"
+
+
+class ProfileSession:
+    __slots__ = ("id", "method", "path", "trigger", "task", "thread_id", "started", "started_at", "samples")
+
+    def __init__(self, method: str, path: str, trigger: str, task: asyncio.Task):
+        self.id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.task = task
+        self.thread_id = threading.get_ident()
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.samples: Counter = Counter()
+
+    def sample(self, frames: Dict[int, object]):
+        coro = self.task.get_coro()
+        root = getattr(coro, "cr_frame", None)
+        if root is None:
+            return
+        stack = self._running_stack(frames.get(self.thread_id), root)
+        if stack is None:
+            stack = self._awaiting_stack(coro)
+        self.samples[";".join(stack)] += 1
+
+    @staticmethod
+    def _running_stack(frame, root) -> Optional[List[str]]:
+        """Loop thread's stack from ``root`` down, or None if the task is not running"""
+        stack = []
+        while frame is not None and len(stack) < MAX_STACK_DEPTH:
+            stack.append(_frame_label(frame))
+            if frame is root:
+                stack.reverse()
+                return stack
+            frame = frame.f_back
+        return None
+
+    @staticmethod
+    def _awaiting_stack(coro) -> List[str]:
+        """Coroutines a suspended task is awaiting through, outermost first"""
+        stack = []
+        awaitable = coro
+        while awaitable is not None and len(stack) < MAX_STACK_DEPTH:
+            frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+            if frame is None:
+                # asyncio futures are awaited through their (unnamed) iterator
+                name = type(awaitable).__name__
+                stack.append(f"[await {'Future' if name == 'FutureIter' else name}]")
+                break
+            stack.append(_frame_label(frame))
+            awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+        return stack
+
+
+class SamplingProfiler:
+    """
+    Per-request sampling profiler with a bounded on-disk store
+
+    Args:
+        directory: Where profiles are kept
+        token: Secret required to request a profile or use the admin
+            endpoints; profiling is disabled when empty
+        interval: Seconds between samples
+        max_profiles: Oldest profiles are deleted beyond this many
+    """
+
+    def __init__(self, directory: str, token: Optional[str] = None, interval: float = DEFAULT_PROFILE_INTERVAL,
+                 max_profiles: int = DEFAULT_MAX_PROFILES):
+        self.directory = directory
+        self.token = token or ""
+        self.interval = interval
+        self.max_profiles = max_profiles
+        # Admin-controlled sampling of requests without the header
+        self.sample_rate = 0.0
+        self.sample_paths: List[str] = []
+        self.sample_until = 0.0
+        self.sessions: Dict[str, ProfileSession] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._index: Dict[str, dict] = {}
+        if self.enabled:
+            os.makedirs(directory, exist_ok=True)
+            self._load_index()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.token)
+
+    def authorized(self, token: Optional[str]) -> bool:
+        return self.enabled and bool(token) and hmac.compare_digest(token.encode("utf-8"), self.token.encode("utf-8"))
+
+    def configure(self, sample_rate: float, paths: Optional[List[str]] = None, duration_seconds: float = 300) -> dict:
+        """Profile ``sample_rate`` of requests (to ``paths`` prefixes, if given) for ``duration_seconds``"""
+        self.sample_rate = max(0.0, min(sample_rate, 1.0))
+        self.sample_paths = [path for path in paths or [] if path]
+        self.sample_until = time.time() + duration_seconds if self.sample_rate else 0.0
+        return self.settings()
+
+    def settings(self) -> dict:
+        sampling = self.sample_rate > 0 and time.time() < self.sample_until
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate if sampling else 0.0,
+            "paths": self.sample_paths if sampling else [],
+            "sampling_until": self.sample_until if sampling else None,
+            "interval_ms": self.interval * 1000,
+            "active_sessions": len(self.sessions),
+            "stored_profiles": len(self._index),
+            "max_profiles": self.max_profiles,
+        }
+
+    def trigger(self, scope: dict) -> Optional[str]:
+        """Why this request should be profiled ("header" or "sampled"), or None"""
+        if not self.enabled:
+            return None
+        headers = dict(scope.get("headers") or [])
+        if headers.get(PROFILE_HEADER) in (b"1", b"true"):
+            token = headers.get(TOKEN_HEADER, b"").decode("latin-1")
+            return "header" if self.authorized(token) else None
+        if self.sample_rate and time.time() < self.sample_until:
+            path = scope.get("path", "")
+            if (not self.sample_paths or path.startswith(tuple(self.sample_paths))) and random.random() < self.sample_rate:
+                return "sampled"
+        return None
+
+    def begin(self, method: str, path: str, trigger: str) -> ProfileSession:
+        """Start sampling the current task (call from the request's task)"""
+        session = ProfileSession(method, path, trigger, asyncio.current_task())
+        with self._lock:
+            self.sessions[session.id] = session
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+        return session
+
+    def finish(self, session: ProfileSession, status_code: Optional[int]) -> Optional[dict]:
+        with self._lock:
+            self.sessions.pop(session.id, None)
+            samples = dict(session.samples)
+        if not samples:
+            return None
+        meta = {
+            "id": session.id,
+            "method": session.method,
+            "path": session.path,
+            "status": status_code,
+            "trigger": session.trigger,
+            "started_at": session.started_at,
+            "duration_ms": round((time.perf_counter() - session.started) * 1000, 1),
+            "samples": sum(samples.values()),
+            "interval_ms": self.interval * 1000,
+        }
+        try:
+            self._store(meta, samples)
+        except OSError as e:
+            print(f"Error storing profile {session.id}: {e}")
+            return None
+        return meta
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self.sessions:
+                    self._thread = None
+                    return
+                frames = sys._current_frames()
+                for session in self.sessions.values():
+                    try:
+                        session.sample(frames)
+                    except Exception:
+                        # The task moved on while we looked at it; skip this tick
+                        pass
+                del frames
+
+    def _path(self, profile_id: str, extension: str) -> str:
+        return os.path.join(self.directory, f"{profile_id}.{extension}")
+
+    def _store(self, meta: dict, samples: Dict[str, int]):
+        with open(self._path(meta["id"], "folded"), "w", encoding="utf-8") as file:
+            for stack, count in sorted(samples.items()):
+                file.write(f"{stack} {count}\n")
+        with open(self._path(meta["id"], "json"), "w", encoding="utf-8") as file:
+            json.dump(meta, file)
+        with self._lock:
+            self._index[meta["id"]] = meta
+            expired = sorted(self._index)[:-self.max_profiles] if len(self._index) > self.max_profiles else []
+            for profile_id in expired:
+                del self._index[profile_id]
+        for profile_id in expired:
+            for extension in ("folded", "json"):
+                try:
+                    os.remove(self._path(profile_id, extension))
+                except FileNotFoundError:
+                    pass
+
+    def _load_index(self):
+        for filename in os.listdir(self.directory):
+            if filename.endswith(".json"):
+                try:
+                    with open(os.path.join(self.directory, filename), "r", encoding="utf-8") as file:
+                        meta = json.load(file)
+                    self._index[meta["id"]] = meta
+                except (OSError, ValueError, KeyError):
+                    continue
+
+    def list(self, path: Optional[str] = None, limit: int = 100) -> List[dict]:
+        """Stored profiles, newest first"""
+        profiles = [meta for meta in self._index.values() if not path or meta["path"].startswith(path)]
+        profiles.sort(key=lambda meta: meta["id"], reverse=True)
+        return profiles[:limit]
+
+    def folded_path(self, profile_id: str) -> Optional[str]:
+        return self._path(profile_id, "folded") if profile_id in self._index else None
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling requests the profiler selects
+
+    Pure ASGI rather than BaseHTTPMiddleware so the endpoint runs in the same
+    task that is being sampled. Profiled responses carry ``X-Profile-Id``.
+    """
+
+    def __init__(self, app, profiler: SamplingProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        trigger = self.profiler.trigger(scope) if scope["type"] == "http" else None
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+        session = self.profiler.begin(scope["method"], scope["path"], trigger)
+        status_code = None
+
+        async def send_with_profile_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message = {**message, "headers": list(message.get("headers") or []) + [(b"x-profile-id", session.id.encode("ascii"))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            self.profiler.finish(session, status_code)
@@ -0,0 +1,175 @@
+import json
+import re
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+# Partition used for requests that do not name a region
+GLOBAL_REGION = "*"
+
+DEFAULT_REGION_CACHE_BYTES = 2 * 1024 * 1024
+DEFAULT_REGION_CACHE_TTL = 15.0
+
+_SIZE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([kmg]?b?)\s*$", re.IGNORECASE)
+_UNITS = {"": 1, "b": 1, "k": 1024, "kb": 1024, "m": 1024 ** 2, "mb": 1024 ** 2, "g": 1024 ** 3, "gb": 1024 ** 3}
+
+
+def parse_size(text: str) -> int:
+    """'512KB', '8MB', '1048576' -> bytes"""
+    match = _SIZE.match(text)
+    if not match:
+        raise ValueError(f"Invalid size: {text}")
+    return int(float(match.group(1)) * _UNITS[match.group(2).lower()])
+
+
+def parse_region_sizes(text: Optional[str]) -> Dict[str, int]:
+    """'Pune:8MB, Kamrup Metropolitan:4MB' -> {region key: bytes}"""
+    sizes = {}
+    for item in (text or "").split(","):
+        if ":" in item:
+            region, size = item.rsplit(":", 1)
+            sizes[region_key(region)] = parse_size(size)
+    return sizes
+
+
+def region_key(region: Optional[str]) -> str:
+    return region.strip().lower() if region and region.strip() else GLOBAL_REGION
+
+
+class RegionPartition:
+    """LRU of serialized responses for one region, bounded in bytes"""
+
+    __slots__ = ("region", "capacity", "entries", "size", "generation", "hits", "misses", "evictions", "invalidations")
+
+    def __init__(self, region: str, capacity: int):
+        self.region = region
+        self.capacity = capacity
+        # key -> (expires_at, body)
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.size = 0
+        # Bumped by every invalidation, so a response built before one is not cached after it
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self.entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: str, body: bytes, ttl: float):
+        if key in self.entries:
+            self._drop(key)
+        if len(body) > self.capacity:
+            return
+        self.entries[key] = (time.monotonic() + ttl, body)
+        self.size += len(body)
+        while self.size > self.capacity:
+            oldest = next(iter(self.entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def _drop(self, key: str):
+        _, body = self.entries.pop(key)
+        self.size -= len(body)
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+        self.generation += 1
+        self.invalidations += 1
+
+
+class RegionalCache:
+    """
+    Response cache partitioned by region (district).
+
+    Each region has its own partition with its own byte budget (hot regions
+    can be given more via ``capacities``), so a burst of activity in one
+    district neither evicts nor invalidates another district's entries.
+    Writes invalidate only the partitions they touch: the row's region and
+    the global partition that serves unfiltered lists. Partitions for
+    regions nobody has asked about recently are dropped once more than
+    ``max_regions`` exist.
+    """
+
+    def __init__(
+        self,
+        default_capacity: int = DEFAULT_REGION_CACHE_BYTES,
+        capacities: Optional[Dict[str, int]] = None,
+        ttl: float = DEFAULT_REGION_CACHE_TTL,
+        max_regions: int = 256,
+    ):
+        self.default_capacity = default_capacity
+        self.capacities = capacities or {}
+        self.ttl = ttl
+        self.max_regions = max_regions
+        self.partitions: "OrderedDict[str, RegionPartition]" = OrderedDict()
+
+    def partition(self, region: Optional[str]) -> RegionPartition:
+        key = region_key(region)
+        partition = self.partitions.get(key)
+        if partition is None:
+            partition = self.partitions[key] = RegionPartition(key, self.capacities.get(key, self.default_capacity))
+            while len(self.partitions) > self.max_regions:
+                self.partitions.popitem(last=False)
+        else:
+            self.partitions.move_to_end(key)
+        return partition
+
+    async def get_or_build(self, region: Optional[str], key: str, build: Callable[[str], Awaitable]) -> bytes:
+        """
+        Cached JSON body for ``key`` in ``region``'s partition, building it on a miss
+
+        Args:
+            region: District the response is scoped to (None for the global partition)
+            key: Cache key within the partition (route and parameters)
+            build: Coroutine function returning the response data, or its
+                JSON body as bytes. It is passed a key naming the region,
+                the partition's generation and ``key``: builds that share
+                work (single flight) must use it, so a miss after an
+                invalidation never joins a build that started before it.
+        """
+        partition = self.partition(region)
+        body = partition.get(key)
+        if body is None:
+            generation = partition.generation
+            body = await build(f"{partition.region}|{generation}|{key}")
+            if not isinstance(body, bytes):
+                body = json.dumps(body, default=str).encode("utf-8")
+            if partition.generation == generation:
+                partition.put(key, body, self.ttl)
+        return body
+
+    def invalidate(self, region: Optional[str]):
+        """Drop one region's cached responses (and the global lists that include it)"""
+        for key in {region_key(region), GLOBAL_REGION}:
+            partition = self.partitions.get(key)
+            if partition is not None:
+                partition.clear()
+
+    def stats(self) -> dict:
+        return {
+            "regions": len(self.partitions),
+            "bytes": sum(partition.size for partition in self.partitions.values()),
+            "partitions": {
+                partition.region: {
+                    "entries": len(partition.entries),
+                    "bytes": partition.size,
+                    "capacity": partition.capacity,
+                    "hits": partition.hits,
+                    "misses": partition.misses,
+                    "evictions": partition.evictions,
+                    "invalidations": partition.invalidations,
+                }
+                for partition in self.partitions.values()
+            },
+        }
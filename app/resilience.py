@@ -0,0 +1,382 @@
+import asyncio
+import bisect
+import json
+import os
+import random
+import time
+from collections import defaultdict, deque
+from typing import Dict, Optional
+
+import httpx
+from fastapi.concurrency import run_in_threadpool
+
+try:
+    from postgrest.exceptions import APIError
+except ImportError:
+    APIError = None
+
+# Consecutive transient failures that open the circuit, and how long it stays
+# open before a single probe request is let through
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 15.0
+
+DEFAULT_QUERY_TIMEOUT = 5.0
+
+# Error codes that can only mean the request itself is wrong, so retrying it
+# cannot help: SQLSTATE data exceptions, integrity constraint violations,
+# authorization failures, syntax/undefined-object errors and exceptions raised
+# by our own functions, plus PostgREST's request (PGRST1xx), schema (PGRST2xx)
+# and JWT (PGRST3xx) errors. Any other code (PGRST0xx "database unreachable",
+# connection or resource SQLSTATEs, gateway bodies without a code) is transient.
+_PERMANENT_CODE_PREFIXES = ("22", "23", "28", "42", "P0", "PGRST1", "PGRST2", "PGRST3")
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling upstream while the circuit is open"""
+
+
+class UpstreamResponseError(Exception):
+    """Upstream answered with a body that is not PostgREST JSON (e.g. a gateway error page)"""
+
+
+def _is_api_error(error: Exception) -> bool:
+    return APIError is not None and isinstance(error, APIError)
+
+
+def is_permanent(error: Exception) -> bool:
+    """Whether upstream rejected the request itself, so sending it again cannot succeed"""
+    if not _is_api_error(error):
+        return False
+    code = error.code
+    if isinstance(code, int) or (isinstance(code, str) and len(code) == 3 and code.isdigit()):
+        return int(code) < 500
+    return bool(code) and str(code).upper().startswith(_PERMANENT_CODE_PREFIXES)
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    Whether an upstream error is worth retrying later
+
+    Timeouts, transport and socket failures, an open circuit, undecodable
+    responses and every PostgREST error that is not a known client error
+    are. Errors raised by our own code are not, and callers re-raise them
+    instead of retrying or degrading.
+    """
+    if isinstance(error, (CircuitOpenError, UpstreamResponseError, asyncio.TimeoutError,
+                          httpx.TimeoutException, httpx.TransportError, OSError)):
+        return True
+    return _is_api_error(error) and not is_permanent(error)
+
+
+def record_outcome(breaker: "CircuitBreaker", error: Exception):
+    """Count a failed call against the breaker according to what failed"""
+    if is_transient(error):
+        breaker.record_failure()
+    elif is_permanent(error):
+        # Upstream answered, the request itself was bad
+        breaker.record_success()
+    else:
+        # Says nothing about upstream health either way
+        breaker.release()
+
+
+def _execute(query):
+    """``query.execute()``, with a non-JSON error page reported as an upstream failure"""
+    try:
+        return query.execute()
+    except json.JSONDecodeError as e:
+        raise UpstreamResponseError(f"Undecodable response from upstream: {e}") from e
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after ``failure_threshold`` consecutive transient failures;
+    open -> half-open after ``reset_seconds``, letting one probe through;
+    the probe's outcome closes or re-opens the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self.rejected = 0
+        self.trips = 0
+
+    def allow(self) -> bool:
+        """Whether a request may go upstream now"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self.state = self.HALF_OPEN
+            self._probing = False
+        if self.state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            print(f"Circuit {self.name} closed, upstream recovered")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.trips += 1
+                print(f"Circuit {self.name} opened after {self.failures} failures")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self):
+        """Let another probe through without judging upstream (the call failed locally)"""
+        self._probing = False
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
+
+
+async def execute(breaker: CircuitBreaker, query, timeout: float = DEFAULT_QUERY_TIMEOUT):
+    """
+    Run a Supabase query builder's blocking ``execute()`` behind the breaker
+
+    Fails fast with CircuitOpenError while upstream is unhealthy, and with
+    asyncio.TimeoutError when the call takes longer than ``timeout`` (the
+    worker thread is abandoned, the request is not held).
+    """
+    if not breaker.allow():
+        raise CircuitOpenError(f"{breaker.name} is unavailable")
+    try:
+        result = await asyncio.wait_for(run_in_threadpool(_execute, query), timeout)
+    except Exception as e:
+        record_outcome(breaker, e)
+        raise
+    breaker.record_success()
+    return result
+
+
+class OperationPolicy:
+    """
+    How one class of query is run
+
+    Args:
+        timeout: Seconds before an attempt is abandoned
+        retries: Extra attempts after a transient failure (reads only; writes
+            are not idempotent)
+        hedge: Send a duplicate request when the first is slower than the
+            operation's recent p95
+    """
+
+    def __init__(self, timeout: float, retries: int = 0, hedge: bool = False):
+        self.timeout = timeout
+        self.retries = retries
+        self.hedge = hedge
+
+
+def policies_from_env() -> Dict[str, OperationPolicy]:
+    return {
+        "read": OperationPolicy(
+            timeout=float(os.getenv("DB_READ_TIMEOUT_SECONDS", "3")),
+            retries=int(os.getenv("DB_READ_RETRIES", "2")),
+            hedge=os.getenv("DB_HEDGE_READS", "true").lower() == "true",
+        ),
+        "write": OperationPolicy(timeout=float(os.getenv("DB_WRITE_TIMEOUT_SECONDS", "5"))),
+    }
+
+
+# Histogram bucket upper bounds in milliseconds
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Hedging needs this many samples of an operation before it trusts the p95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 0.02
+
+# Hedged requests may add at most this fraction of extra load
+HEDGE_BUDGET = 0.1
+
+RETRY_BASE_DELAY = 0.05
+
+
+class LatencyHistogram:
+    """Bucket counts plus a sliding window of samples for percentiles"""
+
+    def __init__(self, window: int = 2000):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        milliseconds = seconds * 1000
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, milliseconds)] += 1
+        self.samples.append(milliseconds)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+    def summary(self) -> dict:
+        labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        return {
+            "p50_ms": _round(self.percentile(0.5)),
+            "p95_ms": _round(self.percentile(0.95)),
+            "p99_ms": _round(self.percentile(0.99)),
+            "buckets": {label: count for label, count in zip(labels, self.buckets) if count},
+        }
+
+
+def _round(value):
+    return round(value, 1) if value is not None else None
+
+
+class _OperationStats:
+    def __init__(self):
+        # What callers saw, and what the first attempt alone took (the
+        # latency without hedging); the gap between them is what hedging saved
+        self.observed = LatencyHistogram()
+        self.primary = LatencyHistogram()
+        self.outcomes = defaultdict(int)
+
+
+class RequestPolicy:
+    """
+    Timeouts, retries and hedging for Supabase queries
+
+    ``read`` runs an idempotent query: each attempt is bounded by the read
+    timeout, transient failures are retried with full-jitter backoff, and if
+    the first request has not answered by the operation's recent p95 a
+    duplicate is sent and whichever answers first wins (within a budget of
+    HEDGE_BUDGET extra requests). ``write`` makes a single bounded attempt.
+    Every attempt goes through the circuit breaker.
+
+    Latencies are kept per operation name in two histograms, the latency
+    callers observed and the latency of the first attempt alone, so
+    ``stats`` shows how much of the tail the policy removed.
+    """
+
+    def __init__(self, breaker: CircuitBreaker, policies: Optional[Dict[str, OperationPolicy]] = None):
+        self.breaker = breaker
+        self.policies = policies or policies_from_env()
+        self.operations: Dict[str, _OperationStats] = defaultdict(_OperationStats)
+        self.requests = 0
+        self.hedges = 0
+
+    async def read(self, query, name: str):
+        return await self.run(query, name, "read")
+
+    async def write(self, query, name: str):
+        return await self.run(query, name, "write")
+
+    async def run(self, query, name: str, kind: str = "read"):
+        policy = self.policies[kind]
+        stats = self.operations[name]
+        started = time.monotonic()
+        for attempt in range(policy.retries + 1):
+            try:
+                result, outcome = await self._attempt(query, policy, stats)
+            except Exception as e:
+                if not is_transient(e) or isinstance(e, CircuitOpenError) or attempt == policy.retries:
+                    stats.outcomes["timeout" if isinstance(e, asyncio.TimeoutError) else "error"] += 1
+                    raise
+                await asyncio.sleep(random.uniform(0, RETRY_BASE_DELAY * 2 ** attempt))
+                continue
+            stats.observed.record(time.monotonic() - started)
+            stats.outcomes[outcome if attempt == 0 else "retried"] += 1
+            return result
+
+    def _hedge_delay(self, policy: OperationPolicy, stats: _OperationStats) -> Optional[float]:
+        if not policy.hedge or len(stats.primary) < HEDGE_MIN_SAMPLES:
+            return None
+        if self.hedges >= HEDGE_BUDGET * max(self.requests, 1):
+            return None
+        delay = max(stats.primary.percentile(0.95) / 1000, HEDGE_MIN_DELAY)
+        return delay if delay < policy.timeout else None
+
+    async def _attempt(self, query, policy: OperationPolicy, stats: _OperationStats):
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.breaker.name} is unavailable")
+        self.requests += 1
+        started = time.monotonic()
+        primary = self._launch(query)
+
+        def record_primary(task):
+            if not task.cancelled() and task.exception() is None:
+                stats.primary.record(time.monotonic() - started)
+
+        primary.add_done_callback(record_primary)
+        racing = {primary}
+
+        hedge_delay = self._hedge_delay(policy, stats)
+        if hedge_delay is not None:
+            done, _ = await asyncio.wait(racing, timeout=hedge_delay)
+            if not done and self.breaker.allow():
+                self.hedges += 1
+                racing.add(self._launch(query))
+
+        error = None
+        while racing:
+            remaining = policy.timeout - (time.monotonic() - started)
+            done, racing = await asyncio.wait(racing, timeout=max(remaining, 0), return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                self.breaker.record_failure()
+                raise asyncio.TimeoutError()
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), "primary" if task is primary else "hedge_won"
+                error = task.exception()
+        raise error
+
+    def _launch(self, query) -> asyncio.Future:
+        """Run one request; the loser of a hedge race is left to finish in its thread"""
+        async def call():
+            try:
+                result = await run_in_threadpool(_execute, query)
+            except Exception as e:
+                record_outcome(self.breaker, e)
+                raise
+            self.breaker.record_success()
+            return result
+
+        task = asyncio.ensure_future(call())
+        # Abandoned attempts must not log "exception was never retrieved"
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return task
+
+    def stats(self) -> dict:
+        operations = {}
+        for name, stats in sorted(self.operations.items()):
+            primary_p99, observed_p99 = stats.primary.percentile(0.99), stats.observed.percentile(0.99)
+            operations[name] = {
+                "outcomes": dict(stats.outcomes),
+                "observed": stats.observed.summary(),
+                "first_attempt": stats.primary.summary(),
+                "p99_saved_ms": _round(primary_p99 - observed_p99) if primary_p99 is not None and observed_p99 is not None else None,
+            }
+        return {
+            "requests": self.requests,
+            "hedged": self.hedges,
+            "hedge_rate": round(self.hedges / self.requests, 3) if self.requests else 0.0,
+            "circuit": self.breaker.stats(),
+            "operations": operations,
+        }
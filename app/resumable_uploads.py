@@ -0,0 +1,250 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Optional
+
+from app.direct_uploads import MAX_UPLOAD_SIZE, UploadError
+
+# Chunks are small enough to survive a flaky cellular link and to hold in memory
+CHUNK_SIZE = 256 * 1024
+
+# Uploads that have not been touched for this long are garbage-collected
+UPLOAD_TTL_SECONDS = 24 * 3600
+
+_UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class OffsetMismatch(UploadError):
+    """Raised when a chunk is sent for an offset the server is not at"""
+
+    def __init__(self, offset: int):
+        super().__init__(f"Expected chunk at offset {offset}")
+        self.offset = offset
+
+
+class ResumableUploadStore:
+    """
+    Resumable uploads spooled to local disk.
+
+    The client creates an upload, then sends fixed-size chunks with the
+    offset they start at and a SHA-256 of the chunk. The server appends each
+    verified chunk to ``<id>.part`` and records the new offset in
+    ``<id>.json``, so an interrupted client asks for the offset and resumes
+    from there (also across API restarts). The whole-file SHA-256 is
+    updated as each chunk is written, so a completed upload is verified and
+    stored under its content hash without reading the file again (after a
+    restart the digest is rebuilt once from the chunks on disk).
+    """
+
+    def __init__(self, spool_dir: str, chunk_size: int = CHUNK_SIZE, max_size: int = MAX_UPLOAD_SIZE, ttl_seconds: float = UPLOAD_TTL_SECONDS):
+        self.spool_dir = spool_dir
+        self.chunk_size = chunk_size
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        # upload_id -> running SHA-256 of the bytes written so far
+        self._hashes = {}
+        os.makedirs(spool_dir, exist_ok=True)
+
+    def _paths(self, upload_id: str):
+        if not _UPLOAD_ID.match(upload_id or ""):
+            raise UploadError("Unknown upload")
+        base = os.path.join(self.spool_dir, upload_id)
+        return f"{base}.json", f"{base}.part"
+
+    def _lock(self, upload_id: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def _load(self, upload_id: str) -> dict:
+        meta_path, _ = self._paths(upload_id)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            raise UploadError("Unknown upload")
+
+    def _save(self, meta: dict):
+        meta_path, _ = self._paths(meta["upload_id"])
+        meta["updated_at"] = time.time()
+        temp_path = f"{meta_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(meta, file)
+        os.replace(temp_path, meta_path)
+
+    def create(self, filename: str, content_type: str, total_size: int, sha256: Optional[str] = None) -> dict:
+        """
+        Start a resumable upload
+
+        Args:
+            filename: Original filename
+            content_type: MIME type of the file
+            total_size: File size in bytes
+            sha256: Optional hex SHA-256 of the whole file, checked on completion
+
+        Returns:
+            dict: upload state including upload_id, chunk_size and offset
+        """
+        if not (content_type or "").startswith("image/"):
+            raise UploadError("File must be an image")
+        if total_size <= 0 or total_size > self.max_size:
+            raise UploadError("File too large" if total_size > 0 else "File is empty")
+
+        meta = {
+            "upload_id": uuid.uuid4().hex,
+            "filename": filename,
+            "content_type": content_type,
+            "total_size": total_size,
+            "sha256": sha256.lower() if sha256 else None,
+            "chunk_size": self.chunk_size,
+            "offset": 0,
+            "complete": False,
+            "created_at": time.time(),
+        }
+        _, part_path = self._paths(meta["upload_id"])
+        open(part_path, "wb").close()
+        self._save(meta)
+        return self._public(meta)
+
+    @staticmethod
+    def _public(meta: dict) -> dict:
+        return {key: meta[key] for key in ("upload_id", "filename", "content_type", "total_size", "chunk_size", "offset", "complete")}
+
+    def status(self, upload_id: str) -> dict:
+        return self._public(self._load(upload_id))
+
+    def write_chunk(self, upload_id: str, offset: int, data: bytes, checksum: str) -> dict:
+        """
+        Append one chunk at ``offset``
+
+        A chunk re-sent for the range that was just written (e.g. because the
+        response was lost) is accepted as long as its checksum matches.
+
+        Raises:
+            OffsetMismatch: if the offset is not where the upload currently is
+            UploadError: on checksum or size errors
+        """
+        if hashlib.sha256(data).hexdigest() != (checksum or "").lower():
+            raise UploadError("Chunk checksum mismatch")
+
+        with self._lock(upload_id):
+            meta = self._load(upload_id)
+            _, part_path = self._paths(upload_id)
+            # Checked first so a re-sent final chunk is acknowledged, not refused
+            if offset != meta["offset"] and offset + len(data) == meta["offset"]:
+                if self._range_digest(part_path, offset, len(data)) == checksum.lower():
+                    return self._public(meta)
+            if meta["complete"]:
+                raise UploadError("Upload already complete")
+            if offset != meta["offset"]:
+                raise OffsetMismatch(meta["offset"])
+
+            remaining = meta["total_size"] - offset
+            if len(data) > remaining:
+                raise UploadError("Chunk exceeds declared file size")
+            if len(data) != meta["chunk_size"] and len(data) != remaining:
+                raise UploadError(f"Chunks must be {meta['chunk_size']} bytes except the last one")
+
+            running = self._running_hash(upload_id, part_path, offset)
+            with open(part_path, "r+b") as file:
+                file.seek(offset)
+                file.write(data)
+                file.truncate()
+                file.flush()
+                os.fsync(file.fileno())
+            running[0].update(data)
+            running[1] += len(data)
+
+            meta["offset"] = offset + len(data)
+            if meta["offset"] == meta["total_size"]:
+                self._finish(meta, part_path)
+            self._save(meta)
+            return self._public(meta)
+
+    @staticmethod
+    def _range_digest(part_path: str, offset: int, length: int) -> str:
+        with open(part_path, "rb") as file:
+            file.seek(offset)
+            return hashlib.sha256(file.read(length)).hexdigest()
+
+    def _running_hash(self, upload_id: str, part_path: str, offset: int) -> list:
+        """[SHA-256 of the first ``offset`` bytes, offset], kept in memory between chunks"""
+        running = self._hashes.get(upload_id)
+        if running is None or running[1] != offset:
+            # First chunk, or the process restarted mid-upload
+            digest = hashlib.sha256()
+            with open(part_path, "rb") as file:
+                remaining = offset
+                while remaining:
+                    block = file.read(min(self.chunk_size, remaining))
+                    if not block:
+                        break
+                    digest.update(block)
+                    remaining -= len(block)
+            running = self._hashes[upload_id] = [digest, offset]
+        return running
+
+    def _finish(self, meta: dict, part_path: str):
+        digest = self._hashes.pop(meta["upload_id"])[0].hexdigest()
+        if meta["sha256"] and digest != meta["sha256"]:
+            # Start over; the assembled file does not match what the client sent
+            meta["offset"] = 0
+            with open(part_path, "wb"):
+                pass
+            self._save(meta)
+            raise UploadError("File checksum mismatch; upload restarted")
+        meta["digest"] = digest
+        meta["complete"] = True
+
+    def completed_file(self, upload_id: str) -> dict:
+        """Path and metadata of a finished upload"""
+        meta = self._load(upload_id)
+        if not meta["complete"]:
+            raise UploadError("Upload is not complete")
+        _, part_path = self._paths(upload_id)
+        # Uploads completed before digests were recorded
+        digest = meta.get("digest") or self._running_hash(upload_id, part_path, meta["total_size"])[0].hexdigest()
+        return {**self._public(meta), "path": part_path, "digest": digest}
+
+    def delete(self, upload_id: str):
+        for path in self._paths(upload_id):
+            if os.path.exists(path):
+                os.remove(path)
+        with self._locks_guard:
+            self._locks.pop(upload_id, None)
+        self._hashes.pop(upload_id, None)
+
+    def collect_garbage(self, now: Optional[float] = None) -> int:
+        """
+        Remove uploads that have not been touched within the TTL
+
+        Returns:
+            int: Number of uploads removed
+        """
+        now = time.time() if now is None else now
+        removed = 0
+        for entry in os.listdir(self.spool_dir):
+            upload_id, extension = os.path.splitext(entry)
+            if extension != ".json" or not _UPLOAD_ID.match(upload_id):
+                continue
+            try:
+                meta = self._load(upload_id)
+            except (UploadError, ValueError):
+                continue
+            if now - meta.get("updated_at", 0) > self.ttl_seconds:
+                self.delete(upload_id)
+                removed += 1
+        # Orphaned chunk files without metadata
+        for entry in os.listdir(self.spool_dir):
+            upload_id, extension = os.path.splitext(entry)
+            path = os.path.join(self.spool_dir, entry)
+            if extension == ".part" and not os.path.exists(os.path.join(self.spool_dir, f"{upload_id}.json")):
+                if now - os.path.getmtime(path) > self.ttl_seconds:
+                    os.remove(path)
+                    removed += 1
+        return removed
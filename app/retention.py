@@ -0,0 +1,89 @@
+import os
+from datetime import datetime, timedelta
+
+# Table -> archive function (see database_setup.sql) and how long rows stay hot
+RETENTION_POLICIES = {
+    "sos_alerts": {
+        "function": "archive_sos_alerts",
+        "days": int(os.getenv("RETENTION_SOS_DAYS", "7")),
+    },
+    # Whole clusters, once the canonical incident has not changed for this long
+    "incidents": {
+        "function": "archive_incidents",
+        "days": int(os.getenv("RETENTION_INCIDENT_DAYS", "30")),
+    },
+    "safe_status": {
+        "function": "archive_safe_status",
+        "days": int(os.getenv("RETENTION_SAFE_STATUS_DAYS", "14")),
+    },
+}
+
+# Views that union the hot table with its archive
+HISTORY_VIEWS = {
+    "sos_alerts": "sos_alerts_history",
+    "incidents": "incidents_history",
+    "safe_status": "safe_status_history",
+}
+
+
+def source_table(table: str, include_history: bool = False) -> str:
+    """Name of the relation to read: the hot table, or its history view"""
+    if include_history:
+        return HISTORY_VIEWS.get(table, table)
+    return table
+
+
+class RetentionJob:
+    """
+    Moves resolved and aged rows from the hot tables into their archives.
+
+    Each archive function moves one bounded batch per call inside the
+    database, so the job never holds rows in the API process and never
+    holds long locks; it simply repeats until a batch comes back short.
+    """
+
+    def __init__(self, supabase, policies: dict = None, batch_size: int = 500, max_batches: int = 200):
+        self.supabase = supabase
+        self.policies = policies or RETENTION_POLICIES
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+
+    def ensure_partitions(self, months_ahead: int = 2) -> int:
+        """Create upcoming monthly archive partitions"""
+        result = self.supabase.rpc("ensure_archive_partitions", {"months_back": 1, "months_ahead": months_ahead}).execute()
+        return result.data or 0
+
+    def archive_table(self, table: str) -> int:
+        """
+        Archive one table's eligible rows in batches
+
+        Returns:
+            int: Number of rows moved
+        """
+        policy = self.policies[table]
+        cutoff = (datetime.utcnow() - timedelta(days=policy["days"])).isoformat() + "Z"
+        total = 0
+        for _ in range(self.max_batches):
+            result = self.supabase.rpc(policy["function"], {"cutoff": cutoff, "batch_size": self.batch_size}).execute()
+            moved = result.data or 0
+            total += moved
+            if moved < self.batch_size:
+                break
+        return total
+
+    def run_once(self) -> dict:
+        """
+        Run every retention policy once
+
+        Returns:
+            dict: Rows moved per table
+        """
+        self.ensure_partitions()
+        moved = {}
+        for table in self.policies:
+            try:
+                moved[table] = self.archive_table(table)
+            except Exception as e:
+                print(f"Error archiving {table}: {e}")
+                moved[table] = 0
+        return moved
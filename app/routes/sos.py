@@ -54,20 +54,14 @@ async def get_nearby_sos_alerts(latitude: float, longitude: float, radius_km: fl
     """Get nearby SOS alerts within specified radius"""
     supabase = get_supabase_client()
     
-    # For simplicity, we'll get all active alerts and filter by distance in the application
-    # In production, you'd want to use PostGIS or similar for proper geospatial queries
-    result = supabase.table("sos_alerts").select("*").eq("status", "active").execute()
-    
-    # Basic distance filtering (this should be done in the database for better performance)
-    nearby_alerts = []
-    for alert in result.data:
-        # Simple distance calculation (you may want to use a proper geospatial library)
-        lat_diff = abs(alert["latitude"] - latitude)
-        lon_diff = abs(alert["longitude"] - longitude)
-        if lat_diff <= radius_km/111 and lon_diff <= radius_km/111:  # Rough approximation
-            nearby_alerts.append(alert)
-    
-    return nearby_alerts
+    # Radius search runs in PostGIS against the GiST index on geog (migrations/0004)
+    result = supabase.rpc("sos_alerts_within_radius", {
+        "lat": latitude,
+        "lon": longitude,
+        "radius_m": radius_km * 1000
+    }).execute()
+    
+    return result.data
 
 @router.post("/safe")
 async def mark_safe(safe_status: SafeStatusUpdate, current_user: dict = Depends(get_current_user)):
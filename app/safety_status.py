@@ -0,0 +1,165 @@
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from app.dedup import parse_timestamp
+
+SAFE = "safe"
+SOS = "sos"
+UNKNOWN = "unknown"
+
+
+class _UserStatus:
+    __slots__ = ("user_id", "user_name", "city", "safe", "sos")
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.user_name = None
+        self.city = None
+        # Latest safe mark and currently active SOS alert: (timestamp, row) or None
+        self.safe = None
+        self.sos = None
+
+    @property
+    def state(self) -> str:
+        if self.sos and (not self.safe or self.sos[0] >= self.safe[0]):
+            return SOS
+        if self.safe:
+            return SAFE
+        return UNKNOWN
+
+    def as_dict(self) -> dict:
+        state = self.state
+        latest = self.sos if state == SOS else self.safe
+        row = latest[1] if latest else {}
+        return {
+            "user_id": self.user_id,
+            "user_name": self.user_name or row.get("user_name"),
+            "city": self.city,
+            "status": state,
+            "latitude": row.get("latitude"),
+            "longitude": row.get("longitude"),
+            "message": row.get("message") if state == SAFE else row.get("location_description"),
+            "alert_id": row.get("id") if state == SOS else None,
+            "updated_at": row.get("created_at"),
+        }
+
+
+class SafetyStatusIndex:
+    """
+    Latest safety status per user, combining safe marks and active SOS alerts.
+
+    ``safe_status`` is append-only, so "is this person safe?" otherwise means
+    finding the newest row per user. The index keeps just that newest mark
+    and any active SOS per user, plus a city -> users map, so a family or a
+    whole city is answered from memory. It is warmed from the database at
+    startup and updated on every safe/SOS write.
+    """
+
+    def __init__(self):
+        self.users: Dict[str, _UserStatus] = {}
+        self.cities: Dict[str, set] = defaultdict(set)
+
+    @staticmethod
+    def _city_key(city: Optional[str]) -> Optional[str]:
+        return city.strip().lower() if city and city.strip() else None
+
+    def _entry(self, user_id: str) -> _UserStatus:
+        entry = self.users.get(user_id)
+        if entry is None:
+            entry = self.users[user_id] = _UserStatus(user_id)
+        return entry
+
+    @staticmethod
+    def _timestamp(row: dict) -> float:
+        created_at = row.get("created_at")
+        return parse_timestamp(created_at) if created_at else time.time()
+
+    def set_user(self, user_id: str, city: Optional[str] = None, user_name: Optional[str] = None):
+        """Record a user's home city (and display name)"""
+        entry = self._entry(user_id)
+        old_key, new_key = self._city_key(entry.city), self._city_key(city)
+        if old_key != new_key:
+            if old_key:
+                self.cities[old_key].discard(user_id)
+                if not self.cities[old_key]:
+                    del self.cities[old_key]
+            if new_key:
+                self.cities[new_key].add(user_id)
+        entry.city = city
+        if user_name:
+            entry.user_name = user_name
+
+    def record_safe(self, row: dict):
+        """Apply a safe_status row"""
+        entry = self._entry(row["user_id"])
+        timestamp = self._timestamp(row)
+        if entry.safe is None or timestamp >= entry.safe[0]:
+            entry.safe = (timestamp, row)
+
+    def record_sos(self, row: dict):
+        """Apply an sos_alerts row (active alerts set the status, anything else clears it)"""
+        entry = self._entry(row["user_id"])
+        if row.get("status", "active") == "active":
+            timestamp = self._timestamp(row)
+            if entry.sos is None or timestamp >= entry.sos[0]:
+                entry.sos = (timestamp, row)
+        elif entry.sos and entry.sos[1].get("id") == row.get("id"):
+            entry.sos = None
+
+    def resolve_sos(self, user_id: str):
+        """Clear a user's active SOS"""
+        entry = self.users.get(user_id)
+        if entry is not None:
+            entry.sos = None
+
+    def get_many(self, user_ids: Iterable[str]) -> List[dict]:
+        """Status of each requested user (users with no record are reported as unknown)"""
+        results = []
+        for user_id in user_ids:
+            entry = self.users.get(user_id)
+            results.append(entry.as_dict() if entry else _UserStatus(user_id).as_dict())
+        return results
+
+    @staticmethod
+    def summarize(statuses: List[dict]) -> dict:
+        counts = {SAFE: 0, SOS: 0, UNKNOWN: 0}
+        for status in statuses:
+            counts[status["status"]] += 1
+        return counts
+
+    def by_city(self, city: str) -> List[dict]:
+        """Status of every user whose home city is ``city``"""
+        return self.get_many(sorted(self.cities.get(self._city_key(city), ())))
+
+    def warm(self, supabase, page_size: int = 1000):
+        """
+        Load users, latest safe marks and active SOS alerts from the database
+
+        Safe marks are read through ``latest_safe_status`` (migration 0014),
+        one row per user, and every table is paged by key rather than offset.
+        """
+        def pages(table, columns, key, **filters):
+            last = None
+            while True:
+                query = supabase.table(table).select(columns)
+                for column, value in filters.items():
+                    query = query.eq(column, value)
+                if last is not None:
+                    query = query.gt(key, last)
+                rows = query.order(key).limit(page_size).execute().data or []
+                yield rows
+                if len(rows) < page_size:
+                    return
+                last = rows[-1][key]
+
+        for rows in pages("users", "id, first_name, last_name, city", "id"):
+            for row in rows:
+                self.set_user(row["id"], row.get("city"), f"{row.get('first_name', '')} {row.get('last_name', '')}".strip())
+        for rows in pages("latest_safe_status", "id, user_id, user_name, latitude, longitude, message, created_at", "user_id"):
+            for row in rows:
+                self.record_safe(row)
+        for rows in pages("sos_alerts", "id, user_id, user_name, latitude, longitude, location_description, emergency_type, status, created_at", "id", status="active"):
+            for row in rows:
+                self.record_sos(row)
+        print(f"Safety status index loaded for {len(self.users)} users")
@@ -0,0 +1,100 @@
+import asyncio
+import json
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Optional
+
+# Bounds the shared upstream call; above the read policy's worst case
+# (3 attempts of DB_READ_TIMEOUT_SECONDS plus backoff) by default
+DEFAULT_FLIGHT_TIMEOUT = 10.0
+
+
+def parse_timeouts(text: Optional[str]) -> Dict[str, float]:
+    """'sos_alerts:4, community_feed:8' -> {operation name: seconds}"""
+    timeouts = {}
+    for item in (text or "").split(","):
+        if ":" in item:
+            name, seconds = item.rsplit(":", 1)
+            timeouts[name.strip()] = float(seconds)
+    return timeouts
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 1
+
+
+class SingleFlight:
+    """
+    Collapses concurrent identical reads onto one upstream call.
+
+    The first caller for a key starts the call; callers arriving while it is
+    in flight wait for the same result instead of issuing their own. The
+    result is serialized to JSON once and every caller gets the same bytes,
+    so no caller can mutate what the others return. Errors (and timeouts)
+    are shared too; the next call after a flight finishes starts a new one.
+
+    Each key's flight is bounded by the timeout configured for its operation
+    name (``timeouts``), falling back to ``timeout``. A caller that goes
+    away does not cancel the call for the others.
+    """
+
+    def __init__(self, timeout: float = DEFAULT_FLIGHT_TIMEOUT, timeouts: Optional[Dict[str, float]] = None):
+        self.timeout = timeout
+        self.timeouts = timeouts or {}
+        self.flights: Dict[str, _Flight] = {}
+        self.counters: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    async def do(self, name: str, key: str, build: Callable[[], Awaitable[dict]]) -> bytes:
+        """
+        JSON body for ``key``, shared with concurrent callers of the same key
+
+        Args:
+            name: Operation name, for timeouts and metrics
+            key: Identifies identical reads (operation and parameters)
+            build: Coroutine function returning the response data
+        """
+        counters = self.counters[name]
+        counters["calls"] += 1
+        flight = self.flights.get(key)
+        if flight is not None:
+            flight.waiters += 1
+            counters["collapsed"] += 1
+            counters["max_waiters"] = max(counters["max_waiters"], flight.waiters)
+        else:
+            task = asyncio.ensure_future(self._call(name, key, build))
+            # If every caller went away, nobody is left to retrieve an error
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            flight = self.flights[key] = _Flight(task)
+            counters["upstream"] += 1
+        return await asyncio.shield(flight.task)
+
+    async def _call(self, name: str, key: str, build: Callable[[], Awaitable[dict]]) -> bytes:
+        counters = self.counters[name]
+        try:
+            data = await asyncio.wait_for(build(), self.timeouts.get(name, self.timeout))
+            return json.dumps(data, default=str).encode("utf-8")
+        except asyncio.TimeoutError:
+            counters["timeouts"] += 1
+            raise
+        except Exception:
+            counters["errors"] += 1
+            raise
+        finally:
+            self.flights.pop(key, None)
+
+    def stats(self) -> dict:
+        operations = {}
+        for name, counters in sorted(self.counters.items()):
+            calls = counters["calls"]
+            operations[name] = {
+                **counters,
+                "collapse_rate": round(counters["collapsed"] / calls, 3) if calls else 0.0,
+            }
+        return {
+            "in_flight": len(self.flights),
+            "collapsed": sum(counters["collapsed"] for counters in self.counters.values()),
+            "operations": operations,
+        }
@@ -0,0 +1,261 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+import time
+from typing import Dict, Optional
+
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    # Brotli is optional; gzip is always available
+    brotli = None
+
+# Only text-like assets benefit from compression (PNG/JPEG are already compressed)
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/javascript",
+    "application/json",
+    "image/svg+xml",
+)
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# Matches src="/static/x" / href="static/x" references inside HTML
+ASSET_REFERENCE = re.compile(r'(src|href)=(["\'])/?static/([^"\'?#]+)\2')
+
+
+class StaticAsset:
+    """A single static file held in memory with its precompressed variants"""
+
+    __slots__ = ("name", "content_type", "body", "gzip_body", "br_body", "digest", "mtime", "size")
+
+    def __init__(self, name: str, body: bytes, content_type: str, mtime: float, size: int):
+        self.name = name
+        self.body = body
+        self.content_type = content_type
+        self.mtime = mtime
+        self.size = size
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        self.gzip_body = None
+        self.br_body = None
+
+        if content_type.startswith(COMPRESSIBLE_TYPES) and len(body) >= 512:
+            gzipped = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(gzipped) < len(body):
+                self.gzip_body = gzipped
+            if brotli is not None:
+                brotlied = brotli.compress(body, quality=11)
+                if len(brotlied) < len(body):
+                    self.br_body = brotlied
+
+    def etag(self, encoding: Optional[str] = None) -> str:
+        """Entity tag of one variant; each encoding is a different representation"""
+        return f'"{self.digest}-{encoding}"' if encoding else f'"{self.digest}"'
+
+    def variant(self, accept_encoding: str):
+        """Pick the best precompressed body for an Accept-Encoding header"""
+        accepted = _parse_accept_encoding(accept_encoding)
+        if self.br_body is not None and "br" in accepted:
+            return self.br_body, "br"
+        if self.gzip_body is not None and "gzip" in accepted:
+            return self.gzip_body, "gzip"
+        return self.body, None
+
+
+def _parse_accept_encoding(header: str) -> set:
+    """Return the set of encodings the client accepts (ignoring q=0 entries)"""
+    accepted = set()
+    for part in (header or "").split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        if params.replace(" ", "").lower() in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(token)
+    return accepted
+
+
+class StaticAssetCache:
+    """
+    Serves the static directory from memory.
+
+    Every file is read once, hashed and precompressed (gzip and, when the
+    brotli package is installed, br). HTML pages are rewritten so that
+    references to other assets point at fingerprinted URLs such as
+    ``/static/main.3f9a1c2b4d5e6f70.js``, which are served with immutable
+    cache headers. In reload mode the directory is re-scanned (at most once
+    per ``reload_interval`` seconds) and changed files are picked up.
+    """
+
+    def __init__(self, directory: str, reload: bool = False, reload_interval: float = 1.0):
+        self.directory = directory
+        self.reload = reload
+        self.reload_interval = reload_interval
+        self.assets: Dict[str, StaticAsset] = {}
+        self._sources: Dict[str, StaticAsset] = {}
+        self._last_scan = 0.0
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self) -> bool:
+        """
+        Re-scan the directory and reload changed files
+
+        Returns:
+            bool: True if anything changed
+        """
+        with self._lock:
+            self._last_scan = time.monotonic()
+            found = {}
+            for root, _, files in os.walk(self.directory):
+                for filename in files:
+                    full_path = os.path.join(root, filename)
+                    name = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+                    try:
+                        stat = os.stat(full_path)
+                    except OSError:
+                        continue
+                    found[name] = (full_path, stat.st_mtime, stat.st_size)
+
+            changed = set(found) != set(self._sources)
+            sources = {}
+            for name, (full_path, mtime, size) in found.items():
+                current = self._sources.get(name)
+                if current and current.mtime == mtime and current.size == size:
+                    sources[name] = current
+                    continue
+                with open(full_path, "rb") as file:
+                    body = file.read()
+                content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                if content_type.startswith("text/") or content_type == "application/javascript":
+                    content_type += "; charset=utf-8"
+                sources[name] = StaticAsset(name, body, content_type, mtime, size)
+                if not current or current.digest != sources[name].digest:
+                    changed = True
+
+            if not changed and self.assets:
+                return False
+
+            # HTML is rewritten last so it can reference the new asset hashes
+            assets = dict(sources)
+            for name, asset in sources.items():
+                if asset.content_type.startswith("text/html"):
+                    html = asset.body.decode("utf-8")
+                    rewritten = ASSET_REFERENCE.sub(lambda match: self._rewrite_reference(match, sources), html)
+                    assets[name] = StaticAsset(name, rewritten.encode("utf-8"), asset.content_type, asset.mtime, asset.size)
+
+            self._sources = sources
+            self.assets = assets
+            return True
+
+    @staticmethod
+    def _rewrite_reference(match, assets: Dict[str, StaticAsset]) -> str:
+        attribute, quote, name = match.groups()
+        asset = assets.get(name)
+        if asset is None or asset.content_type.startswith("text/html"):
+            return match.group(0)
+        return f"{attribute}={quote}{fingerprint_name(name, asset.digest, '/static/')}{quote}"
+
+    def _maybe_reload(self):
+        if self.reload and time.monotonic() - self._last_scan >= self.reload_interval:
+            self.refresh()
+
+    def url_for(self, name: str) -> str:
+        """Get the fingerprinted URL of an asset"""
+        self._maybe_reload()
+        asset = self.assets.get(name)
+        if asset is None:
+            return f"/static/{name}"
+        return fingerprint_name(name, asset.digest, "/static/")
+
+    def lookup(self, path: str):
+        """
+        Resolve a request path to an asset
+
+        Returns:
+            tuple: (asset, fingerprinted) or (None, False) if not found
+        """
+        self._maybe_reload()
+        asset = self.assets.get(path)
+        if asset is not None:
+            return asset, False
+
+        # Fingerprinted name: <stem>.<digest>.<ext>
+        directory, _, filename = path.rpartition("/")
+        parts = filename.split(".")
+        if len(parts) >= 3:
+            digest = parts[-2]
+            original = ".".join(parts[:-2] + parts[-1:])
+            if directory:
+                original = f"{directory}/{original}"
+            asset = self.assets.get(original)
+            if asset is not None:
+                # A stale hash still gets the current bytes, just not cached forever
+                return asset, asset.digest == digest
+        return None, False
+
+    def build_response(self, path: str, headers, method: str = "GET") -> Optional[Response]:
+        """
+        Build the HTTP response for a static asset
+
+        Args:
+            path: Asset path relative to the static directory
+            headers: Request headers (for Accept-Encoding and If-None-Match)
+            method: Request method; HEAD responses carry no body
+
+        Returns:
+            Response or None if the asset does not exist
+        """
+        asset, fingerprinted = self.lookup(path)
+        if asset is None:
+            return None
+
+        body, encoding = asset.variant(headers.get("accept-encoding", ""))
+        etag = asset.etag(encoding)
+        response_headers = {
+            "ETag": etag,
+            "Cache-Control": IMMUTABLE_CACHE_CONTROL if fingerprinted else REVALIDATE_CACHE_CONTROL,
+            "Vary": "Accept-Encoding",
+        }
+
+        if_none_match = headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=response_headers)
+
+        if encoding:
+            response_headers["Content-Encoding"] = encoding
+        if method == "HEAD":
+            # Same headers as the GET, including the length of the body it would send
+            response_headers["Content-Length"] = str(len(body))
+        return Response(
+            content=b"" if method == "HEAD" else body,
+            media_type=asset.content_type,
+            headers=response_headers,
+        )
+
+
+def fingerprint_name(name: str, digest: str, prefix: str = "") -> str:
+    """Insert a content digest before the file extension: main.js -> main.<digest>.js"""
+    stem, dot, extension = name.rpartition(".")
+    if not dot:
+        return f"{prefix}{name}.{digest}"
+    return f"{prefix}{stem}.{digest}.{extension}"
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag.strip('"') == etag.strip('"'):
+            return True
+    return False
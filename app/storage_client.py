@@ -0,0 +1,110 @@
+import asyncio
+from typing import List, Optional
+from urllib.parse import quote
+
+import httpx
+
+# At most this many storage uploads in flight across the whole process
+GLOBAL_UPLOAD_CONCURRENCY = 16
+
+# ...and per request (see upload_images_to_supabase), so one report with many photos cannot starve the rest
+PER_REQUEST_UPLOAD_CONCURRENCY = 4
+
+# Photos accepted on a single report
+MAX_IMAGES_PER_REPORT = 6
+
+
+def public_object_url(supabase_url: str, bucket: str, path: str) -> str:
+    """Public URL of an object in a public bucket, built without a storage round trip"""
+    return f"{supabase_url.rstrip('/')}/storage/v1/object/public/{bucket}/{quote(path)}"
+
+
+class PooledStorageClient:
+    """
+    Async Supabase Storage client sharing one keep-alive connection pool.
+
+    Uploads go straight to the Storage REST API over a long-lived
+    ``httpx.AsyncClient`` instead of the blocking supabase-py call per file,
+    and run concurrently under a process-wide semaphore; callers storing
+    several files for one request add ``PER_REQUEST_UPLOAD_CONCURRENCY``.
+    """
+
+    def __init__(
+        self,
+        supabase_url: str,
+        service_key: str,
+        global_concurrency: int = GLOBAL_UPLOAD_CONCURRENCY,
+        timeout: float = 30.0,
+    ):
+        self.supabase_url = supabase_url.rstrip("/")
+        self.storage_url = f"{self.supabase_url}/storage/v1"
+        self.service_key = service_key
+        self.global_concurrency = global_concurrency
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created lazily so it binds to the running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.storage_url,
+                headers={"Authorization": f"Bearer {self.service_key}", "apikey": self.service_key},
+                limits=httpx.Limits(
+                    max_connections=self.global_concurrency,
+                    max_keepalive_connections=self.global_concurrency,
+                    keepalive_expiry=60,
+                ),
+                timeout=self.timeout,
+            )
+            self._semaphore = asyncio.Semaphore(self.global_concurrency)
+        return self._client
+
+    def public_url(self, bucket: str, path: str) -> str:
+        return public_object_url(self.supabase_url, bucket, path)
+
+    async def upload(self, bucket: str, path: str, content, content_type: str = "application/octet-stream") -> str:
+        """
+        Upload one object and return its public URL
+
+        Args:
+            bucket: Storage bucket
+            path: Object path inside the bucket
+            content: Bytes, or an async iterator of byte chunks
+            content_type: MIME type stored with the object
+        """
+        client = self.client
+        async with self._semaphore:
+            response = await client.post(
+                f"/object/{bucket}/{quote(path)}",
+                content=content,
+                headers={"Content-Type": content_type, "Cache-Control": "max-age=3600", "x-upsert": "false"},
+            )
+        if response.status_code >= 400:
+            raise Exception(f"Upload failed ({response.status_code}): {response.text}")
+        return self.public_url(bucket, path)
+
+    async def move(self, bucket: str, source: str, destination: str):
+        """Move an object inside a bucket without the bytes leaving storage"""
+        client = self.client
+        async with self._semaphore:
+            response = await client.post(
+                "/object/move",
+                json={"bucketId": bucket, "sourceKey": source, "destinationKey": destination},
+            )
+        if response.status_code >= 400:
+            raise Exception(f"Move failed ({response.status_code}): {response.text}")
+
+    async def remove(self, bucket: str, paths: List[str]):
+        """Delete objects from a bucket (paths that do not exist are ignored)"""
+        client = self.client
+        async with self._semaphore:
+            response = await client.request("DELETE", f"/object/{bucket}", json={"prefixes": paths})
+        if response.status_code >= 400 and response.status_code != 404:
+            raise Exception(f"Delete failed ({response.status_code}): {response.text}")
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
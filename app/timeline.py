@@ -0,0 +1,215 @@
+"""
+Per-user activity timeline: a user's incidents, missing-person reports,
+community posts, SOS alerts and safe marks, newest first.
+
+Each source is read by ``user_id`` in (created_at, id) descending order with
+keyset pagination, and the sources are merged lazily: all of them are asked
+concurrently for a small first batch, and a source is only read again when
+the merge has used up its batch. A page therefore costs about one round
+trip per source and reads little more than the rows it returns, even for a
+user with thousands of posts and a single SOS alert. The cursor names the
+last item returned, so the next page continues strictly after it however
+the sources interleave.
+"""
+import asyncio
+import base64
+import heapq
+import json
+import math
+from typing import Awaitable, Callable, List, Optional
+
+from app.dedup import parse_timestamp
+from app.retention import source_table
+
+DEFAULT_TIMELINE_LIMIT = 20
+MAX_TIMELINE_LIMIT = 100
+
+# First batch per source: enough for its fair share of a page and a bit
+MIN_FIRST_BATCH = 5
+
+
+def _text(value, length: int = 80) -> str:
+    value = (value or "").strip()
+    return value if len(value) <= length else value[:length - 1] + "…"
+
+
+# Item type -> table, and how to title its rows in the timeline
+TIMELINE_SOURCES = {
+    "incident": {
+        "table": "incidents",
+        "title": lambda row: f"Reported {row.get('incident_type') or 'an incident'} at {_text(row.get('location'), 60)}",
+    },
+    "missing_person": {
+        "table": "missing_persons",
+        "title": lambda row: f"Reported {row.get('name') or 'a person'} missing",
+    },
+    "community_post": {
+        "table": "community_posts",
+        "title": lambda row: f"Posted in {row.get('category') or 'community'}: {_text(row.get('message'))}",
+    },
+    "sos_alert": {
+        "table": "sos_alerts",
+        "title": lambda row: f"Sent an SOS ({row.get('emergency_type') or 'general'}) {_text(row.get('location_description'), 60)}",
+    },
+    "safe_mark": {
+        "table": "safe_status",
+        "title": lambda row: "Marked safe",
+    },
+}
+
+
+class TimelineError(ValueError):
+    """Bad cursor or unknown item type"""
+
+
+def encode_cursor(item: dict) -> str:
+    raw = json.dumps([item["created_at"], item["type"], str(item["id"])], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """(created_at, type, id) of the last item of the previous page"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, item_type, item_id = json.loads(raw)
+        parse_timestamp(created_at)
+    except (ValueError, TypeError):
+        raise TimelineError("Invalid timeline cursor")
+    return created_at, item_type, str(item_id)
+
+
+class _Source:
+    """One table's rows for the user, fetched in batches as the merge consumes them"""
+
+    def __init__(self, item_type: str, user_id: str, read: Callable[..., Awaitable], supabase, include_history: bool,
+                 after: Optional[tuple]):
+        self.type = item_type
+        self.spec = TIMELINE_SOURCES[item_type]
+        self.user_id = user_id
+        self.read = read
+        self.supabase = supabase
+        self.include_history = include_history
+        self.buffer: List[dict] = []
+        self.position = 0
+        self.exhausted = False
+        self.fetched = 0
+        self.round_trips = 0
+        # Where this source continues: strictly after its own last row, or
+        # for the first batch after the cursor in (created_at, type, id) order
+        self.after = after
+
+    def _keyset(self, query):
+        if self.after is None:
+            return query
+        created_at, item_type, item_id = self.after
+        if item_type == self.type:
+            return query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{item_id})')
+        if item_type > self.type:
+            # Ties at the cursor's timestamp sort after it in a smaller type
+            return query.lte("created_at", created_at)
+        return query.lt("created_at", created_at)
+
+    async def fetch(self, size: int):
+        query = self.supabase.table(source_table(self.spec["table"], self.include_history)).select("*").eq("user_id", self.user_id)
+        query = self._keyset(query).order("created_at", desc=True).order("id", desc=True).limit(size)
+        rows = (await self.read(query, f"timeline.{self.type}")).data or []
+        self.round_trips += 1
+        self.fetched += len(rows)
+        self.buffer, self.position = rows, 0
+        if len(rows) < size:
+            self.exhausted = True
+        if rows:
+            self.after = (rows[-1]["created_at"], self.type, str(rows[-1]["id"]))
+
+    async def next(self, refill: int) -> Optional[dict]:
+        if self.position >= len(self.buffer):
+            if self.exhausted:
+                return None
+            await self.fetch(refill)
+            if not self.buffer:
+                return None
+        row = self.buffer[self.position]
+        self.position += 1
+        return row
+
+
+class _Head:
+    """Heap entry ordering items newest first, ties by type then id (descending)"""
+    __slots__ = ("key", "row", "source")
+
+    def __init__(self, row: dict, source: _Source):
+        self.key = (parse_timestamp(row["created_at"]), source.type, str(row["id"]))
+        self.row = row
+        self.source = source
+
+    def __lt__(self, other: "_Head") -> bool:
+        return self.key > other.key
+
+
+async def build_timeline(
+    supabase,
+    read: Callable[..., Awaitable],
+    user_id: str,
+    limit: int = DEFAULT_TIMELINE_LIMIT,
+    cursor: Optional[str] = None,
+    types: Optional[List[str]] = None,
+    include_history: bool = False,
+) -> dict:
+    """
+    One page of a user's timeline
+
+    Args:
+        read: Runs a query, e.g. ``RequestPolicy.read`` (query, operation name)
+        limit: Items per page
+        cursor: ``next_cursor`` of the previous page
+        types: Only these item types (default all)
+        include_history: Also read archived SOS alerts, incidents and safe marks
+
+    Returns:
+        dict: items, next_cursor (None on the last page), and rows read per type
+    """
+    types = types or list(TIMELINE_SOURCES)
+    unknown = [item_type for item_type in types if item_type not in TIMELINE_SOURCES]
+    if unknown:
+        raise TimelineError(f"Unknown timeline types: {', '.join(unknown)}; choose from {', '.join(TIMELINE_SOURCES)}")
+    limit = max(1, min(limit, MAX_TIMELINE_LIMIT))
+    after = decode_cursor(cursor) if cursor else None
+
+    sources = [_Source(item_type, user_id, read, supabase, include_history, after) for item_type in types]
+    # One more than the page needs, to know whether there is a next page
+    wanted = limit + 1
+    first_batch = min(wanted, max(MIN_FIRST_BATCH, math.ceil(2 * wanted / len(sources))))
+    await asyncio.gather(*(source.fetch(first_batch) for source in sources))
+
+    heap = []
+    for source in sources:
+        row = await source.next(first_batch)
+        if row is not None:
+            heap.append(_Head(row, source))
+    heapq.heapify(heap)
+
+    items = []
+    while heap and len(items) < wanted:
+        head = heapq.heappop(heap)
+        items.append({
+            "type": head.source.type,
+            "id": head.row["id"],
+            "created_at": head.row["created_at"],
+            "title": head.source.spec["title"](head.row),
+            "record": head.row,
+        })
+        if len(items) < wanted:
+            # A refill only needs what is left of the page
+            row = await head.source.next(wanted - len(items))
+            if row is not None:
+                heapq.heappush(heap, _Head(row, head.source))
+
+    has_more = len(items) > limit
+    items = items[:limit]
+    return {
+        "items": items,
+        "count": len(items),
+        "next_cursor": encode_cursor(items[-1]) if has_more else None,
+        "rows_read": {source.type: source.fetched for source in sources},
+        "round_trips": sum(source.round_trips for source in sources),
+    }
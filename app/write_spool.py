@@ -0,0 +1,219 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.resilience import CircuitBreaker, CircuitOpenError, execute, is_permanent
+
+# How often queued writes are retried while upstream is down
+REPLAY_INTERVAL_SECONDS = 5.0
+REPLAY_BATCH_SIZE = 100
+
+
+class WriteSpool:
+    """
+    Durable FIFO of rows waiting to be written upstream, in a local SQLite file
+
+    Rows are keyed by their primary key, so accepting the same row twice
+    keeps one copy. Commits use synchronous=FULL: once ``add`` returns the
+    row survives a crash of the API process.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS spooled_writes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT NOT NULL,
+                row_id TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                accepted_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                failed INTEGER NOT NULL DEFAULT 0,
+                UNIQUE (table_name, row_id)
+            )
+            """
+        )
+
+    def add(self, table: str, row: dict) -> bool:
+        """Queue a row; False if it was already queued"""
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO spooled_writes (table_name, row_id, payload, accepted_at) VALUES (?, ?, ?, ?)",
+                (table, str(row["id"]), json.dumps(row, default=str), time.time()),
+            )
+            return cursor.rowcount == 1
+
+    def peek(self, limit: int = REPLAY_BATCH_SIZE, table: Optional[str] = None) -> List[tuple]:
+        """Oldest queued writes as (seq, table, row)"""
+        with self._lock:
+            if table:
+                rows = self._db.execute(
+                    "SELECT seq, table_name, payload FROM spooled_writes WHERE table_name = ? AND failed = 0 ORDER BY seq LIMIT ?", (table, limit)
+                ).fetchall()
+            else:
+                rows = self._db.execute("SELECT seq, table_name, payload FROM spooled_writes WHERE failed = 0 ORDER BY seq LIMIT ?", (limit,)).fetchall()
+        return [(seq, table_name, json.loads(payload)) for seq, table_name, payload in rows]
+
+    def remove(self, seq: int):
+        with self._lock:
+            self._db.execute("DELETE FROM spooled_writes WHERE seq = ?", (seq,))
+
+    def record_attempt(self, seq: int, error: str):
+        with self._lock:
+            self._db.execute("UPDATE spooled_writes SET attempts = attempts + 1, last_error = ? WHERE seq = ?", (error[:500], seq))
+
+    def mark_failed(self, seq: int, error: str):
+        """Set a write aside (kept for inspection) so it no longer blocks the queue"""
+        with self._lock:
+            self._db.execute("UPDATE spooled_writes SET failed = 1, attempts = attempts + 1, last_error = ? WHERE seq = ?", (error[:500], seq))
+
+    def depth(self, table: Optional[str] = None, failed: bool = False) -> int:
+        with self._lock:
+            if table:
+                return self._db.execute(
+                    "SELECT COUNT(*) FROM spooled_writes WHERE table_name = ? AND failed = ?", (table, int(failed))
+                ).fetchone()[0]
+            return self._db.execute("SELECT COUNT(*) FROM spooled_writes WHERE failed = ?", (int(failed),)).fetchone()[0]
+
+    def oldest_age(self) -> Optional[float]:
+        with self._lock:
+            row = self._db.execute("SELECT MIN(accepted_at) FROM spooled_writes WHERE failed = 0").fetchone()
+        return time.time() - row[0] if row and row[0] else None
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class CriticalWriter:
+    """
+    Inserts that must not be lost when Supabase is down (SOS alerts, safe marks)
+
+    ``insert`` tries upstream through the circuit breaker. If the call fails
+    for any reason other than upstream rejecting the row (``is_permanent``),
+    or earlier writes to the same table are still queued (so order is kept),
+    the row is put in the spool and the caller is told it was queued instead of failing. A
+    background task replays the spool oldest first once upstream accepts
+    requests again; rows carry their own id and created_at, and replay uses
+    an upsert that ignores existing ids, so a write that did reach the
+    database before its timeout is not duplicated.
+    """
+
+    def __init__(self, supabase, breaker: CircuitBreaker, spool: WriteSpool, timeout: float = 5.0,
+                 replay_interval: float = REPLAY_INTERVAL_SECONDS):
+        self.supabase = supabase
+        self.breaker = breaker
+        self.spool = spool
+        self.timeout = timeout
+        self.replay_interval = replay_interval
+        self.replayed = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def stamp(row: dict) -> dict:
+        """Give a row the created_at it was accepted at, so replay preserves it"""
+        row.setdefault("created_at", datetime.now(timezone.utc).isoformat())
+        return row
+
+    async def insert(self, table: str, row: dict) -> dict:
+        """
+        Insert a row (which must include its id) or queue it
+
+        Returns:
+            dict: row (as stored, or as accepted) and queued flag
+        """
+        self.stamp(row)
+        # SQLite calls (fsync on every commit) run in the threadpool, never on the loop
+        if not await run_in_threadpool(self.spool.depth, table):
+            try:
+                result = await execute(self.breaker, self.supabase.table(table).insert(row), self.timeout)
+                if result.data:
+                    return {"row": result.data[0], "queued": False}
+            except Exception as e:
+                # Only a write upstream has definitely rejected fails the
+                # request; anything ambiguous is kept and retried
+                if is_permanent(e):
+                    raise
+                print(f"Queueing {table} write {row['id']} locally: {e}")
+        await run_in_threadpool(self.spool.add, table, row)
+        return {"row": row, "queued": True}
+
+    async def pending(self, table: str) -> List[dict]:
+        """Rows accepted for ``table`` that have not reached the database yet"""
+        batch = await run_in_threadpool(self.spool.peek, 1000, table)
+        return [row for _, _, row in batch]
+
+    async def replay(self) -> int:
+        """
+        Push queued writes upstream in order, stopping at the first failure
+
+        Returns:
+            int: Writes replayed
+        """
+        replayed = 0
+        while True:
+            batch = await run_in_threadpool(self.spool.peek)
+            if not batch:
+                return replayed
+            for seq, table, row in batch:
+                query = self.supabase.table(table).upsert(row, on_conflict="id", ignore_duplicates=True)
+                try:
+                    await execute(self.breaker, query, self.timeout)
+                except CircuitOpenError:
+                    return replayed
+                except Exception as e:
+                    if not is_permanent(e):
+                        await run_in_threadpool(self.spool.record_attempt, seq, str(e))
+                        return replayed
+                    # A row upstream will never accept must not block the rest
+                    print(f"Setting aside queued {table} write {row.get('id')}: {e}")
+                    await run_in_threadpool(self.spool.mark_failed, seq, str(e))
+                    continue
+                await run_in_threadpool(self.spool.remove, seq)
+                replayed += 1
+                self.replayed += 1
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.replay_interval)
+            if not await run_in_threadpool(self.spool.depth):
+                continue
+            try:
+                replayed = await self.replay()
+                if replayed:
+                    print(f"Replayed {replayed} queued writes, {await run_in_threadpool(self.spool.depth)} still queued")
+            except Exception as e:
+                print(f"Error replaying queued writes: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _spool_stats(self) -> dict:
+        oldest = self.spool.oldest_age()
+        return {
+            "queued_writes": self.spool.depth(),
+            "failed_writes": self.spool.depth(failed=True),
+            "oldest_queued_seconds": round(oldest, 1) if oldest is not None else None,
+        }
+
+    async def stats(self) -> dict:
+        spooled = await run_in_threadpool(self._spool_stats)
+        return {"circuit": self.breaker.stats(), **spooled, "replayed": self.replayed}
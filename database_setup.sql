@@ -27,6 +27,9 @@ CREATE TABLE incidents (
     longitude DECIMAL(11, 8),
     photo_url TEXT,
     status VARCHAR(20) DEFAULT 'reported',
+    -- Duplicate reports point at the canonical incident; canonical rows count their reports
+    canonical_incident_id UUID REFERENCES incidents(id) ON DELETE SET NULL,
+    report_count INTEGER DEFAULT 1,
     created_at TIMESTAMPTZ DEFAULT NOW(),
     updated_at TIMESTAMPTZ DEFAULT NOW()
 );
@@ -54,6 +57,7 @@ CREATE TABLE community_posts (
     category VARCHAR(50) NOT NULL,
     message TEXT NOT NULL,
     location TEXT,
+    image_url TEXT,
     created_at TIMESTAMPTZ DEFAULT NOW(),
     updated_at TIMESTAMPTZ DEFAULT NOW()
 );
@@ -83,9 +87,31 @@ CREATE TABLE safe_status (
     created_at TIMESTAMPTZ DEFAULT NOW()
 );
 
+-- Perceptual hashes of uploaded photos (64-bit dHash stored as 16 hex digits)
+CREATE TABLE photo_hashes (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    photo_url TEXT UNIQUE NOT NULL,
+    source_type VARCHAR(50) NOT NULL,
+    phash CHAR(16) NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Candidate photo matches flagged for volunteers to review
+CREATE TABLE photo_matches (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    photo_url TEXT NOT NULL,
+    source_type VARCHAR(50) NOT NULL,
+    matched_photo_url TEXT NOT NULL,
+    matched_source_type VARCHAR(50) NOT NULL,
+    distance INTEGER NOT NULL,
+    status VARCHAR(20) DEFAULT 'pending',
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
 -- Create indexes for better performance
 CREATE INDEX idx_incidents_user_id ON incidents(user_id);
 CREATE INDEX idx_incidents_created_at ON incidents(created_at);
+CREATE INDEX idx_incidents_canonical_incident_id ON incidents(canonical_incident_id);
 CREATE INDEX idx_missing_persons_user_id ON missing_persons(user_id);
 CREATE INDEX idx_missing_persons_status ON missing_persons(status);
 CREATE INDEX idx_community_posts_user_id ON community_posts(user_id);
@@ -93,6 +119,7 @@ CREATE INDEX idx_community_posts_category ON community_posts(category);
 CREATE INDEX idx_sos_alerts_user_id ON sos_alerts(user_id);
 CREATE INDEX idx_sos_alerts_status ON sos_alerts(status);
 CREATE INDEX idx_safe_status_user_id ON safe_status(user_id);
+CREATE INDEX idx_photo_matches_status ON photo_matches(status);
 
 -- Row Level Security (RLS) policies
 ALTER TABLE users ENABLE ROW LEVEL SECURITY;
@@ -101,6 +128,8 @@ ALTER TABLE missing_persons ENABLE ROW LEVEL SECURITY;
 ALTER TABLE community_posts ENABLE ROW LEVEL SECURITY;
 ALTER TABLE sos_alerts ENABLE ROW LEVEL SECURITY;
 ALTER TABLE safe_status ENABLE ROW LEVEL SECURITY;
+ALTER TABLE photo_hashes ENABLE ROW LEVEL SECURITY;
+ALTER TABLE photo_matches ENABLE ROW LEVEL SECURITY;
 
 -- Basic policies (you may want to customize these based on your requirements)
 -- Users can read their own data
@@ -142,4 +171,171 @@ CREATE POLICY "All users can view safe status" ON safe_status
     FOR SELECT USING (true);
 
 CREATE POLICY "Users can create safe status" ON safe_status
-    FOR INSERT WITH CHECK (true);
\ No newline at end of file
+    FOR INSERT WITH CHECK (true);
+
+-- ---------------------------------------------------------------------------
+-- Retention and archival
+--
+-- Resolved SOS alerts, resolved incidents and old safe-status marks are moved
+-- out of the hot tables into archive tables partitioned by month on
+-- created_at. The hot tables stay small, so status-filtered and
+-- created_at-ordered queries only touch live data. The *_history views union
+-- hot and archive rows for the few reads that need history.
+-- ---------------------------------------------------------------------------
+
+CREATE TABLE sos_alerts_archive (LIKE sos_alerts INCLUDING DEFAULTS) PARTITION BY RANGE (created_at);
+ALTER TABLE sos_alerts_archive ADD COLUMN archived_at TIMESTAMPTZ DEFAULT NOW();
+ALTER TABLE sos_alerts_archive ADD PRIMARY KEY (id, created_at);
+
+CREATE TABLE incidents_archive (LIKE incidents INCLUDING DEFAULTS) PARTITION BY RANGE (created_at);
+ALTER TABLE incidents_archive ADD COLUMN archived_at TIMESTAMPTZ DEFAULT NOW();
+ALTER TABLE incidents_archive ADD PRIMARY KEY (id, created_at);
+
+CREATE TABLE safe_status_archive (LIKE safe_status INCLUDING DEFAULTS) PARTITION BY RANGE (created_at);
+ALTER TABLE safe_status_archive ADD COLUMN archived_at TIMESTAMPTZ DEFAULT NOW();
+ALTER TABLE safe_status_archive ADD PRIMARY KEY (id, created_at);
+
+-- Rows outside every monthly partition land here until their month is created
+CREATE TABLE sos_alerts_archive_default PARTITION OF sos_alerts_archive DEFAULT;
+CREATE TABLE incidents_archive_default PARTITION OF incidents_archive DEFAULT;
+CREATE TABLE safe_status_archive_default PARTITION OF safe_status_archive DEFAULT;
+
+CREATE INDEX idx_sos_alerts_archive_user_id ON sos_alerts_archive(user_id);
+CREATE INDEX idx_incidents_archive_user_id ON incidents_archive(user_id);
+CREATE INDEX idx_safe_status_archive_user_id ON safe_status_archive(user_id);
+
+ALTER TABLE sos_alerts_archive ENABLE ROW LEVEL SECURITY;
+ALTER TABLE incidents_archive ENABLE ROW LEVEL SECURITY;
+ALTER TABLE safe_status_archive ENABLE ROW LEVEL SECURITY;
+
+-- Keep updated_at current so retention measures age from the last status change
+CREATE OR REPLACE FUNCTION set_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at := NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_sos_alerts_updated_at BEFORE UPDATE ON sos_alerts
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+CREATE TRIGGER trg_incidents_updated_at BEFORE UPDATE ON incidents
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+-- Create monthly archive partitions from months_back ago to months_ahead from now
+CREATE OR REPLACE FUNCTION ensure_archive_partitions(months_back INTEGER DEFAULT 12, months_ahead INTEGER DEFAULT 2)
+RETURNS INTEGER AS $$
+DECLARE
+    parent TEXT;
+    month_start DATE;
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    FOREACH parent IN ARRAY ARRAY['sos_alerts_archive', 'incidents_archive', 'safe_status_archive'] LOOP
+        FOR offset_months IN -months_back..months_ahead LOOP
+            month_start := (date_trunc('month', NOW()) + make_interval(months => offset_months))::DATE;
+            partition_name := format('%s_%s', parent, to_char(month_start, 'YYYY_MM'));
+            IF to_regclass(partition_name) IS NULL THEN
+                -- Move any rows already sitting in the default partition for this month
+                EXECUTE format('CREATE TEMP TABLE _pending ON COMMIT DROP AS SELECT * FROM %I WHERE created_at >= %L AND created_at < %L',
+                    parent || '_default', month_start, (month_start + INTERVAL '1 month')::DATE);
+                EXECUTE format('DELETE FROM %I WHERE created_at >= %L AND created_at < %L',
+                    parent || '_default', month_start, (month_start + INTERVAL '1 month')::DATE);
+                EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                    partition_name, parent, month_start, (month_start + INTERVAL '1 month')::DATE);
+                EXECUTE format('INSERT INTO %I SELECT * FROM _pending', parent);
+                DROP TABLE _pending;
+                created := created + 1;
+            END IF;
+        END LOOP;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Each archive_* function moves at most batch_size rows in one statement and
+-- returns how many moved; the retention job calls it until a short batch.
+-- SKIP LOCKED lets it run alongside live writes without blocking them.
+CREATE OR REPLACE FUNCTION archive_sos_alerts(cutoff TIMESTAMPTZ, batch_size INTEGER DEFAULT 500)
+RETURNS INTEGER AS $$
+DECLARE
+    moved INTEGER;
+BEGIN
+    WITH batch AS (
+        SELECT id FROM sos_alerts
+        WHERE status IN ('resolved', 'false_alarm') AND updated_at < cutoff
+        ORDER BY created_at
+        LIMIT batch_size
+        FOR UPDATE SKIP LOCKED
+    ), removed AS (
+        DELETE FROM sos_alerts WHERE id IN (SELECT id FROM batch) RETURNING *
+    )
+    INSERT INTO sos_alerts_archive SELECT * FROM removed;
+    GET DIAGNOSTICS moved = ROW_COUNT;
+    RETURN moved;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Resolved incidents are archived together with the duplicate reports
+-- clustered onto them (canonical_incident_id)
+CREATE OR REPLACE FUNCTION archive_incidents(cutoff TIMESTAMPTZ, batch_size INTEGER DEFAULT 500)
+RETURNS INTEGER AS $$
+DECLARE
+    moved INTEGER;
+BEGIN
+    WITH canonical AS (
+        SELECT id FROM incidents
+        WHERE status = 'resolved' AND canonical_incident_id IS NULL AND updated_at < cutoff
+        ORDER BY created_at
+        LIMIT batch_size
+        FOR UPDATE SKIP LOCKED
+    ), removed AS (
+        DELETE FROM incidents
+        WHERE id IN (SELECT id FROM canonical) OR canonical_incident_id IN (SELECT id FROM canonical)
+        RETURNING *
+    )
+    INSERT INTO incidents_archive SELECT * FROM removed;
+    GET DIAGNOSTICS moved = ROW_COUNT;
+    RETURN moved;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION archive_safe_status(cutoff TIMESTAMPTZ, batch_size INTEGER DEFAULT 500)
+RETURNS INTEGER AS $$
+DECLARE
+    moved INTEGER;
+BEGIN
+    -- Keep each user's newest mark in the hot table regardless of age
+    WITH batch AS (
+        SELECT id FROM safe_status s
+        WHERE created_at < cutoff
+          AND EXISTS (SELECT 1 FROM safe_status newer WHERE newer.user_id = s.user_id AND newer.created_at > s.created_at)
+        ORDER BY created_at
+        LIMIT batch_size
+        FOR UPDATE SKIP LOCKED
+    ), removed AS (
+        DELETE FROM safe_status WHERE id IN (SELECT id FROM batch) RETURNING *
+    )
+    INSERT INTO safe_status_archive SELECT * FROM removed;
+    GET DIAGNOSTICS moved = ROW_COUNT;
+    RETURN moved;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT ensure_archive_partitions();
+
+-- Hot and archived rows together, for reads that ask for history
+CREATE VIEW sos_alerts_history AS
+    SELECT *, NULL::TIMESTAMPTZ AS archived_at FROM sos_alerts
+    UNION ALL
+    SELECT * FROM sos_alerts_archive;
+
+CREATE VIEW incidents_history AS
+    SELECT *, NULL::TIMESTAMPTZ AS archived_at FROM incidents
+    UNION ALL
+    SELECT * FROM incidents_archive;
+
+CREATE VIEW safe_status_history AS
+    SELECT *, NULL::TIMESTAMPTZ AS archived_at FROM safe_status
+    UNION ALL
+    SELECT * FROM safe_status_archive;
@@ -1,15 +1,43 @@
-from fastapi import FastAPI, Form, HTTPException, status, UploadFile, File
+from fastapi import FastAPI, Form, HTTPException, status, UploadFile, File, Request, Query, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, StreamingResponse, Response
 from supabase import create_client, Client
 import os
 from passlib.context import CryptContext
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from jose import JWTError, jwt
 import uuid
-from typing import Optional
+from typing import List, Optional
 import io
+import hmac
+import json
+import time
+from app.static_assets import StaticAssetCache
+from app.dedup import IncidentDeduplicator, parse_timestamp
+from app.direct_uploads import DirectUploadService, LocalUploadBackend, SupabaseUploadBackend, UploadError
+from app.export import stream_export, ExportError, EXPORT_FORMATS
+from app.retention import RetentionJob, source_table
+from app.storage_client import PooledStorageClient, MAX_IMAGES_PER_REPORT, PER_REQUEST_UPLOAD_CONCURRENCY
+from app.content_store import ContentStore, read_and_hash
+from app.resumable_uploads import ResumableUploadStore, OffsetMismatch
+from app.safety_status import SafetyStatusIndex
+from app.jobs import JobQueue, RETRY_FOREVER
+from app.geocoder import ReverseGeocoder
+from app.region_cache import RegionalCache, parse_region_sizes, parse_size
+from app.single_flight import SingleFlight, parse_timeouts
+from app.profiler import ProfilingMiddleware, SamplingProfiler
+from app.loop_monitor import LoopMonitor, LoopMonitorMiddleware
+from app.resilience import CircuitBreaker, RequestPolicy, is_transient
+from app.write_spool import CriticalWriter, WriteSpool
+from app.notifications import NotificationDispatcher, Subscriber, SubscriberIndex, broadcast_notification, incident_notification, sink_from_env, sos_escalation_notification, sos_notification, DEFAULT_WATCH_RADIUS_KM, MAX_WATCH_RADIUS_KM
+from app.geofence import GeofenceError, PositionIndex, parse_area
+from app.linkage import FOUND, MISSING, PersonLinker, missing_person_record, post_mention_records, safe_mark_record, user_record
+from app.columnar import ColumnarSnapshot, SnapshotError
+from app.timeline import DEFAULT_TIMELINE_LIMIT, TimelineError, build_timeline
+from app.escalation import EscalationScheduler, priority_for, steps_from_env
+import asyncio
+from app.photo_hash import PhotoMatcher, BUCKET_SOURCES, DEFAULT_MATCH_DISTANCE, MAX_MATCH_DISTANCE, compute_image_hash, hash_to_hex
+from fastapi.concurrency import run_in_threadpool
 
 # Load environment variables
 try:
@@ -35,8 +63,29 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Serve static files
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Opt-in request profiling: send X-Profile: 1 with X-Profiler-Token, or turn on
+# sampling with POST /api/admin/profiler. Disabled unless PROFILER_TOKEN is set.
+profiler = SamplingProfiler(
+    os.getenv("PROFILE_DIR", "profiles"),
+    token=os.getenv("PROFILER_TOKEN"),
+    interval=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000,
+    max_profiles=int(os.getenv("PROFILE_MAX_COUNT", "200"))
+)
+app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+# Event-loop lag and blocking-call watchdog. LOOP_STRICT_MS (tests, staging)
+# fails any request that blocks the loop for longer than that.
+loop_monitor = LoopMonitor(
+    interval=float(os.getenv("LOOP_MONITOR_INTERVAL_MS", "50")) / 1000,
+    threshold=float(os.getenv("LOOP_LAG_THRESHOLD_MS", "100")) / 1000,
+    strict_ms=float(os.getenv("LOOP_STRICT_MS")) if os.getenv("LOOP_STRICT_MS") else None
+)
+app.add_middleware(LoopMonitorMiddleware, monitor=loop_monitor)
+
+# Static files are loaded once into memory, precompressed and served with
+# content-hash ETags. Set STATIC_ASSETS_RELOAD=true in development to pick up edits.
+STATIC_ASSETS_RELOAD = os.getenv("STATIC_ASSETS_RELOAD", "false").lower() == "true"
+static_assets = StaticAssetCache("static", reload=STATIC_ASSETS_RELOAD)
 
 # Initialize Supabase client
 SUPABASE_URL = os.getenv("SUPABASE_URL")
@@ -51,6 +100,107 @@ if not all([SUPABASE_URL, SUPABASE_KEY, SECRET_KEY]):
 supabase_key = SUPABASE_SERVICE_KEY if SUPABASE_SERVICE_KEY else SUPABASE_KEY
 supabase: Client = create_client(SUPABASE_URL, supabase_key)
 
+# Shared keep-alive connection pool for storage uploads
+storage_pool = PooledStorageClient(SUPABASE_URL, supabase_key)
+
+# Photos are stored once per distinct content (keyed by SHA-256) and
+# reference-counted, so forwarded copies reuse the first upload's URL
+content_store = ContentStore(supabase, storage_pool)
+
+# Perceptual-hash index used to match missing-person photos against other uploads
+photo_matcher = PhotoMatcher(supabase)
+
+# Clusters near-identical incident reports onto a canonical incident
+incident_dedup = IncidentDeduplicator(
+    window_seconds=float(os.getenv("INCIDENT_DEDUP_WINDOW_HOURS", "6")) * 3600,
+    radius_km=float(os.getenv("INCIDENT_DEDUP_RADIUS_KM", "1.0")),
+)
+
+# Fail fast while Supabase is unhealthy; SOS and safe writes made during an
+# outage are kept in a local SQLite spool and replayed in order on recovery
+database_breaker = CircuitBreaker("supabase")
+
+# Per-operation timeouts, retries and hedging for queries made by the routes
+# (DB_READ_TIMEOUT_SECONDS, DB_READ_RETRIES, DB_HEDGE_READS, DB_WRITE_TIMEOUT_SECONDS)
+db = RequestPolicy(database_breaker)
+critical_writes = CriticalWriter(
+    supabase,
+    database_breaker,
+    WriteSpool(os.getenv("WRITE_SPOOL_PATH", "write_spool.sqlite3")),
+    timeout=float(os.getenv("CRITICAL_WRITE_TIMEOUT_SECONDS", "5"))
+)
+
+# Offline gazetteer: nearest place, district and state for SOS/incident coordinates
+geocoder = ReverseGeocoder.load()
+
+# Links missing-person reports to registered users, safe marks and people
+# named in community posts; likely matches go to person_matches for review
+person_linker = PersonLinker(supabase, geocoder, min_score=float(os.getenv("LINKAGE_MIN_SCORE", "0.8")))
+
+# Feeds and lists are cached per district, each district with its own byte
+# budget (REGION_CACHE_BYTES, or per district in REGION_CACHE_SIZES) and
+# invalidated only by writes in that district
+region_cache = RegionalCache(
+    default_capacity=parse_size(os.getenv("REGION_CACHE_BYTES", "2MB")),
+    capacities=parse_region_sizes(os.getenv("REGION_CACHE_SIZES")),
+    ttl=float(os.getenv("REGION_CACHE_TTL_SECONDS", "15"))
+)
+
+# Concurrent identical reads (SOS list, missing persons, feeds and lists)
+# share one upstream call; SINGLE_FLIGHT_TIMEOUTS bounds it per operation
+read_flights = SingleFlight(
+    timeout=float(os.getenv("SINGLE_FLIGHT_TIMEOUT_SECONDS", "10")),
+    timeouts=parse_timeouts(os.getenv("SINGLE_FLIGHT_TIMEOUTS"))
+)
+
+# Latest safe/SOS status per user, for family and city check-ins
+safety_status = SafetyStatusIndex()
+
+# Nearby volunteers are notified of new SOS alerts and major incidents.
+# NOTIFICATION_SINK selects delivery: log (default), local or webhook.
+notification_subscribers = SubscriberIndex()
+notifier = NotificationDispatcher(notification_subscribers, sink_from_env())
+
+# Last known position of every user (from SOS alerts and safe marks), for
+# geo-fenced authority broadcasts. Broadcasting needs BROADCAST_TOKEN.
+last_positions = PositionIndex()
+BROADCAST_TOKEN = os.getenv("BROADCAST_TOKEN")
+BROADCAST_SEVERITIES = ("info", "warning", "evacuate")
+
+# Columnar copy of incidents and SOS alerts for ad-hoc slicing; writes are
+# applied as they happen, and rows changed or archived elsewhere are read
+# every SNAPSHOT_REFRESH_MINUTES
+snapshot = ColumnarSnapshot()
+SNAPSHOT_REFRESH_MINUTES = float(os.getenv("SNAPSHOT_REFRESH_MINUTES", "1"))
+
+# Direct-to-storage uploads: clients PUT photos to a signed target, then confirm.
+# UPLOAD_BACKEND=local stores objects on disk so the flow works offline.
+# Confirmed uploads are kept by content hash, like multipart ones.
+UPLOAD_BACKEND = os.getenv("UPLOAD_BACKEND", "supabase")
+if UPLOAD_BACKEND == "local":
+    upload_backend = LocalUploadBackend(os.getenv("LOCAL_UPLOAD_DIR", "uploads"), os.getenv("PUBLIC_BASE_URL", ""))
+    upload_content_store = ContentStore(supabase, upload_backend)
+else:
+    upload_backend = SupabaseUploadBackend(supabase, SUPABASE_URL, supabase_key)
+    upload_content_store = content_store
+direct_uploads = DirectUploadService(supabase, upload_backend, upload_content_store, SECRET_KEY)
+
+# Resumable chunked uploads are spooled here until attached to a report
+resumable_uploads = ResumableUploadStore(os.getenv("RESUMABLE_UPLOAD_DIR", "upload_spool"))
+
+# Moves resolved/old rows from the hot tables into monthly archive partitions
+retention_job = RetentionJob(supabase)
+RETENTION_INTERVAL_HOURS = float(os.getenv("RETENTION_INTERVAL_HOURS", "6"))
+
+# Secondary work (counter updates, deferred image uploads) runs after the
+# response. Durable jobs are kept on disk in JOB_SPOOL_DIR across restarts.
+jobs = JobQueue(workers=int(os.getenv("JOB_WORKERS", "4")), spool_dir=os.getenv("JOB_SPOOL_DIR") or "job_spool")
+
+# Community post photos wait here until their background upload has stored
+# them, so the (durable) upload job can still run after a restart
+POST_IMAGE_SPOOL_DIR = os.getenv("POST_IMAGE_SPOOL_DIR", "image_spool")
+os.makedirs(POST_IMAGE_SPOOL_DIR, exist_ok=True)
+
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -70,49 +220,285 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm="HS256")
     return encoded_jwt
 
-async def upload_image_to_supabase(file: UploadFile, bucket_name: str, folder: str = "") -> str:
+async def _image_upload_item(file: UploadFile, bucket_name: str) -> dict:
+    # Hashed while it is read; the object is stored under its content hash
+    file_content, digest = await read_and_hash(file)
+    return {
+        "bucket": bucket_name,
+        "digest": digest,
+        "content": file_content,
+        "content_type": file.content_type or "application/octet-stream"
+    }
+
+def attached_images(files: List[Optional[UploadFile]]) -> List[UploadFile]:
+    """Photos actually attached to a form (empty file fields are skipped); 400 if there are too many"""
+    files = [file for file in files or [] if file and file.filename]
+    if len(files) > MAX_IMAGES_PER_REPORT:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_IMAGES_PER_REPORT} photos per report, got {len(files)}"
+        )
+    return files
+
+async def upload_images_to_supabase(files: List[UploadFile], bucket_name: str) -> List[str]:
+    """Upload several images concurrently and return the public URLs of those that succeeded"""
+    files = attached_images(files)
+    if not files:
+        return []
+    
+    items = [await _image_upload_item(file, bucket_name) for file in files]
+    limit = asyncio.Semaphore(PER_REQUEST_UPLOAD_CONCURRENCY)
+    
+    async def store(item):
+        async with limit:
+            try:
+                return await content_store.store(item["bucket"], item["content"], item["digest"], item["content_type"])
+            except Exception as e:
+                print(f"Error uploading image {item['digest']}: {e}")
+                return None, False
+    
+    # Copies of a photo already in storage only take a reference to it
+    stored = await asyncio.gather(*(store(item) for item in items))
+    
+    uploaded = []
+    for item, (public_url, reused) in zip(items, stored):
+        if public_url:
+            # Fingerprint new photos in the background for photo matching
+            if not reused:
+                photo_matcher.submit(item["content"], public_url, BUCKET_SOURCES.get(bucket_name, bucket_name))
+            uploaded.append(public_url)
+    return uploaded
+
+async def upload_image_to_supabase(file: UploadFile, bucket_name: str) -> str:
     """Upload an image to Supabase storage and return the public URL"""
     try:
         if not file:
             return None
-            
-        # Generate unique filename
-        file_extension = file.filename.split('.')[-1] if '.' in file.filename else 'jpg'
-        unique_filename = f"{uuid.uuid4()}.{file_extension}"
-        file_path = f"{folder}/{unique_filename}" if folder else unique_filename
-        
-        # Read file content
-        file_content = await file.read()
-        
-        # Upload to Supabase storage
-        result = supabase.storage.from_(bucket_name).upload(file_path, file_content)
-        
-        if result:
-            # Get public URL
-            public_url = supabase.storage.from_(bucket_name).get_public_url(file_path)
-            return public_url
-        else:
-            return None
-            
+        urls = await upload_images_to_supabase([file], bucket_name)
+        return urls[0] if urls else None
     except Exception as e:
         print(f"Error uploading image: {e}")
         return None
 
+@jobs.job("incidents.refresh_report_count")
+async def refresh_report_count(payload: dict):
+    """Recount the reports folded into a canonical incident (idempotent, so order does not matter)"""
+    canonical_id = payload["canonical_id"]
+    duplicates = await db.read(
+        supabase.table("incidents").select("id", count="exact").eq("canonical_incident_id", canonical_id).limit(1),
+        "incidents.count_duplicates"
+    )
+    updated = await db.write(
+        supabase.table("incidents").update({"report_count": (duplicates.count or 0) + 1}).eq("id", canonical_id),
+        "incidents.refresh_report_count"
+    )
+    # The district feeds show report_count (async job: the cache is only touched on the loop)
+    if updated.data:
+        region_cache.invalidate(updated.data[0].get("district"))
+
+# Upload targets shown in the district feeds, and the table holding their district
+FEED_UPLOAD_TABLES = {"incident": "incidents", "community": "community_posts"}
+
+async def invalidate_upload_target(upload: dict, target_id: Optional[str]):
+    """Drop cached feeds showing a row a photo was just linked to"""
+    table = FEED_UPLOAD_TABLES.get(upload["target_type"])
+    if not upload["linked"] or table is None:
+        return
+    try:
+        row = await db.read(supabase.table(table).select("district").eq("id", target_id), f"{table}.district")
+        region_cache.invalidate(row.data[0].get("district") if row.data else None)
+    except Exception as e:
+        print(f"Error invalidating feeds for {table} {target_id}: {e}")
+
+def _spool_post_image(content: bytes) -> str:
+    path = os.path.join(POST_IMAGE_SPOOL_DIR, uuid.uuid4().hex)
+    with open(path + ".tmp", "wb") as file:
+        file.write(content)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + ".tmp", path)
+    return path
+
+def _discard_post_image(payload: dict, error: Optional[Exception] = None):
+    if os.path.exists(payload["spool_path"]):
+        os.remove(payload["spool_path"])
+
+def _read_spooled_image(path: str) -> bytes:
+    with open(path, "rb") as file:
+        return file.read()
+
+@jobs.job("community.upload_image", on_failure=_discard_post_image)
+async def upload_post_image(payload: dict):
+    """Store a community post's photo, then link it to the post if the post still exists"""
+    content = await run_in_threadpool(_read_spooled_image, payload["spool_path"])
+    public_url, reused = await content_store.store(payload["bucket"], content, payload["digest"], payload["content_type"])
+    # The post only gets image_url once it holds a reference, so deleting it
+    # releases exactly the references that were taken
+    try:
+        linked = await db.write(
+            supabase.table("community_posts").update({"image_url": public_url}).eq("id", payload["post_id"]),
+            "community_posts.link_image"
+        )
+    except Exception:
+        await content_store.release(payload["bucket"], payload["digest"])
+        raise
+    if not linked.data:
+        # Deleted before its photo was stored
+        await content_store.release(payload["bucket"], payload["digest"])
+    else:
+        region_cache.invalidate(linked.data[0].get("district"))
+        if not reused:
+            photo_matcher.submit(content, public_url, BUCKET_SOURCES.get(payload["bucket"], payload["bucket"]))
+    await run_in_threadpool(_discard_post_image, payload)
+
+def content_store_for(url: Optional[str]) -> ContentStore:
+    """Store holding the object behind a photo URL (direct uploads may live on local disk)"""
+    return upload_content_store if upload_content_store.serves(url) else content_store
+
+@jobs.job("storage.release_image")
+async def release_image(payload: dict):
+    """Drop a deleted record's reference to its photo; the object goes with the last reference"""
+    if await content_store_for(payload["url"]).release_url(payload["url"]):
+        print(f"Deleted unreferenced image {payload['url']}")
+
+@jobs.job("storage.release_unlinked_image", max_attempts=RETRY_FOREVER)
+async def release_unlinked_image(payload: dict):
+    """Release a photo uploaded for a record whose insert failed, unless the insert landed after all"""
+    table = payload["table"]
+    inserted = await db.read(supabase.table(table).select("id").eq("id", payload["record_id"]), f"{table}.exists")
+    if not inserted.data:
+        await content_store_for(payload["url"]).release_url(payload["url"])
+
+async def release_unlinked_images(table: str, record_id: str, urls: List[str]):
+    # One job per reference, so a retry never releases one twice
+    for url in urls:
+        try:
+            await jobs.enqueue_durable("storage.release_unlinked_image", {"table": table, "record_id": record_id, "url": url})
+        except Exception as e:
+            print(f"Could not queue release of {url}: {e}")
+
+@jobs.job("sos.record_escalation")
+def record_sos_escalation(payload: dict):
+    """Store an alert's escalation level and priority (only while it is still active)"""
+    supabase.table("sos_alerts").update({
+        "escalation_level": payload["level"],
+        "priority": payload["priority"],
+        "escalated_at": payload["escalated_at"]
+    }).eq("id", payload["alert_id"]).eq("status", "active").execute()
+
+# Retried until the database takes it (backoff caps at a minute), however
+# long an outage lasts: the user is safe and must not be escalated again
+@jobs.job("sos.resolve_user_alerts", max_attempts=RETRY_FOREVER)
+async def resolve_user_sos_alerts(payload: dict):
+    """Resolve a user's active SOS alerts raised before they marked themselves safe"""
+    result = await db.write(
+        supabase.table("sos_alerts").update({"status": "resolved", "updated_at": payload["resolved_at"]})
+        .eq("user_id", payload["user_id"]).eq("status", "active").lte("created_at", payload["resolved_at"]),
+        "sos_alerts.resolve_user"
+    )
+    for alert in result.data or []:
+        safety_status.record_sos(alert)
+        snapshot.apply("sos_alerts", alert)
+        escalations.cancel(alert["id"])
+
+async def escalate_sos_alert(alert: dict, level: int):
+    """Raise an unanswered alert's priority and notify nearby subscribers again"""
+    # The user marked safe since, but resolving the alert in the database has
+    # not gone through yet (e.g. the timer was re-armed after a restart)
+    reporter = safety_status.users.get(alert["user_id"])
+    if reporter is not None and reporter.safe and reporter.safe[0] >= alert["created"]:
+        escalations.cancel(alert["id"])
+        return
+    # Timers are per worker: the alert may have been resolved through another one
+    try:
+        current = await db.read(supabase.table("sos_alerts").select("status").eq("id", alert["id"]), "sos_alerts.escalation_check")
+        if not current.data or current.data[0]["status"] != "active":
+            escalations.cancel(alert["id"])
+            return
+    except Exception as e:
+        # Escalate anyway rather than stay silent while the database is down
+        print(f"Could not check SOS alert {alert['id']} before escalating: {e}")
+    await jobs.enqueue_durable("sos.record_escalation", {
+        "alert_id": alert["id"],
+        "level": level,
+        "priority": priority_for(level),
+        "escalated_at": datetime.now(timezone.utc).isoformat()
+    })
+    snapshot.apply("sos_alerts", {"id": alert["id"], "escalation_level": level, "priority": priority_for(level)})
+    minutes = (time.time() - alert["created"]) / 60
+    notifier.publish(sos_escalation_notification(alert, level, minutes, reporter.city if reporter else None))
+
+@jobs.job("broadcasts.record")
+def record_broadcast(payload: dict):
+    """Keep a record of a broadcast that has already gone out"""
+    supabase.table("broadcasts").upsert(payload, on_conflict="id", ignore_duplicates=True).execute()
+
+# Active SOS alerts escalate after ESCALATION_STEPS_MINUTES (default 5,15,30)
+# without a response; resolving the alert or marking safe cancels the timer
+escalations = EscalationScheduler(steps_from_env(), escalate_sos_alert)
+
+def resolve_district(district: Optional[str]) -> Optional[str]:
+    """Gazetteer spelling of a district filter; 400 if the district is unknown"""
+    if not district:
+        return None
+    canonical = geocoder.canonical_district(district)
+    if not canonical:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown district: {district}")
+    return canonical
+
+def resolve_region(district: Optional[str], city: Optional[str]) -> Optional[str]:
+    """District a feed/list request is scoped to, from ?district= or ?city=; None for all regions"""
+    if district:
+        return resolve_district(district)
+    if city:
+        place = geocoder.locate(city)
+        if not place:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown city: {city}")
+        return place["district"]
+    return None
+
+def require_profiler_token(token: Optional[str]):
+    if not profiler.enabled:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profiling is disabled")
+    if not profiler.authorized(token):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid profiler token")
+
+def cached_json(body: bytes) -> Response:
+    return Response(content=body, media_type="application/json")
+
+async def regional_read(name: str, district: Optional[str], key: str, build) -> Response:
+    """Response cached in the district's partition; concurrent misses share one build"""
+    body = await region_cache.get_or_build(district, key, lambda flight_key: read_flights.do(name, flight_key, build))
+    return cached_json(body)
+
 # Routes
 @app.get("/")
-async def root():
+async def root(request: Request):
     """Serve the main HTML page"""
-    try:
-        with open("static/main.html", "r", encoding="utf-8") as file:
-            content = file.read()
-        return HTMLResponse(content=content)
-    except FileNotFoundError:
+    response = static_assets.build_response("main.html", request.headers)
+    if response is None:
         return HTMLResponse("<h1>Welcome to Digi-रक्षा</h1><p>Main HTML file not found</p>")
+    return response
+
+@app.api_route("/static/{asset_path:path}", methods=["GET", "HEAD"])
+async def serve_static(asset_path: str, request: Request):
+    """Serve a static asset from the in-memory cache"""
+    response = static_assets.build_response(asset_path, request.headers, request.method)
+    if response is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Not Found"
+        )
+    return response
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "message": "Digi-रक्षा API is running successfully"}
+    return {
+        "status": "healthy",
+        "message": "Digi-रक्षा API is running successfully",
+        "database": await critical_writes.stats()
+    }
 
 @app.post("/api/auth/register")
 async def register(
@@ -129,7 +515,7 @@ async def register(
     """Register a new user"""
     try:
         # Check if user already exists
-        existing_user = supabase.table("users").select("*").eq("gov_id_number", gov_id_number).execute()
+        existing_user = await db.read(supabase.table("users").select("*").eq("gov_id_number", gov_id_number), "users.by_gov_id")
         if existing_user.data:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -142,7 +528,7 @@ async def register(
         # Handle photo upload
         photo_url = None
         if photo and photo.filename:
-            photo_url = await upload_image_to_supabase(photo, "profile_pictures", "users")
+            photo_url = await upload_image_to_supabase(photo, "profile_pictures")
             if not photo_url:
                 # Don't fail registration if photo upload fails, just log it
                 print("Warning: Failed to upload profile picture")
@@ -161,13 +547,15 @@ async def register(
         }
         
         # Insert user into database
-        result = supabase.table("users").insert(user_data).execute()
+        result = await db.write(supabase.table("users").insert(user_data), "users.insert")
         
         if not result.data:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to create user"
             )
+        safety_status.set_user(result.data[0]["id"], city, f"{first_name} {last_name}")
+        person_linker.submit(FOUND, [user_record(result.data[0], person_linker.area_of(city))])
         
         # Create access token
         access_token = create_access_token(data={"sub": gov_id_number})
@@ -195,7 +583,7 @@ async def login(
     """Login user"""
     try:
         # Get user from database
-        user_result = supabase.table("users").select("*").eq("gov_id_number", gov_id_number).execute()
+        user_result = await db.read(supabase.table("users").select("*").eq("gov_id_number", gov_id_number), "users.by_gov_id")
         
         if not user_result.data:
             raise HTTPException(
@@ -240,7 +628,7 @@ async def login(
 async def get_users():
     """Get all users (for testing)"""
     try:
-        result = supabase.table("users").select("id, first_name, last_name, city, gov_id_type, created_at").execute()
+        result = await db.read(supabase.table("users").select("id, first_name, last_name, city, gov_id_type, created_at"), "users.list")
         return {"users": result.data, "count": len(result.data)}
     except Exception as e:
         raise HTTPException(
@@ -248,56 +636,124 @@ async def get_users():
             detail=f"Failed to fetch users: {str(e)}"
         )
 
+@app.get("/api/users/{user_id}/timeline")
+async def get_user_timeline(
+    user_id: str,
+    limit: int = DEFAULT_TIMELINE_LIMIT,
+    cursor: Optional[str] = None,
+    types: Optional[str] = None,
+    include_history: bool = False
+):
+    """
+    A user's incidents, missing-person reports, community posts, SOS alerts
+    and safe marks, newest first. Pass next_cursor back as cursor for the
+    next page; types is a comma-separated subset of the item types.
+    """
+    type_list = [item_type.strip() for item_type in types.split(",") if item_type.strip()] if types else None
+    try:
+        return await build_timeline(supabase, db.read, user_id, limit, cursor, type_list, include_history)
+    except TimelineError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to fetch timeline: {str(e)}"
+        )
+
 @app.post("/api/incidents")
 async def create_incident(
     incident_type: str = Form(...),
     description: str = Form(...),
     location: str = Form(...),
     user_id: str = Form(...),
-    incident_image: UploadFile = File(None)
+    latitude: Optional[float] = Form(None),
+    longitude: Optional[float] = Form(None),
+    incident_image: UploadFile = File(None),
+    incident_images: List[UploadFile] = File(None)
 ):
     """Create a new incident report"""
+    # Single incident_image and/or several incident_images
+    images = attached_images([incident_image] + list(incident_images or []))
     try:
         print(f"[{datetime.now()}] Starting incident creation...")
         
-        # Handle image upload
-        photo_url = None
-        if incident_image and incident_image.filename:
-            print(f"[{datetime.now()}] Uploading image: {incident_image.filename}")
-            photo_url = await upload_image_to_supabase(incident_image, "incident_images", "reports")
-            print(f"[{datetime.now()}] Image uploaded successfully: {photo_url}")
+        # Handle image uploads
+        photo_urls = []
+        if images:
+            print(f"[{datetime.now()}] Uploading images: {[image.filename for image in images]}")
+            photo_urls = await upload_images_to_supabase(images, "incident_images")
+            print(f"[{datetime.now()}] Images uploaded successfully: {photo_urls}")
         else:
             print(f"[{datetime.now()}] No image provided")
+        photo_url = photo_urls[0] if photo_urls else None
         
         # Create incident data
+        incident_id = str(uuid.uuid4())
         incident_data = {
+            "id": incident_id,
             "user_id": user_id,
             "incident_type": incident_type,
             "description": description,
             "location": location,
             "status": "reported"
         }
+        if latitude is not None and longitude is not None:
+            incident_data["latitude"] = latitude
+            incident_data["longitude"] = longitude
+            geocoder.enrich(incident_data)
+        if not incident_data.get("district"):
+            incident_data.update(geocoder.locate(location) or {})
         
-        # Add photo_url if we have one
+        # Add photo_url (first image) and photo_urls if we have any
         if photo_url:
             incident_data["photo_url"] = photo_url
-            print(f"[{datetime.now()}] Added photo_url to incident_data: {photo_url}")
+            incident_data["photo_urls"] = photo_urls
+            print(f"[{datetime.now()}] Added photo_urls to incident_data: {photo_urls}")
         
-        print(f"[{datetime.now()}] Inserting to database: {incident_data}")
-        result = supabase.table("incidents").insert(incident_data).execute()
-        print(f"[{datetime.now()}] Database response: {result.data}")
+        # Cluster against recent reports before inserting so concurrent
+        # duplicates see each other
+        cluster = incident_dedup.observe(incident_id, incident_type, description, location, latitude, longitude)
+        try:
+            if cluster["duplicate"]:
+                # canonical_incident_id is a foreign key: wait for the
+                # canonical incident's own insert to land
+                cluster = await incident_dedup.resolve(incident_id)
+            if cluster["duplicate"]:
+                incident_data["canonical_incident_id"] = cluster["canonical_id"]
+            
+            print(f"[{datetime.now()}] Inserting to database: {incident_data}")
+            result = await db.write(supabase.table("incidents").insert(incident_data), "incidents.insert")
+            print(f"[{datetime.now()}] Database response: {result.data}")
+            if not result.data:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail="Failed to create incident"
+                )
+        except BaseException:
+            incident_dedup.forget(incident_id)
+            await release_unlinked_images("incidents", incident_id, photo_urls)
+            raise
+        incident_dedup.confirm(incident_id)
         
-        if not result.data:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to create incident"
-            )
+        region_cache.invalidate(incident_data.get("district"))
+        snapshot.apply("incidents", result.data[0])
+        
+        if cluster["duplicate"]:
+            await jobs.enqueue_durable("incidents.refresh_report_count", {"canonical_id": cluster["canonical_id"]})
+        
+        notification = incident_notification(incident_data, cluster["canonical_id"], cluster["report_count"])
+        if notification:
+            notifier.publish(notification)
         
         return {
             "message": "Incident reported successfully", 
             "incident_id": result.data[0]["id"],
+            "canonical_incident_id": cluster["canonical_id"],
+            "duplicate": cluster["duplicate"],
+            "report_count": cluster["report_count"],
             "image_uploaded": bool(photo_url),
-            "image_url": photo_url if photo_url else None
+            "image_url": photo_url if photo_url else None,
+            "image_urls": photo_urls
         }
         
     except Exception as e:
@@ -307,11 +763,21 @@ async def create_incident(
         )
 
 @app.get("/api/incidents")
-async def get_incidents():
-    """Get all incidents"""
+async def get_incidents(include_duplicates: bool = False, include_history: bool = False, district: Optional[str] = None, city: Optional[str] = None):
+    """Get all incidents, optionally in one district or city (duplicate reports are folded into their canonical incident)"""
+    district = resolve_region(district, city)
+
+    async def build():
+        query = supabase.table(source_table("incidents", include_history)).select("*")
+        if district:
+            query = query.eq("district", district)
+        if not include_duplicates:
+            query = query.is_("canonical_incident_id", "null")
+        result = await db.read(query.order("created_at", desc=True), "incidents.list")
+        return {"incidents": result.data, "count": len(result.data), "district": district}
+
     try:
-        result = supabase.table("incidents").select("*").order("created_at", desc=True).execute()
-        return {"incidents": result.data, "count": len(result.data)}
+        return await regional_read("incidents", district, f"incidents:{include_duplicates}:{include_history}", build)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -326,16 +792,18 @@ async def create_missing_person(
     description: str = Form(...),
     reporter_contact: str = Form(...),
     user_id: str = Form(...),
-    person_photo: UploadFile = File(None)
+    person_photo: UploadFile = File(None),
+    person_photos: List[UploadFile] = File(None)
 ):
     """Report a missing person"""
+    # Single person_photo and/or several person_photos
+    photos = attached_images([person_photo] + list(person_photos or []))
     try:
-        # Handle photo upload
-        photo_url = None
-        if person_photo and person_photo.filename:
-            photo_url = await upload_image_to_supabase(person_photo, "missing_person_photos", "reports")
+        photo_urls = await upload_images_to_supabase(photos, "missing_person_photos")
+        photo_url = photo_urls[0] if photo_urls else None
         
         missing_data = {
+            "id": str(uuid.uuid4()),
             "user_id": user_id,
             "name": name,
             "age": age,
@@ -343,21 +811,27 @@ async def create_missing_person(
             "description": description,
             "reporter_contact": reporter_contact,
             "status": "missing",
-            "photo_url": photo_url
+            "photo_url": photo_url,
+            "photo_urls": photo_urls
         }
         
-        result = supabase.table("missing_persons").insert(missing_data).execute()
-        
-        if not result.data:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to create missing person report"
-            )
+        try:
+            result = await db.write(supabase.table("missing_persons").insert(missing_data), "missing_persons.insert")
+            if not result.data:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail="Failed to create missing person report"
+                )
+        except BaseException:
+            await release_unlinked_images("missing_persons", missing_data["id"], photo_urls)
+            raise
+        person_linker.submit(MISSING, [missing_person_record(result.data[0], person_linker.area_of(last_seen_location))])
         
         return {
             "message": "Missing person reported successfully", 
             "report_id": result.data[0]["id"],
-            "photo_uploaded": bool(photo_url)
+            "photo_uploaded": bool(photo_url),
+            "photo_urls": photo_urls
         }
         
     except Exception as e:
@@ -369,9 +843,12 @@ async def create_missing_person(
 @app.get("/api/missing")
 async def get_missing_persons():
     """Get all missing persons"""
-    try:
-        result = supabase.table("missing_persons").select("*").eq("status", "missing").order("created_at", desc=True).execute()
+    async def build():
+        result = await db.read(supabase.table("missing_persons").select("*").eq("status", "missing").order("created_at", desc=True), "missing_persons.list")
         return {"missing_persons": result.data, "count": len(result.data)}
+
+    try:
+        return cached_json(await read_flights.do("missing_persons", "missing_persons", build))
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -389,10 +866,13 @@ async def create_community_post(
 ):
     """Create a community post"""
     try:
-        # Handle image upload
+        # The photo's public URL is known up front (from its content hash), so
+        # the upload itself runs after the response and links it to the post
         image_url = None
+        image_item = None
         if post_image and post_image.filename:
-            image_url = await upload_image_to_supabase(post_image, "community_images", "posts")
+            image_item = await _image_upload_item(post_image, "community_images")
+            image_url = content_store.public_url(image_item["bucket"], image_item["digest"])
         
         # Create post data
         post_data = {
@@ -402,22 +882,11 @@ async def create_community_post(
             "message": message,
             "location": location
         }
+        # Region of the post: its location text, else where the poster lives
+        poster = safety_status.users.get(user_id)
+        post_data.update(geocoder.locate(location) or geocoder.locate(poster.city if poster else None) or {})
         
-        # Try to add image_url if we have one, but don't fail if column doesn't exist
-        if image_url:
-            try:
-                post_data["image_url"] = image_url
-                result = supabase.table("community_posts").insert(post_data).execute()
-            except Exception as e:
-                if "image_url" in str(e):
-                    # Remove image_url and try again
-                    del post_data["image_url"]
-                    result = supabase.table("community_posts").insert(post_data).execute()
-                    print(f"Warning: community_posts table doesn't have image_url column. Image uploaded but not linked: {image_url}")
-                else:
-                    raise e
-        else:
-            result = supabase.table("community_posts").insert(post_data).execute()
+        result = await db.write(supabase.table("community_posts").insert(post_data), "community_posts.insert")
         
         if not result.data:
             raise HTTPException(
@@ -425,6 +894,13 @@ async def create_community_post(
                 detail="Failed to create community post"
             )
         
+        region_cache.invalidate(post_data.get("district"))
+        person_linker.submit(FOUND, post_mention_records(result.data[0]))
+        
+        if image_item:
+            spool_path = await run_in_threadpool(_spool_post_image, image_item.pop("content"))
+            await jobs.enqueue_durable("community.upload_image", {"post_id": result.data[0]["id"], "spool_path": spool_path, **image_item})
+        
         return {
             "message": "Community post created successfully", 
             "post_id": result.data[0]["id"],
@@ -439,62 +915,114 @@ async def create_community_post(
         )
 
 @app.get("/api/community")
-async def get_community_posts():
-    """Get all community posts"""
+async def get_community_posts(district: Optional[str] = None, city: Optional[str] = None):
+    """Get community posts, optionally in one district or city"""
+    district = resolve_region(district, city)
+
+    async def build():
+        query = supabase.table("community_posts").select("*")
+        if district:
+            query = query.eq("district", district)
+        result = await db.read(query.order("created_at", desc=True).limit(50), "community_posts.list")
+        return {"posts": result.data, "count": len(result.data), "district": district}
+
     try:
-        result = supabase.table("community_posts").select("*").order("created_at", desc=True).limit(50).execute()
-        return {"posts": result.data, "count": len(result.data)}
+        return await regional_read("community_posts", district, "community_posts", build)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to fetch community posts: {str(e)}"
         )
 
+async def build_community_feed(district: Optional[str]) -> dict:
+    """Latest posts and canonical incidents, from one district's rows only when district is given"""
+    posts_query = supabase.table("community_posts").select("*")
+    incidents_query = supabase.table("incidents").select("*").is_("canonical_incident_id", "null")
+    if district:
+        posts_query = posts_query.eq("district", district)
+        incidents_query = incidents_query.eq("district", district)
+    # Get community posts and canonical incidents concurrently
+    community_result, incidents_result = await asyncio.gather(
+        db.read(posts_query.order("created_at", desc=True).limit(25), "community_feed.posts"),
+        db.read(incidents_query.order("created_at", desc=True).limit(25), "community_feed.incidents")
+    )
+    community_posts = community_result.data or []
+    
+    # Transform incidents to look like community posts
+    incidents = incidents_result.data or []
+    
+    # Transform incidents to community post format
+    transformed_incidents = []
+    for incident in incidents:
+        transformed_incident = {
+            "id": f"incident_{incident['id']}",
+            "user_name": "Emergency Report",
+            "category": "Alert",
+            "message": f"🚨 {incident['incident_type']}: {incident['description']}",
+            "location": incident["location"],
+            "created_at": incident["created_at"],
+            "post_type": "incident",
+            "incident_type": incident["incident_type"],
+            "status": incident.get("status", "reported"),
+            "report_count": incident.get("report_count", 1),
+            "image_url": incident.get("photo_url")
+        }
+        transformed_incidents.append(transformed_incident)
+    
+    # Add post_type to regular community posts
+    for post in community_posts:
+        post["post_type"] = "community"
+    
+    # Combine and sort by creation date
+    all_posts = community_posts + transformed_incidents
+    all_posts.sort(key=lambda x: x["created_at"], reverse=True)
+    
+    return {"posts": all_posts, "count": len(all_posts), "district": district}
+
 @app.get("/api/community/feed")
-async def get_community_feed():
-    """Get combined community posts and incident reports for the community feed"""
-    try:
-        # Get community posts
-        community_result = supabase.table("community_posts").select("*").order("created_at", desc=True).limit(25).execute()
-        community_posts = community_result.data or []
-        
-        # Get incidents and transform them to look like community posts
-        incidents_result = supabase.table("incidents").select("*").order("created_at", desc=True).limit(25).execute()
-        incidents = incidents_result.data or []
-        
-        # Transform incidents to community post format
-        transformed_incidents = []
-        for incident in incidents:
-            transformed_incident = {
-                "id": f"incident_{incident['id']}",
-                "user_name": "Emergency Report",
-                "category": "Alert",
-                "message": f"🚨 {incident['incident_type']}: {incident['description']}",
-                "location": incident["location"],
-                "created_at": incident["created_at"],
-                "post_type": "incident",
-                "incident_type": incident["incident_type"],
-                "status": incident.get("status", "reported"),
-                "image_url": incident.get("photo_url")
-            }
-            transformed_incidents.append(transformed_incident)
-        
-        # Add post_type to regular community posts
-        for post in community_posts:
-            post["post_type"] = "community"
-        
-        # Combine and sort by creation date
-        all_posts = community_posts + transformed_incidents
-        all_posts.sort(key=lambda x: x["created_at"], reverse=True)
-        
-        return {"posts": all_posts, "count": len(all_posts)}
-        
+async def get_community_feed(district: Optional[str] = None, city: Optional[str] = None):
+    """Get combined community posts and incident reports for the community feed, optionally for one district or city"""
+    district = resolve_region(district, city)
+    try:
+        return await regional_read("community_feed", district, "community_feed", lambda: build_community_feed(district))
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to fetch community feed: {str(e)}"
         )
 
+@app.delete("/api/community/{post_id}")
+async def delete_community_post(post_id: str, user_id: str):
+    """Delete your own community post (its photo is removed once no other post or report uses it)"""
+    try:
+        found = await db.read(supabase.table("community_posts").select("id, user_id, image_url, district").eq("id", post_id), "community_posts.get")
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to delete community post: {str(e)}"
+        )
+    if not found.data:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Community post not found")
+    post = found.data[0]
+    if str(post["user_id"]) != user_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only the author can delete this post")
+    try:
+        deleted = await db.write(supabase.table("community_posts").delete().eq("id", post_id), "community_posts.delete")
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to delete community post: {str(e)}"
+        )
+    
+    region_cache.invalidate(post.get("district"))
+    person_linker.remove_post(post_id)
+    # image_url as deleted: set only once the upload job holds its reference
+    # (if it is still running, the job releases the reference itself)
+    removed = deleted.data[0] if deleted.data else {}
+    if removed.get("image_url"):
+        await jobs.enqueue_durable("storage.release_image", {"url": removed["image_url"]})
+    return {"message": "Community post deleted", "post_id": post_id}
+
 @app.post("/api/sos")
 async def create_sos_alert(
     latitude: float = Form(...),
@@ -504,9 +1032,10 @@ async def create_sos_alert(
     user_name: str = Form(...),
     user_id: str = Form(...)
 ):
-    """Create an SOS alert"""
+    """Create an SOS alert (queued locally and acknowledged if the database is unreachable)"""
     try:
         sos_data = {
+            "id": str(uuid.uuid4()),
             "user_id": user_id,
             "user_name": user_name,
             "latitude": latitude,
@@ -515,16 +1044,19 @@ async def create_sos_alert(
             "emergency_type": emergency_type,
             "status": "active"
         }
+        # Name the place instead of the raw "Emergency at Lat: ..." description
+        geocoder.enrich(sos_data, "location_description")
         
-        result = supabase.table("sos_alerts").insert(sos_data).execute()
-        
-        if not result.data:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to create SOS alert"
-            )
+        written = await critical_writes.insert("sos_alerts", sos_data)
+        alert = written["row"]
+        safety_status.record_sos(alert)
+        escalations.arm(alert)
+        last_positions.update(user_id, latitude, longitude)
+        snapshot.apply("sos_alerts", alert)
+        reporter = safety_status.users.get(user_id)
+        notifier.publish(sos_notification(alert, reporter.city if reporter else None))
         
-        return {"message": "SOS alert created successfully", "alert_id": result.data[0]["id"]}
+        return {"message": "SOS alert created successfully", "alert_id": alert["id"], "queued": written["queued"]}
         
     except Exception as e:
         raise HTTPException(
@@ -532,18 +1064,101 @@ async def create_sos_alert(
             detail=f"Failed to create SOS alert: {str(e)}"
         )
 
+async def build_sos_alerts(include_history: bool, district: Optional[str]) -> dict:
+    """Stored alerts plus those still queued locally; only the queued ones while the database is unreachable"""
+    # Alerts accepted while the database was unreachable and not replayed yet
+    queued = [alert for alert in await critical_writes.pending("sos_alerts") if not district or alert.get("district") == district]
+    if include_history:
+        query = supabase.table(source_table("sos_alerts", True)).select("*")
+    else:
+        query = supabase.table("sos_alerts").select("*").eq("status", "active")
+    if district:
+        query = query.eq("district", district)
+    query = query.order("created_at", desc=True)
+    try:
+        alerts = (await db.read(query, "sos_alerts.list")).data
+    except Exception as e:
+        if not is_transient(e):
+            raise
+        # Degrade to what this instance still knows about rather than failing
+        alerts = sorted(queued, key=lambda alert: alert["created_at"], reverse=True)
+        return {"alerts": alerts, "count": len(alerts), "degraded": True}
+    stored = {alert["id"] for alert in alerts}
+    pending = [alert for alert in queued if alert["id"] not in stored]
+    if pending:
+        alerts = sorted(pending + alerts, key=lambda alert: alert["created_at"], reverse=True)
+    return {"alerts": alerts, "count": len(alerts)}
+
 @app.get("/api/sos")
-async def get_sos_alerts():
-    """Get active SOS alerts"""
+async def get_sos_alerts(include_history: bool = False, district: Optional[str] = None):
+    """Get active SOS alerts, or every alert including archived ones with include_history, optionally in one district"""
+    district = resolve_district(district)
     try:
-        result = supabase.table("sos_alerts").select("*").eq("status", "active").order("created_at", desc=True).execute()
-        return {"alerts": result.data, "count": len(result.data)}
+        return cached_json(await read_flights.do("sos_alerts", f"{include_history}|{district}", lambda: build_sos_alerts(include_history, district)))
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to fetch SOS alerts: {str(e)}"
         )
 
+SOS_STATUSES = ("active", "resolved", "false_alarm")
+
+@app.put("/api/sos/{sos_id}/status")
+async def update_sos_status(sos_id: str, status_update: str = Form(...)):
+    """Resolve an SOS alert or mark it a false alarm (stopping its escalation), or reopen it"""
+    if status_update not in SOS_STATUSES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"status_update must be one of {', '.join(SOS_STATUSES)}")
+    try:
+        result = await db.write(
+            supabase.table("sos_alerts").update({"status": status_update, "updated_at": datetime.now(timezone.utc).isoformat()}).eq("id", sos_id),
+            "sos_alerts.update_status"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to update SOS alert: {str(e)}"
+        )
+    if not result.data:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="SOS alert not found")
+    alert = result.data[0]
+    safety_status.record_sos(alert)
+    snapshot.apply("sos_alerts", alert)
+    if status_update == "active":
+        escalations.arm(alert)
+    else:
+        escalations.cancel(sos_id)
+    return {"message": f"SOS alert marked {status_update}", "alert": alert}
+
+@app.get("/api/sos/nearby")
+async def get_nearby_sos_alerts(latitude: float, longitude: float, radius_km: float = 10):
+    """Get active SOS alerts within radius_km, nearest first"""
+    try:
+        result = await db.read(supabase.rpc("sos_alerts_within_radius", {
+            "lat": latitude,
+            "lon": longitude,
+            "radius_m": radius_km * 1000
+        }), "sos_alerts.nearby")
+        return {"alerts": result.data, "count": len(result.data)}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to fetch nearby SOS alerts: {str(e)}"
+        )
+
+@app.get("/api/places/reverse")
+async def reverse_geocode(latitude: float, longitude: float):
+    """Nearest known place, district and state for a coordinate (offline)"""
+    place = geocoder.nearest(latitude, longitude)
+    if place is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No known place near these coordinates")
+    return place
+
+@app.get("/api/places/districts")
+async def list_districts(state: Optional[str] = None):
+    """Districts accepted by the district filters, optionally for one state"""
+    districts = geocoder.districts(state)
+    return {"districts": districts, "count": len(districts)}
+
 @app.post("/api/safe")
 async def mark_safe(
     latitude: float = Form(...),
@@ -552,9 +1167,10 @@ async def mark_safe(
     user_name: str = Form(...),
     user_id: str = Form(...)
 ):
-    """Mark user as safe"""
+    """Mark user as safe (queued locally and acknowledged if the database is unreachable)"""
     try:
         safe_data = {
+            "id": str(uuid.uuid4()),
             "user_id": user_id,
             "user_name": user_name,
             "latitude": latitude,
@@ -562,15 +1178,20 @@ async def mark_safe(
             "message": message
         }
         
-        result = supabase.table("safe_status").insert(safe_data).execute()
-        
-        if not result.data:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to mark as safe"
-            )
+        written = await critical_writes.insert("safe_status", safe_data)
+        safety_status.record_safe(written["row"])
+        resolution = {"user_id": user_id, "resolved_at": written["row"]["created_at"]}
+        try:
+            await resolve_user_sos_alerts(resolution)
+        except Exception as e:
+            # The safe mark may be spooled: resolve once the database is back
+            print(f"Failed to resolve SOS alerts for {user_id}, queued: {e}")
+            await jobs.enqueue_durable("sos.resolve_user_alerts", resolution)
+        escalations.cancel_user(user_id)
+        last_positions.update(user_id, latitude, longitude)
+        person_linker.submit(FOUND, [safe_mark_record(written["row"], person_linker.area_at(latitude, longitude))])
         
-        return {"message": "Marked as safe successfully", "safe_id": result.data[0]["id"]}
+        return {"message": "Marked as safe successfully", "safe_id": written["row"]["id"], "queued": written["queued"]}
         
     except Exception as e:
         raise HTTPException(
@@ -578,6 +1199,565 @@ async def mark_safe(
             detail=f"Failed to mark as safe: {str(e)}"
         )
 
+@app.get("/api/safe/status")
+async def get_group_safety_status(user_ids: str):
+    """Latest safe/SOS status of several users at once (comma-separated user_ids)"""
+    ids = list(dict.fromkeys(user_id.strip() for user_id in user_ids.split(",") if user_id.strip()))
+    if not ids:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="user_ids is required")
+    if len(ids) > 500:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="At most 500 user_ids per request")
+    statuses = safety_status.get_many(ids)
+    return {"statuses": statuses, "summary": safety_status.summarize(statuses), "count": len(statuses)}
+
+@app.get("/api/safe/city/{city}")
+async def get_city_safety_status(city: str):
+    """Latest safe/SOS status of every registered user in a city"""
+    statuses = safety_status.by_city(city)
+    return {"city": city, "statuses": statuses, "summary": safety_status.summarize(statuses), "count": len(statuses)}
+
+@app.post("/api/notifications/subscribe")
+async def subscribe_to_notifications(
+    user_id: str = Form(...),
+    latitude: Optional[float] = Form(None),
+    longitude: Optional[float] = Form(None),
+    radius_km: float = Form(DEFAULT_WATCH_RADIUS_KM),
+    city: Optional[str] = Form(None)
+):
+    """Get notified of SOS alerts and major incidents near a position and/or in a city"""
+    located = latitude is not None and longitude is not None
+    if not located and not city:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Provide latitude and longitude, or a city")
+    if not 0 < radius_km <= MAX_WATCH_RADIUS_KM:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"radius_km must be between 0 and {MAX_WATCH_RADIUS_KM}")
+    try:
+        subscription = {
+            "user_id": user_id,
+            "latitude": latitude if located else None,
+            "longitude": longitude if located else None,
+            "radius_km": radius_km,
+            "city": city or None,
+            "active": True
+        }
+        await db.write(supabase.table("notification_subscriptions").upsert(subscription), "notification_subscriptions.upsert")
+        notification_subscribers.add(Subscriber(user_id, subscription["latitude"], subscription["longitude"], radius_km, city))
+        return {"message": "Subscribed to nearby alerts", "subscription": subscription}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to subscribe: {str(e)}"
+        )
+
+@app.delete("/api/notifications/subscribe/{user_id}")
+async def unsubscribe_from_notifications(user_id: str):
+    """Stop nearby-alert notifications for a user"""
+    try:
+        await db.write(supabase.table("notification_subscriptions").update({"active": False}).eq("user_id", user_id), "notification_subscriptions.update")
+        notification_subscribers.remove(user_id)
+        return {"message": "Unsubscribed from nearby alerts"}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to unsubscribe: {str(e)}"
+        )
+
+@app.get("/api/metrics/requests")
+async def get_request_metrics():
+    """Database request outcomes and latency histograms per operation, and reads collapsed by single-flight"""
+    return {**db.stats(), "single_flight": read_flights.stats()}
+
+@app.post("/api/broadcasts")
+async def create_broadcast(
+    title: str = Form(...),
+    message: str = Form(...),
+    area: str = Form(...),
+    severity: str = Form("warning"),
+    max_position_age_hours: Optional[float] = Form(None),
+    x_broadcast_token: Optional[str] = Header(None)
+):
+    """
+    Push a message to everyone whose last known position is inside a GeoJSON
+    Polygon/MultiPolygon (e.g. "evacuate now" for a flood extent)
+    """
+    if not BROADCAST_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Broadcasts are disabled")
+    if not x_broadcast_token or not hmac.compare_digest(x_broadcast_token, BROADCAST_TOKEN):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid broadcast token")
+    if severity not in BROADCAST_SEVERITIES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"severity must be one of {', '.join(BROADCAST_SEVERITIES)}")
+    try:
+        polygons = parse_area(area)
+    except GeofenceError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    since = time.time() - max_position_age_hours * 3600 if max_position_age_hours else None
+    targets = await run_in_threadpool(last_positions.within, polygons, since)
+    broadcast_id = str(uuid.uuid4())
+    if targets["user_ids"] and not notifier.publish(broadcast_notification(broadcast_id, title, message, severity, targets["user_ids"])):
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Notification queue is full, try again")
+    
+    await jobs.enqueue_durable("broadcasts.record", {
+        "id": broadcast_id,
+        "title": title,
+        "message": message,
+        "severity": severity,
+        "area": json.loads(area),
+        "recipient_count": len(targets["user_ids"]),
+        "created_at": datetime.now(timezone.utc).isoformat()
+    })
+    return {
+        "message": "Broadcast queued for delivery",
+        "broadcast_id": broadcast_id,
+        "recipients": len(targets["user_ids"]),
+        "candidates": targets["candidates"],
+        "targeting_ms": targets["elapsed_ms"]
+    }
+
+@app.get("/api/broadcasts")
+async def get_broadcasts(limit: int = 50):
+    """Recent authority broadcasts, newest first"""
+    try:
+        result = await db.read(supabase.table("broadcasts").select("*").order("created_at", desc=True).limit(min(limit, 200)), "broadcasts.list")
+        return {"broadcasts": result.data, "count": len(result.data)}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to fetch broadcasts: {str(e)}"
+        )
+
+@app.get("/api/metrics/escalations")
+async def get_escalation_metrics():
+    """Armed SOS escalation timers by level, escalations fired and timers cancelled"""
+    return escalations.stats()
+
+@app.get("/api/metrics/loop")
+async def get_loop_metrics():
+    """Event-loop lag histogram and recent blocking calls with their route and stack"""
+    return loop_monitor.stats()
+
+# Query parameters of /api/analytics that are not column filters
+ANALYTICS_OPTIONS = {"since", "until", "hours", "bbox", "group_by", "bucket", "limit", "include_duplicates"}
+
+@app.get("/api/analytics/{table}")
+async def query_snapshot(
+    table: str,
+    request: Request,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    hours: Optional[float] = None,
+    bbox: Optional[str] = None,
+    group_by: Optional[str] = None,
+    bucket: Optional[str] = None,
+    limit: int = 50,
+    include_duplicates: bool = False
+):
+    """
+    Slice incidents or SOS alerts from the in-memory columnar snapshot
+
+    Any other query parameter filters a text column by a comma-separated list
+    of values, e.g. ?emergency_type=flood,cyclone&status=active. Time windows
+    come from since/until (ISO 8601) or hours, and bbox is
+    min_lon,min_lat,max_lon,max_lat. group_by counts matches per value of a
+    column and bucket (hour or day) counts them over time.
+    """
+    try:
+        snapshot_table = snapshot.table(table)
+        where = {
+            name: [value.strip() for value in values.split(",") if value.strip()]
+            for name, values in request.query_params.items() if name not in ANALYTICS_OPTIONS
+        }
+        since_ts = parse_timestamp(since) if since else (time.time() - hours * 3600 if hours else None)
+        until_ts = parse_timestamp(until) if until else None
+        box = tuple(float(value) for value in bbox.split(",")) if bbox else None
+        if box is not None and len(box) != 4:
+            raise SnapshotError("bbox must be min_lon,min_lat,max_lon,max_lat")
+    except SnapshotError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid time or bbox: {str(e)}")
+    exclude = ("canonical_incident_id",) if table == "incidents" and not include_duplicates else ()
+    try:
+        return await run_in_threadpool(
+            snapshot_table.query, where, since_ts, until_ts, box, group_by, bucket, limit, exclude
+        )
+    except SnapshotError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+@app.get("/api/metrics/snapshot")
+async def get_snapshot_metrics():
+    """Rows, distinct values, memory and last load/refresh of each columnar snapshot table"""
+    return snapshot.stats()
+
+@app.get("/api/metrics/storage")
+async def get_storage_metrics():
+    """Photo uploads stored, de-duplicated against existing objects, released and deleted"""
+    return content_store.stats()
+
+@app.get("/api/metrics/cache")
+async def get_cache_metrics():
+    """Per-district feed/list cache sizes, hit rates, evictions and invalidations"""
+    return region_cache.stats()
+
+@app.get("/api/admin/profiler")
+async def get_profiler_settings(x_profiler_token: Optional[str] = Header(None)):
+    """Current request sampling settings"""
+    require_profiler_token(x_profiler_token)
+    return profiler.settings()
+
+@app.post("/api/admin/profiler")
+async def configure_profiler(
+    sample_rate: float = Form(...),
+    paths: str = Form(""),
+    duration_seconds: float = Form(300),
+    x_profiler_token: Optional[str] = Header(None)
+):
+    """Profile a fraction of requests (0 turns sampling off), optionally only for comma-separated path prefixes"""
+    require_profiler_token(x_profiler_token)
+    if not 0 <= sample_rate <= 1:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="sample_rate must be between 0 and 1")
+    return profiler.configure(sample_rate, [path.strip() for path in paths.split(",")], min(duration_seconds, 3600))
+
+@app.get("/api/admin/profiles")
+async def list_profiles(path: Optional[str] = None, limit: int = 100, x_profiler_token: Optional[str] = Header(None)):
+    """Stored request profiles, newest first"""
+    require_profiler_token(x_profiler_token)
+    profiles = profiler.list(path, limit)
+    return {"profiles": profiles, "count": len(profiles)}
+
+@app.get("/api/admin/profiles/{profile_id}")
+async def download_profile(profile_id: str, x_profiler_token: Optional[str] = Header(None)):
+    """A profile's folded stacks, for flamegraph.pl or speedscope"""
+    require_profiler_token(x_profiler_token)
+    path = profiler.folded_path(profile_id)
+    if path is None or not os.path.exists(path):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=f"{profile_id}.folded")
+
+@app.get("/api/jobs/stats")
+async def get_job_stats():
+    """Background job queue depth, lag and counters"""
+    return jobs.stats()
+
+@app.get("/api/notifications/stats")
+async def get_notification_stats():
+    """Fan-out queue and delivery counters"""
+    return notifier.stats()
+
+@app.post("/api/uploads")
+async def create_direct_upload(
+    target_type: str = Form(...),
+    filename: str = Form(...),
+    content_type: str = Form(...),
+    sha256: str = Form(...),
+    file_size: Optional[int] = Form(None)
+):
+    """Get a short-lived signed target to upload a photo directly to storage"""
+    try:
+        return await run_in_threadpool(direct_uploads.create_upload, target_type, filename, content_type, sha256, file_size)
+    except UploadError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to create upload: {str(e)}"
+        )
+
+@app.post("/api/uploads/confirm")
+async def confirm_direct_upload(
+    upload_token: str = Form(...),
+    target_id: Optional[str] = Form(None)
+):
+    """Confirm a direct upload and link it to its incident, missing-person, post or user row"""
+    try:
+        upload = await direct_uploads.confirm_upload(upload_token, target_id)
+    except UploadError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to confirm upload: {str(e)}"
+        )
+
+    await invalidate_upload_target(upload, target_id)
+    # Fingerprint new photos in the background; the bytes never passed
+    # through this process, so they are read once, off the request path
+    if not upload["reused"]:
+        photo_matcher.submit(
+            lambda: upload_backend.read(upload["bucket"], upload["path"]),
+            upload["public_url"],
+            BUCKET_SOURCES.get(upload["bucket"], upload["bucket"])
+        )
+    return {"message": "Upload confirmed", **upload}
+
+@app.put("/api/uploads/local/{upload_token}")
+async def receive_local_upload(upload_token: str, request: Request):
+    """Local storage stand-in: receive a direct upload (UPLOAD_BACKEND=local only)"""
+    if not isinstance(upload_backend, LocalUploadBackend):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Not Found"
+        )
+    try:
+        claims = direct_uploads.decode_token(upload_token)
+        size = await upload_backend.receive(claims["bucket"], claims["path"], request.stream())
+    except UploadError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    return {"message": "Upload received", "path": claims["path"], "size": size}
+
+@app.get("/api/uploads/local/files/{bucket}/{object_path:path}")
+async def get_local_upload(bucket: str, object_path: str):
+    """Local storage stand-in: serve an uploaded object"""
+    if not isinstance(upload_backend, LocalUploadBackend):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Not Found"
+        )
+    try:
+        full_path = upload_backend.object_path(bucket, object_path)
+    except UploadError:
+        full_path = None
+    if not full_path or not os.path.isfile(full_path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    return FileResponse(full_path)
+
+@app.post("/api/uploads/resumable")
+async def create_resumable_upload(
+    filename: str = Form(...),
+    content_type: str = Form(...),
+    total_size: int = Form(...),
+    sha256: Optional[str] = Form(None)
+):
+    """Start a resumable chunked upload"""
+    try:
+        return await run_in_threadpool(resumable_uploads.create, filename, content_type, total_size, sha256)
+    except UploadError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+@app.get("/api/uploads/resumable/{upload_id}")
+async def get_resumable_upload(upload_id: str):
+    """Get the server-side offset of a resumable upload"""
+    try:
+        return await run_in_threadpool(resumable_uploads.status, upload_id)
+    except UploadError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+
+@app.put("/api/uploads/resumable/{upload_id}")
+async def upload_resumable_chunk(upload_id: str, offset: int, request: Request):
+    """Upload one chunk; the X-Chunk-SHA256 header must hold the chunk's SHA-256"""
+    too_large = HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Chunks must be at most {resumable_uploads.chunk_size} bytes"
+    )
+    if int(request.headers.get("content-length") or 0) > resumable_uploads.chunk_size:
+        raise too_large
+    # Chunked requests carry no content-length, so cap the body as it streams in
+    received = bytearray()
+    async for part in request.stream():
+        received += part
+        if len(received) > resumable_uploads.chunk_size:
+            raise too_large
+    data = bytes(received)
+    try:
+        return await run_in_threadpool(
+            resumable_uploads.write_chunk, upload_id, offset, data, request.headers.get("x-chunk-sha256", "")
+        )
+    except OffsetMismatch as e:
+        return JSONResponse(
+            status_code=status.HTTP_409_CONFLICT,
+            content={"detail": str(e), "offset": e.offset}
+        )
+    except UploadError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+@app.post("/api/uploads/resumable/{upload_id}/attach")
+async def attach_resumable_upload(
+    upload_id: str,
+    target_type: str = Form(...),
+    target_id: Optional[str] = Form(None)
+):
+    """Store a finished resumable upload and link it to an incident, missing-person, post or user row"""
+    try:
+        upload = await run_in_threadpool(resumable_uploads.completed_file, upload_id)
+        attached = await direct_uploads.attach_file(
+            target_type, target_id, upload["path"], upload["content_type"], upload["digest"], upload["total_size"]
+        )
+    except UploadError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to attach upload: {str(e)}"
+        )
+
+    await invalidate_upload_target(attached, target_id)
+
+    def fingerprint_source():
+        # The assembled file is still on local disk; it goes once fingerprinted
+        try:
+            with open(upload["path"], "rb") as file:
+                return file.read()
+        finally:
+            resumable_uploads.delete(upload_id)
+
+    queued = not attached["reused"] and photo_matcher.submit(
+        fingerprint_source,
+        attached["public_url"],
+        BUCKET_SOURCES.get(attached["bucket"], attached["bucket"])
+    )
+    if not queued:
+        await run_in_threadpool(resumable_uploads.delete, upload_id)
+    return {"message": "Upload attached", **attached}
+
+async def collect_abandoned_uploads():
+    """Periodically remove resumable uploads that were never finished or attached"""
+    while True:
+        await asyncio.sleep(3600)
+        try:
+            removed = await run_in_threadpool(resumable_uploads.collect_garbage)
+            if removed:
+                print(f"Removed {removed} abandoned resumable uploads")
+        except Exception as e:
+            print(f"Error collecting abandoned uploads: {e}")
+
+@app.get("/api/export/{table}")
+async def export_reports(
+    table: str,
+    export_format: str = Query("ndjson", alias="format"),
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    record_type: Optional[str] = Query(None, alias="type"),
+    record_status: Optional[str] = Query(None, alias="status"),
+    include_history: bool = False
+):
+    """Stream a full export of incidents, missing_persons or sos_alerts as NDJSON, CSV or Parquet"""
+    try:
+        body = stream_export(
+            supabase, table, export_format,
+            since=since, until=until, record_type=record_type, record_status=record_status,
+            include_history=include_history
+        )
+    except ExportError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    media_type, extension = EXPORT_FORMATS[export_format]
+    filename = f"{table}-{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}.{extension}"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+async def run_retention_periodically():
+    """Archive resolved and aged rows on a fixed schedule"""
+    while True:
+        try:
+            moved = await run_in_threadpool(retention_job.run_once)
+            if any(moved.values()):
+                print(f"Archived rows: {moved}")
+            # Archived rows leave the snapshot with a refresh
+            for table, count in moved.items():
+                if count and table in snapshot.tables:
+                    await snapshot.refresh(supabase, table)
+        except Exception as e:
+            print(f"Error running retention job: {e}")
+        await asyncio.sleep(RETENTION_INTERVAL_HOURS * 3600)
+
+@app.post("/api/photos/match")
+async def match_photo(
+    photo: UploadFile = File(...),
+    max_distance: int = Form(DEFAULT_MATCH_DISTANCE),
+    limit: int = Form(20)
+):
+    """Find stored photos that look like the uploaded one"""
+    if not 0 <= max_distance <= MAX_MATCH_DISTANCE:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"max_distance must be between 0 and {MAX_MATCH_DISTANCE}")
+    try:
+        image_bytes = await photo.read()
+        image_hash = await run_in_threadpool(compute_image_hash, image_bytes)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Could not read image: {str(e)}"
+        )
+
+    matches = photo_matcher.index.search(image_hash, max_distance=max_distance, limit=limit)
+    return {"hash": hash_to_hex(image_hash), "matches": matches, "count": len(matches)}
+
+@app.get("/api/photos/matches")
+async def get_photo_matches(match_status: str = "pending", limit: int = 100):
+    """Get candidate photo matches flagged by the background matcher"""
+    try:
+        result = await db.read(supabase.table("photo_matches").select("*").eq("status", match_status).order("distance").limit(limit), "photo_matches.list")
+        return {"matches": result.data, "count": len(result.data)}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to fetch photo matches: {str(e)}"
+        )
+
+@app.get("/api/missing/{report_id}/matches")
+async def get_missing_person_matches(report_id: str):
+    """Likely matches for an open missing-person report among users, safe marks and community posts, best first"""
+    matches = await run_in_threadpool(person_linker.index.candidates_for, MISSING, f"missing_person:{report_id}")
+    if matches is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No open missing-person report with that id")
+    return {"matches": matches, "count": len(matches)}
+
+@app.get("/api/linkage/matches")
+async def get_person_matches(match_status: str = "pending", limit: int = 100):
+    """Get candidate person matches flagged by the background linker"""
+    try:
+        result = await db.read(supabase.table("person_matches").select("*").eq("status", match_status).order("score", desc=True).limit(limit), "person_matches.list")
+        return {"matches": result.data, "count": len(result.data)}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to fetch person matches: {str(e)}"
+        )
+
+@jobs.job("linkage.run_batch")
+async def run_linkage_batch(payload: dict):
+    """Re-match every open report against everyone found so far"""
+    flagged = await person_linker.run_batch()
+    print(f"Linkage batch flagged {flagged} candidate matches")
+
+@app.post("/api/linkage/run")
+async def start_linkage_batch():
+    """Queue a full re-match of open missing-person reports (e.g. after lowering LINKAGE_MIN_SCORE)"""
+    return {"message": "Linkage batch queued", "job_id": jobs.enqueue("linkage.run_batch")}
+
+@app.get("/api/metrics/linkage")
+async def get_linkage_metrics():
+    """Records per source, blocks, comparisons made and matches flagged by the linker"""
+    return person_linker.stats()
+
 # Test database connection on startup
 @app.on_event("startup")
 async def startup_event():
@@ -589,6 +1769,76 @@ async def startup_event():
     except Exception as e:
         print(f"❌ Failed to connect to Supabase: {e}")
 
+    try:
+        incident_dedup.warm(supabase)
+    except Exception as e:
+        print(f"❌ Failed to load recent incidents for de-duplication: {e}")
+
+    try:
+        safety_status.warm(supabase)
+    except Exception as e:
+        print(f"❌ Failed to load safety status index: {e}")
+
+    try:
+        notification_subscribers.warm(supabase)
+    except Exception as e:
+        print(f"❌ Failed to load notification subscribers: {e}")
+
+    try:
+        last_positions.warm(supabase)
+    except Exception as e:
+        print(f"❌ Failed to load last known positions: {e}")
+
+    try:
+        snapshot.warm(supabase)
+    except Exception as e:
+        print(f"❌ Failed to build columnar snapshot: {e}")
+
+    try:
+        escalations.warm(supabase)
+    except Exception as e:
+        print(f"❌ Failed to arm SOS escalation timers: {e}")
+    # Rows still waiting in the local spool count too: safe marks first, so
+    # alerts raised before them are not escalated
+    for mark in await critical_writes.pending("safe_status"):
+        safety_status.record_safe(mark)
+    for alert in await critical_writes.pending("sos_alerts"):
+        if alert["id"] not in escalations.alerts:
+            escalations.arm(alert)
+    escalations.start()
+    notifier.start()
+    jobs.start()
+    critical_writes.start()
+
+    try:
+        photo_matcher.warm()
+    except Exception as e:
+        print(f"❌ Failed to load photo hash index: {e}")
+    photo_matcher.start()
+
+    try:
+        person_linker.warm()
+    except Exception as e:
+        print(f"❌ Failed to load missing-person linkage index: {e}")
+    person_linker.start()
+    asyncio.create_task(collect_abandoned_uploads())
+    asyncio.create_task(run_retention_periodically())
+    asyncio.create_task(snapshot.refresh_periodically(supabase, SNAPSHOT_REFRESH_MINUTES * 60))
+    # Started last so the blocking warm-up above is not reported
+    loop_monitor.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background workers"""
+    await loop_monitor.stop()
+    await escalations.stop()
+    await jobs.stop()
+    await critical_writes.stop()
+    await photo_matcher.stop()
+    await person_linker.stop()
+    await notifier.stop()
+    await storage_pool.aclose()
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 8000))
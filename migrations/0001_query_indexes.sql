@@ -0,0 +1,53 @@
+-- migrate:no-transaction
+-- Composite and partial indexes matching the hot queries in main.py and app/routes/*.
+-- Built CONCURRENTLY so they can be applied to a live database.
+
+-- GET /api/sos, /api/sos/nearby: status = 'active' ORDER BY created_at DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sos_alerts_active_created_at
+    ON sos_alerts (created_at DESC) WHERE status = 'active';
+
+-- app/routes/sos.py create_sos_alert / mark_safe: user_id = ? AND status = 'active'
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sos_alerts_active_user_id
+    ON sos_alerts (user_id) WHERE status = 'active';
+
+-- GET /api/missing: status = 'missing' ORDER BY created_at DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_missing_persons_missing_created_at
+    ON missing_persons (created_at DESC) WHERE status = 'missing';
+
+-- GET /api/incidents and the community feed: canonical incidents ORDER BY created_at DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_incidents_canonical_created_at
+    ON incidents (created_at DESC) WHERE canonical_incident_id IS NULL;
+
+-- GET /api/community and the feed: ORDER BY created_at DESC LIMIT n
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_community_posts_created_at
+    ON community_posts (created_at DESC);
+
+-- app/routes/community.py: category = ? ORDER BY created_at DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_community_posts_category_created_at
+    ON community_posts (category, created_at DESC);
+
+-- Latest safe mark per user and the safe_status retention check
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_safe_status_user_created_at
+    ON safe_status (user_id, created_at DESC);
+
+-- /api/export keyset pagination: ORDER BY created_at, id
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_incidents_created_at_id
+    ON incidents (created_at, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_missing_persons_created_at_id
+    ON missing_persons (created_at, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sos_alerts_created_at_id
+    ON sos_alerts (created_at, id);
+
+-- Retention: resolved rows ordered by age
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sos_alerts_closed_updated_at
+    ON sos_alerts (updated_at) WHERE status IN ('resolved', 'false_alarm');
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_incidents_resolved_updated_at
+    ON incidents (updated_at) WHERE status = 'resolved' AND canonical_incident_id IS NULL;
+
+-- GET /api/photos/matches: status = ? ORDER BY distance
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_photo_matches_status_distance
+    ON photo_matches (status, distance);
+
+-- Superseded by the composite/partial indexes above
+DROP INDEX CONCURRENTLY IF EXISTS idx_sos_alerts_status;
+DROP INDEX CONCURRENTLY IF EXISTS idx_photo_matches_status;
@@ -0,0 +1,6 @@
+-- app/routes/missing_persons.py searches with name ILIKE '%term%', which a
+-- btree index cannot serve. A trigram GIN index can.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_missing_persons_name_trgm
+    ON missing_persons USING GIN (name gin_trgm_ops);
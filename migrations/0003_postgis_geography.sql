@@ -0,0 +1,96 @@
+-- migrate:no-transaction
+-- PostGIS geography points for every table with coordinates, as GiST
+-- expression indexes over latitude/longitude. No column is added, so the hot
+-- tables are not rewritten, and the indexes are built CONCURRENTLY so writes
+-- continue while they build (see 0001). Queries use geo_point(latitude,
+-- longitude), the indexed expression (see 0004).
+CREATE EXTENSION IF NOT EXISTS postgis;
+
+CREATE OR REPLACE FUNCTION geo_point(latitude NUMERIC, longitude NUMERIC)
+RETURNS geography AS $$
+    SELECT ST_SetSRID(ST_MakePoint(longitude::float8, latitude::float8), 4326)::geography;
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sos_alerts_geog
+    ON sos_alerts USING GIST (geo_point(latitude, longitude));
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sos_alerts_active_geog
+    ON sos_alerts USING GIST (geo_point(latitude, longitude)) WHERE status = 'active';
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_incidents_geog
+    ON incidents USING GIST (geo_point(latitude, longitude)) WHERE latitude IS NOT NULL AND longitude IS NOT NULL;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_safe_status_geog
+    ON safe_status USING GIST (geo_point(latitude, longitude));
+
+-- The archive functions copied rows with SELECT *, which breaks as soon as
+-- the hot table and its archive differ by a column. Copy explicit column
+-- lists instead.
+CREATE OR REPLACE FUNCTION archive_sos_alerts(cutoff TIMESTAMPTZ, batch_size INTEGER DEFAULT 500)
+RETURNS INTEGER AS $$
+DECLARE
+    moved INTEGER;
+BEGIN
+    WITH batch AS (
+        SELECT id FROM sos_alerts
+        WHERE status IN ('resolved', 'false_alarm') AND updated_at < cutoff
+        ORDER BY created_at
+        LIMIT batch_size
+        FOR UPDATE SKIP LOCKED
+    ), removed AS (
+        DELETE FROM sos_alerts WHERE id IN (SELECT id FROM batch)
+        RETURNING id, user_id, user_name, latitude, longitude, location_description,
+                  emergency_type, status, created_at, updated_at
+    )
+    INSERT INTO sos_alerts_archive (id, user_id, user_name, latitude, longitude, location_description,
+                                    emergency_type, status, created_at, updated_at)
+    SELECT * FROM removed;
+    GET DIAGNOSTICS moved = ROW_COUNT;
+    RETURN moved;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION archive_incidents(cutoff TIMESTAMPTZ, batch_size INTEGER DEFAULT 500)
+RETURNS INTEGER AS $$
+DECLARE
+    moved INTEGER;
+BEGIN
+    WITH canonical AS (
+        SELECT id FROM incidents
+        WHERE status = 'resolved' AND canonical_incident_id IS NULL AND updated_at < cutoff
+        ORDER BY created_at
+        LIMIT batch_size
+        FOR UPDATE SKIP LOCKED
+    ), removed AS (
+        DELETE FROM incidents
+        WHERE id IN (SELECT id FROM canonical) OR canonical_incident_id IN (SELECT id FROM canonical)
+        RETURNING id, user_id, incident_type, description, location, latitude, longitude, photo_url,
+                  status, canonical_incident_id, report_count, created_at, updated_at
+    )
+    INSERT INTO incidents_archive (id, user_id, incident_type, description, location, latitude, longitude,
+                                   photo_url, status, canonical_incident_id, report_count, created_at, updated_at)
+    SELECT * FROM removed;
+    GET DIAGNOSTICS moved = ROW_COUNT;
+    RETURN moved;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION archive_safe_status(cutoff TIMESTAMPTZ, batch_size INTEGER DEFAULT 500)
+RETURNS INTEGER AS $$
+DECLARE
+    moved INTEGER;
+BEGIN
+    WITH batch AS (
+        SELECT id FROM safe_status s
+        WHERE created_at < cutoff
+          AND EXISTS (SELECT 1 FROM safe_status newer WHERE newer.user_id = s.user_id AND newer.created_at > s.created_at)
+        ORDER BY created_at
+        LIMIT batch_size
+        FOR UPDATE SKIP LOCKED
+    ), removed AS (
+        DELETE FROM safe_status WHERE id IN (SELECT id FROM batch)
+        RETURNING id, user_id, user_name, latitude, longitude, message, created_at
+    )
+    INSERT INTO safe_status_archive (id, user_id, user_name, latitude, longitude, message, created_at)
+    SELECT * FROM removed;
+    GET DIAGNOSTICS moved = ROW_COUNT;
+    RETURN moved;
+END;
+$$ LANGUAGE plpgsql;
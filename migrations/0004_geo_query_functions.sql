@@ -0,0 +1,70 @@
+-- Radius and bounding-box lookups, callable through PostgREST as RPCs
+-- (supabase.rpc("sos_alerts_within_radius", {...})). All of them are
+-- answered from the GiST indexes on geo_point(latitude, longitude), so they
+-- return only the table's own columns.
+
+CREATE OR REPLACE FUNCTION sos_alerts_within_radius(
+    lat DOUBLE PRECISION,
+    lon DOUBLE PRECISION,
+    radius_m DOUBLE PRECISION,
+    only_active BOOLEAN DEFAULT TRUE,
+    max_rows INTEGER DEFAULT 500
+)
+RETURNS SETOF sos_alerts AS $$
+    SELECT *
+    FROM sos_alerts
+    WHERE ST_DWithin(geo_point(latitude, longitude), ST_SetSRID(ST_MakePoint(lon, lat), 4326)::geography, radius_m)
+      AND (NOT only_active OR status = 'active')
+    ORDER BY geo_point(latitude, longitude) <-> ST_SetSRID(ST_MakePoint(lon, lat), 4326)::geography
+    LIMIT max_rows;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION incidents_within_radius(
+    lat DOUBLE PRECISION,
+    lon DOUBLE PRECISION,
+    radius_m DOUBLE PRECISION,
+    max_rows INTEGER DEFAULT 500
+)
+RETURNS SETOF incidents AS $$
+    SELECT *
+    FROM incidents
+    WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+      AND ST_DWithin(geo_point(latitude, longitude), ST_SetSRID(ST_MakePoint(lon, lat), 4326)::geography, radius_m)
+      AND canonical_incident_id IS NULL
+    ORDER BY geo_point(latitude, longitude) <-> ST_SetSRID(ST_MakePoint(lon, lat), 4326)::geography
+    LIMIT max_rows;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION sos_alerts_in_bbox(
+    min_lat DOUBLE PRECISION,
+    min_lon DOUBLE PRECISION,
+    max_lat DOUBLE PRECISION,
+    max_lon DOUBLE PRECISION,
+    only_active BOOLEAN DEFAULT TRUE,
+    max_rows INTEGER DEFAULT 1000
+)
+RETURNS SETOF sos_alerts AS $$
+    SELECT *
+    FROM sos_alerts
+    WHERE geo_point(latitude, longitude) && ST_MakeEnvelope(min_lon, min_lat, max_lon, max_lat, 4326)::geography
+      AND (NOT only_active OR status = 'active')
+    ORDER BY created_at DESC
+    LIMIT max_rows;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION incidents_in_bbox(
+    min_lat DOUBLE PRECISION,
+    min_lon DOUBLE PRECISION,
+    max_lat DOUBLE PRECISION,
+    max_lon DOUBLE PRECISION,
+    max_rows INTEGER DEFAULT 1000
+)
+RETURNS SETOF incidents AS $$
+    SELECT *
+    FROM incidents
+    WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+      AND geo_point(latitude, longitude) && ST_MakeEnvelope(min_lon, min_lat, max_lon, max_lat, 4326)::geography
+      AND canonical_incident_id IS NULL
+    ORDER BY created_at DESC
+    LIMIT max_rows;
+$$ LANGUAGE sql STABLE;
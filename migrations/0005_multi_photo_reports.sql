@@ -0,0 +1,52 @@
+-- Several photos per incident and missing-person report. photo_url keeps the
+-- first (cover) photo for existing clients; photo_urls holds all of them.
+ALTER TABLE incidents ADD COLUMN IF NOT EXISTS photo_urls TEXT[] DEFAULT '{}';
+ALTER TABLE missing_persons ADD COLUMN IF NOT EXISTS photo_urls TEXT[] DEFAULT '{}';
+ALTER TABLE incidents_archive ADD COLUMN IF NOT EXISTS photo_urls TEXT[] DEFAULT '{}';
+
+UPDATE incidents SET photo_urls = ARRAY[photo_url] WHERE photo_url IS NOT NULL AND photo_urls = '{}';
+UPDATE missing_persons SET photo_urls = ARRAY[photo_url] WHERE photo_url IS NOT NULL AND photo_urls = '{}';
+
+-- Append a photo to a report atomically (used when linking direct uploads)
+CREATE OR REPLACE FUNCTION attach_report_photo(target_table TEXT, row_id UUID, url TEXT)
+RETURNS BOOLEAN AS $$
+DECLARE
+    updated INTEGER;
+BEGIN
+    IF target_table NOT IN ('incidents', 'missing_persons') THEN
+        RAISE EXCEPTION 'Photos cannot be attached to %', target_table;
+    END IF;
+    EXECUTE format(
+        'UPDATE %I SET photo_url = COALESCE(photo_url, $1), photo_urls = array_append(COALESCE(photo_urls, ''{}''), $1) WHERE id = $2',
+        target_table
+    ) USING url, row_id;
+    GET DIAGNOSTICS updated = ROW_COUNT;
+    RETURN updated > 0;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Carry photo_urls into the archive
+CREATE OR REPLACE FUNCTION archive_incidents(cutoff TIMESTAMPTZ, batch_size INTEGER DEFAULT 500)
+RETURNS INTEGER AS $$
+DECLARE
+    moved INTEGER;
+BEGIN
+    WITH canonical AS (
+        SELECT id FROM incidents
+        WHERE status = 'resolved' AND canonical_incident_id IS NULL AND updated_at < cutoff
+        ORDER BY created_at
+        LIMIT batch_size
+        FOR UPDATE SKIP LOCKED
+    ), removed AS (
+        DELETE FROM incidents
+        WHERE id IN (SELECT id FROM canonical) OR canonical_incident_id IN (SELECT id FROM canonical)
+        RETURNING id, user_id, incident_type, description, location, latitude, longitude, photo_url,
+                  status, canonical_incident_id, report_count, created_at, updated_at, photo_urls
+    )
+    INSERT INTO incidents_archive (id, user_id, incident_type, description, location, latitude, longitude,
+                                   photo_url, status, canonical_incident_id, report_count, created_at, updated_at, photo_urls)
+    SELECT * FROM removed;
+    GET DIAGNOSTICS moved = ROW_COUNT;
+    RETURN moved;
+END;
+$$ LANGUAGE plpgsql;
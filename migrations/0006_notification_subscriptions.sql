@@ -0,0 +1,21 @@
+-- Volunteers who want to be told about SOS alerts and major incidents near
+-- them: a home position with a watch radius, and/or a city.
+CREATE TABLE IF NOT EXISTS notification_subscriptions (
+    user_id UUID PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    latitude DECIMAL(10, 8),
+    longitude DECIMAL(11, 8),
+    radius_km REAL NOT NULL DEFAULT 5 CHECK (radius_km > 0 AND radius_km <= 50),
+    city VARCHAR(255),
+    active BOOLEAN NOT NULL DEFAULT TRUE,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    CHECK ((latitude IS NOT NULL AND longitude IS NOT NULL) OR city IS NOT NULL)
+);
+
+CREATE INDEX IF NOT EXISTS idx_notification_subscriptions_active ON notification_subscriptions(active);
+
+CREATE TRIGGER notification_subscriptions_updated_at
+    BEFORE UPDATE ON notification_subscriptions
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+ALTER TABLE notification_subscriptions ENABLE ROW LEVEL SECURITY;
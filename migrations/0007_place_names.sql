@@ -0,0 +1,93 @@
+-- Nearest place, district and state from the offline reverse geocoder
+-- (app/geocoder.py), stored on write so lists can filter by district.
+ALTER TABLE sos_alerts ADD COLUMN IF NOT EXISTS place_name TEXT;
+ALTER TABLE sos_alerts ADD COLUMN IF NOT EXISTS district TEXT;
+ALTER TABLE sos_alerts ADD COLUMN IF NOT EXISTS state TEXT;
+ALTER TABLE incidents ADD COLUMN IF NOT EXISTS place_name TEXT;
+ALTER TABLE incidents ADD COLUMN IF NOT EXISTS district TEXT;
+ALTER TABLE incidents ADD COLUMN IF NOT EXISTS state TEXT;
+ALTER TABLE sos_alerts_archive ADD COLUMN IF NOT EXISTS place_name TEXT;
+ALTER TABLE sos_alerts_archive ADD COLUMN IF NOT EXISTS district TEXT;
+ALTER TABLE sos_alerts_archive ADD COLUMN IF NOT EXISTS state TEXT;
+ALTER TABLE incidents_archive ADD COLUMN IF NOT EXISTS place_name TEXT;
+ALTER TABLE incidents_archive ADD COLUMN IF NOT EXISTS district TEXT;
+ALTER TABLE incidents_archive ADD COLUMN IF NOT EXISTS state TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_sos_alerts_district_created_at ON sos_alerts(district, created_at DESC) WHERE status = 'active';
+CREATE INDEX IF NOT EXISTS idx_incidents_district_created_at ON incidents(district, created_at DESC) WHERE canonical_incident_id IS NULL;
+
+-- Carry the place columns into the archives
+CREATE OR REPLACE FUNCTION archive_sos_alerts(cutoff TIMESTAMPTZ, batch_size INTEGER DEFAULT 500)
+RETURNS INTEGER AS $$
+DECLARE
+    moved INTEGER;
+BEGIN
+    WITH batch AS (
+        SELECT id FROM sos_alerts
+        WHERE status IN ('resolved', 'false_alarm') AND updated_at < cutoff
+        ORDER BY created_at
+        LIMIT batch_size
+        FOR UPDATE SKIP LOCKED
+    ), removed AS (
+        DELETE FROM sos_alerts WHERE id IN (SELECT id FROM batch)
+        RETURNING id, user_id, user_name, latitude, longitude, location_description,
+                  emergency_type, status, created_at, updated_at, place_name, district, state
+    )
+    INSERT INTO sos_alerts_archive (id, user_id, user_name, latitude, longitude, location_description,
+                                    emergency_type, status, created_at, updated_at, place_name, district, state)
+    SELECT * FROM removed;
+    GET DIAGNOSTICS moved = ROW_COUNT;
+    RETURN moved;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION archive_incidents(cutoff TIMESTAMPTZ, batch_size INTEGER DEFAULT 500)
+RETURNS INTEGER AS $$
+DECLARE
+    moved INTEGER;
+BEGIN
+    WITH canonical AS (
+        SELECT id FROM incidents
+        WHERE status = 'resolved' AND canonical_incident_id IS NULL AND updated_at < cutoff
+        ORDER BY created_at
+        LIMIT batch_size
+        FOR UPDATE SKIP LOCKED
+    ), removed AS (
+        DELETE FROM incidents
+        WHERE id IN (SELECT id FROM canonical) OR canonical_incident_id IN (SELECT id FROM canonical)
+        RETURNING id, user_id, incident_type, description, location, latitude, longitude, photo_url,
+                  status, canonical_incident_id, report_count, created_at, updated_at, photo_urls,
+                  place_name, district, state
+    )
+    INSERT INTO incidents_archive (id, user_id, incident_type, description, location, latitude, longitude,
+                                   photo_url, status, canonical_incident_id, report_count, created_at, updated_at,
+                                   photo_urls, place_name, district, state)
+    SELECT * FROM removed;
+    GET DIAGNOSTICS moved = ROW_COUNT;
+    RETURN moved;
+END;
+$$ LANGUAGE plpgsql;
+
+-- The history views were created with SELECT * and so froze the original
+-- columns; list them explicitly so later columns are visible through them
+DROP VIEW IF EXISTS sos_alerts_history;
+CREATE VIEW sos_alerts_history AS
+    SELECT id, user_id, user_name, latitude, longitude, location_description, emergency_type, status,
+           created_at, updated_at, place_name, district, state, NULL::TIMESTAMPTZ AS archived_at
+    FROM sos_alerts
+    UNION ALL
+    SELECT id, user_id, user_name, latitude, longitude, location_description, emergency_type, status,
+           created_at, updated_at, place_name, district, state, archived_at
+    FROM sos_alerts_archive;
+
+DROP VIEW IF EXISTS incidents_history;
+CREATE VIEW incidents_history AS
+    SELECT id, user_id, incident_type, description, location, latitude, longitude, photo_url, photo_urls, status,
+           canonical_incident_id, report_count, created_at, updated_at, place_name, district, state,
+           NULL::TIMESTAMPTZ AS archived_at
+    FROM incidents
+    UNION ALL
+    SELECT id, user_id, incident_type, description, location, latitude, longitude, photo_url, photo_urls, status,
+           canonical_incident_id, report_count, created_at, updated_at, place_name, district, state,
+           archived_at
+    FROM incidents_archive;
@@ -0,0 +1,7 @@
+-- District and state of community posts, resolved from the post's location
+-- text (or the poster's city) so feeds can be built per region.
+ALTER TABLE community_posts ADD COLUMN IF NOT EXISTS district TEXT;
+ALTER TABLE community_posts ADD COLUMN IF NOT EXISTS state TEXT;
+
+-- GET /api/community?district= and the regional feed: district = ? ORDER BY created_at DESC LIMIT n
+CREATE INDEX IF NOT EXISTS idx_community_posts_district_created_at ON community_posts(district, created_at DESC);
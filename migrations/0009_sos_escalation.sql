@@ -0,0 +1,48 @@
+-- Escalation of unanswered SOS alerts (app/escalation.py): the level an
+-- alert has reached, its priority, and when it last escalated. Timers are
+-- re-armed from these after a restart.
+ALTER TABLE sos_alerts ADD COLUMN IF NOT EXISTS escalation_level INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE sos_alerts ADD COLUMN IF NOT EXISTS priority TEXT NOT NULL DEFAULT 'normal';
+ALTER TABLE sos_alerts ADD COLUMN IF NOT EXISTS escalated_at TIMESTAMPTZ;
+ALTER TABLE sos_alerts_archive ADD COLUMN IF NOT EXISTS escalation_level INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE sos_alerts_archive ADD COLUMN IF NOT EXISTS priority TEXT NOT NULL DEFAULT 'normal';
+ALTER TABLE sos_alerts_archive ADD COLUMN IF NOT EXISTS escalated_at TIMESTAMPTZ;
+
+-- Carry the escalation columns into the archive
+CREATE OR REPLACE FUNCTION archive_sos_alerts(cutoff TIMESTAMPTZ, batch_size INTEGER DEFAULT 500)
+RETURNS INTEGER AS $$
+DECLARE
+    moved INTEGER;
+BEGIN
+    WITH batch AS (
+        SELECT id FROM sos_alerts
+        WHERE status IN ('resolved', 'false_alarm') AND updated_at < cutoff
+        ORDER BY created_at
+        LIMIT batch_size
+        FOR UPDATE SKIP LOCKED
+    ), removed AS (
+        DELETE FROM sos_alerts WHERE id IN (SELECT id FROM batch)
+        RETURNING id, user_id, user_name, latitude, longitude, location_description,
+                  emergency_type, status, created_at, updated_at, place_name, district, state,
+                  escalation_level, priority, escalated_at
+    )
+    INSERT INTO sos_alerts_archive (id, user_id, user_name, latitude, longitude, location_description,
+                                    emergency_type, status, created_at, updated_at, place_name, district, state,
+                                    escalation_level, priority, escalated_at)
+    SELECT * FROM removed;
+    GET DIAGNOSTICS moved = ROW_COUNT;
+    RETURN moved;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP VIEW IF EXISTS sos_alerts_history;
+CREATE VIEW sos_alerts_history AS
+    SELECT id, user_id, user_name, latitude, longitude, location_description, emergency_type, status,
+           created_at, updated_at, place_name, district, state, escalation_level, priority, escalated_at,
+           NULL::TIMESTAMPTZ AS archived_at
+    FROM sos_alerts
+    UNION ALL
+    SELECT id, user_id, user_name, latitude, longitude, location_description, emergency_type, status,
+           created_at, updated_at, place_name, district, state, escalation_level, priority, escalated_at,
+           archived_at
+    FROM sos_alerts_archive;
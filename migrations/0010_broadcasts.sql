@@ -0,0 +1,13 @@
+-- Geo-fenced authority broadcasts (app/geofence.py): what was sent, to
+-- which area, and how many users were inside it.
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id UUID PRIMARY KEY,
+    title TEXT NOT NULL,
+    message TEXT NOT NULL,
+    severity TEXT NOT NULL DEFAULT 'warning',
+    area JSONB NOT NULL,
+    recipient_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_broadcasts_created_at ON broadcasts (created_at DESC);
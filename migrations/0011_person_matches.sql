@@ -0,0 +1,18 @@
+-- Candidate matches between missing-person reports and people found since
+-- (app/linkage.py): registered users, safe marks and people named in
+-- community posts. One row per pair, for volunteers to review.
+CREATE TABLE IF NOT EXISTS person_matches (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    missing_person_id UUID NOT NULL REFERENCES missing_persons(id) ON DELETE CASCADE,
+    missing_name TEXT NOT NULL,
+    matched_source_type VARCHAR(50) NOT NULL,
+    matched_id TEXT NOT NULL,
+    matched_name TEXT NOT NULL,
+    score REAL NOT NULL,
+    reasons JSONB DEFAULT '{}',
+    status VARCHAR(20) DEFAULT 'pending',
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    UNIQUE (missing_person_id, matched_source_type, matched_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_person_matches_status_score ON person_matches (status, score DESC);
@@ -0,0 +1,48 @@
+-- Content-addressed photo storage (app/content_store.py). Photos are stored
+-- at sha256/<2 hex>/<sha256> in their bucket; every report, post or profile
+-- using one holds a reference. The first reference uploads the object and
+-- the object is deleted when the last one is released.
+CREATE TABLE IF NOT EXISTS stored_objects (
+    bucket TEXT NOT NULL,
+    content_hash CHAR(64) NOT NULL,
+    path TEXT NOT NULL,
+    size BIGINT,
+    content_type TEXT,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    last_used_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (bucket, content_hash)
+);
+
+-- Take a reference; created is true when this call added the object, so the
+-- caller has to upload it
+CREATE OR REPLACE FUNCTION acquire_stored_object(
+    p_bucket TEXT,
+    p_content_hash TEXT,
+    p_path TEXT,
+    p_size BIGINT DEFAULT NULL,
+    p_content_type TEXT DEFAULT NULL
+)
+RETURNS TABLE (path TEXT, ref_count INTEGER, created BOOLEAN) AS $$
+    INSERT INTO stored_objects AS o (bucket, content_hash, path, size, content_type, ref_count)
+    VALUES (p_bucket, p_content_hash, p_path, p_size, p_content_type, 1)
+    ON CONFLICT (bucket, content_hash)
+    DO UPDATE SET ref_count = o.ref_count + 1, last_used_at = NOW()
+    RETURNING o.path, o.ref_count, (xmax = 0);
+$$ LANGUAGE sql;
+
+-- Drop a reference; returns the remaining count, and removes the row at zero
+-- so the caller deletes the object
+CREATE OR REPLACE FUNCTION release_stored_object(p_bucket TEXT, p_content_hash TEXT)
+RETURNS TABLE (path TEXT, ref_count INTEGER) AS $$
+BEGIN
+    RETURN QUERY
+    UPDATE stored_objects o
+    SET ref_count = o.ref_count - 1, last_used_at = NOW()
+    WHERE o.bucket = p_bucket AND o.content_hash = p_content_hash
+    RETURNING o.path, o.ref_count;
+
+    DELETE FROM stored_objects o
+    WHERE o.bucket = p_bucket AND o.content_hash = p_content_hash AND o.ref_count <= 0;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,19 @@
+-- migrate:no-transaction
+-- GET /api/users/{user_id}/timeline (app/timeline.py): each source is read as
+-- user_id = ? ORDER BY created_at DESC, id DESC with a keyset on (created_at, id),
+-- so a page is an index range scan per table instead of a sort of the user's rows.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_incidents_user_created_at_id
+    ON incidents (user_id, created_at DESC, id DESC);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_missing_persons_user_created_at_id
+    ON missing_persons (user_id, created_at DESC, id DESC);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_community_posts_user_created_at_id
+    ON community_posts (user_id, created_at DESC, id DESC);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sos_alerts_user_created_at_id
+    ON sos_alerts (user_id, created_at DESC, id DESC);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_safe_status_user_created_at_id
+    ON safe_status (user_id, created_at DESC, id DESC);
@@ -0,0 +1,8 @@
+-- Newest safe mark per user, for warming the safety status index
+-- (app/safety_status.py) without reading all of the append-only safe_status.
+-- DISTINCT ON walks idx_safe_status_user_created_at (user_id, created_at DESC,
+-- migration 0001), and keyset filters on user_id are pushed into it.
+CREATE OR REPLACE VIEW latest_safe_status AS
+    SELECT DISTINCT ON (user_id) id, user_id, user_name, latitude, longitude, message, created_at
+    FROM safe_status
+    ORDER BY user_id, created_at DESC;
@@ -0,0 +1,17 @@
+-- migrate:no-transaction
+-- Incremental refresh of the columnar snapshot (app/columnar.py): rows
+-- changed since a watermark, and ids archived since another, both read in
+-- keyset order.
+
+-- updated_at >= ? ORDER BY updated_at, id
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_incidents_updated_at_id
+    ON incidents (updated_at, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sos_alerts_updated_at_id
+    ON sos_alerts (updated_at, id);
+
+-- archived_at >= ? ORDER BY archived_at, id (partitioned tables cannot be
+-- indexed CONCURRENTLY; the archives are only written by the retention job)
+CREATE INDEX IF NOT EXISTS idx_incidents_archive_archived_at_id
+    ON incidents_archive (archived_at, id);
+CREATE INDEX IF NOT EXISTS idx_sos_alerts_archive_archived_at_id
+    ON sos_alerts_archive (archived_at, id);
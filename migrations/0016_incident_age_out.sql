@@ -0,0 +1,45 @@
+-- migrate:no-transaction
+-- Nothing moves an incident to 'resolved', so archiving only resolved
+-- clusters never moved a row. Age clusters out instead: a canonical incident
+-- and its duplicates are archived once the canonical has not changed since
+-- the cutoff, whatever its status. Every duplicate report bumps the
+-- canonical's report_count (and so its updated_at through
+-- trg_incidents_updated_at); a cluster with a recent duplicate is kept even
+-- if that recount has not run yet.
+
+-- Canonical incidents ordered by last change
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_incidents_canonical_updated_at
+    ON incidents (updated_at) WHERE canonical_incident_id IS NULL;
+
+DROP INDEX CONCURRENTLY IF EXISTS idx_incidents_resolved_updated_at;
+
+CREATE OR REPLACE FUNCTION archive_incidents(cutoff TIMESTAMPTZ, batch_size INTEGER DEFAULT 500)
+RETURNS INTEGER AS $$
+DECLARE
+    moved INTEGER;
+BEGIN
+    WITH canonical AS (
+        SELECT i.id FROM incidents i
+        WHERE i.canonical_incident_id IS NULL AND i.updated_at < cutoff
+          AND NOT EXISTS (
+              SELECT 1 FROM incidents d
+              WHERE d.canonical_incident_id = i.id AND d.created_at >= cutoff
+          )
+        ORDER BY i.updated_at
+        LIMIT batch_size
+        FOR UPDATE SKIP LOCKED
+    ), removed AS (
+        DELETE FROM incidents
+        WHERE id IN (SELECT id FROM canonical) OR canonical_incident_id IN (SELECT id FROM canonical)
+        RETURNING id, user_id, incident_type, description, location, latitude, longitude, photo_url,
+                  status, canonical_incident_id, report_count, created_at, updated_at, photo_urls,
+                  place_name, district, state
+    )
+    INSERT INTO incidents_archive (id, user_id, incident_type, description, location, latitude, longitude,
+                                   photo_url, status, canonical_incident_id, report_count, created_at, updated_at,
+                                   photo_urls, place_name, district, state)
+    SELECT * FROM removed;
+    GET DIAGNOSTICS moved = ROW_COUNT;
+    RETURN moved;
+END;
+$$ LANGUAGE plpgsql;
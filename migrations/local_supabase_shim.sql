@@ -0,0 +1,9 @@
+-- Minimal stand-ins for the Supabase objects database_setup.sql relies on,
+-- so the schema and migrations can be applied to a plain local Postgres
+-- (with PostGIS available, e.g. the postgis/postgis image). Never apply
+-- this to a Supabase project.
+CREATE SCHEMA IF NOT EXISTS auth;
+
+CREATE OR REPLACE FUNCTION auth.uid() RETURNS UUID AS $$
+    SELECT NULLIF(current_setting('request.jwt.claim.sub', TRUE), '')::UUID;
+$$ LANGUAGE sql STABLE;
@@ -1,4 +1,7 @@
+import os
 import uvicorn
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    # Pick up edits to static/ without restarting the cache
+    os.environ.setdefault("STATIC_ASSETS_RELOAD", "true")
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
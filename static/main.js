@@ -665,6 +665,34 @@ document.addEventListener('DOMContentLoaded', () => {
 
         backToHomeBtn.addEventListener('click', () => showPage('homePage'));
 
+        // Upload a photo straight to storage, then link it to the report row
+        async function uploadPhotoDirect(file, targetType, targetId) {
+            const targetForm = new FormData();
+            targetForm.append('target_type', targetType);
+            targetForm.append('filename', file.name);
+            targetForm.append('content_type', file.type || 'image/jpeg');
+            targetForm.append('file_size', file.size);
+            const targetResponse = await fetch('/api/uploads', { method: 'POST', body: targetForm });
+            if (!targetResponse.ok) {
+                throw new Error('Failed to get upload target');
+            }
+            const target = await targetResponse.json();
+
+            const uploadResponse = await fetch(target.url, { method: target.method, headers: target.headers, body: file });
+            if (!uploadResponse.ok) {
+                throw new Error('Photo upload failed');
+            }
+
+            const confirmForm = new FormData();
+            confirmForm.append('upload_token', target.upload_token);
+            confirmForm.append('target_id', targetId);
+            const confirmResponse = await fetch('/api/uploads/confirm', { method: 'POST', body: confirmForm });
+            if (!confirmResponse.ok) {
+                throw new Error('Failed to confirm photo upload');
+            }
+            return await confirmResponse.json();
+        }
+
         reportIncidentForm.addEventListener('submit', async (e) => {
             e.preventDefault();
             
@@ -697,18 +725,9 @@ document.addEventListener('DOMContentLoaded', () => {
                 formData.append('location', document.getElementById('incidentLocation').value);
                 formData.append('user_id', userId);
                 
-                // Add photo if selected
+                // Photo is uploaded directly to storage once the report exists
                 const incidentPhoto = document.getElementById('incidentPhoto');
-                console.log('Incident photo element:', incidentPhoto);
-                console.log('Files selected:', incidentPhoto ? incidentPhoto.files.length : 0);
-                
-                if (incidentPhoto && incidentPhoto.files[0]) {
-                    const file = incidentPhoto.files[0];
-                    console.log('Uploading file:', file.name, 'Size:', file.size, 'Type:', file.type);
-                    formData.append('incident_image', file);
-                } else {
-                    console.log('No photo selected');
-                }
+                const file = incidentPhoto && incidentPhoto.files[0];
                 
                 console.log('Submitting incident report to API...');
                 
@@ -721,6 +740,14 @@ document.addEventListener('DOMContentLoaded', () => {
                 if (response.ok) {
                     const result = await response.json();
                     console.log('Incident reported successfully:', result);
+                    if (file) {
+                        console.log('Uploading file:', file.name, 'Size:', file.size, 'Type:', file.type);
+                        try {
+                            await uploadPhotoDirect(file, 'incident', result.incident_id);
+                        } catch (uploadError) {
+                            console.error('Failed to upload incident photo:', uploadError);
+                        }
+                    }
                     reportIncidentForm.reset();
                     showModal('Incident Reported', 'Your incident report has been submitted and will appear in the community feed.', 'OK', () => {
                         showPage('homePage');
@@ -856,11 +883,8 @@ document.addEventListener('DOMContentLoaded', () => {
                 formData.append('reporter_contact', document.getElementById('reporterContact').value);
                 formData.append('user_id', currentUser?.id || 'anonymous');
                 
-                // Add photo if selected
+                // Photo is uploaded directly to storage once the report exists
                 const photoFile = document.getElementById('missingPhoto').files[0];
-                if (photoFile) {
-                    formData.append('person_photo', photoFile);
-                }
                 
                 const response = await fetch('/api/missing', {
                     method: 'POST',
@@ -869,6 +893,13 @@ document.addEventListener('DOMContentLoaded', () => {
                 
                 if (response.ok) {
                     const result = await response.json();
+                    if (photoFile) {
+                        try {
+                            await uploadPhotoDirect(photoFile, 'missing_person', result.report_id);
+                        } catch (uploadError) {
+                            console.error('Failed to upload missing person photo:', uploadError);
+                        }
+                    }
                     reportMissingForm.reset();
                     showModal('Report Submitted', 'Your missing person report has been added to the registry.', 'OK', () => {
                         document.querySelector('.tab-btn[data-tab="searchTab"]').click();
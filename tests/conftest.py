@@ -0,0 +1,41 @@
+"""
+Shared fixtures.
+
+Async code is driven through the ``run`` fixture. With LOOP_STRICT_MS set
+(e.g. ``LOOP_STRICT_MS=50 python -m pytest``) every coroutine runs under a
+strict LoopMonitor and the test fails if anything blocked the event loop
+for longer than that.
+"""
+import asyncio
+import os
+
+import pytest
+from fastapi.concurrency import run_in_threadpool
+
+from app.loop_monitor import LoopMonitor
+
+
+@pytest.fixture
+def run():
+    strict_ms = float(os.getenv("LOOP_STRICT_MS") or 0) or None
+
+    def runner(coro):
+        async def main():
+            if strict_ms is None:
+                return await coro
+            # Start the worker thread (and its lazy imports) before anything is measured
+            await run_in_threadpool(lambda: None)
+            monitor = LoopMonitor(strict_ms=strict_ms)
+            monitor.start()
+            try:
+                result = await coro
+                # Stalls are reported by the heartbeat after the loop runs again
+                await asyncio.sleep(monitor.interval * 3)
+            finally:
+                await monitor.stop()
+            monitor.check()
+            return result
+
+        return asyncio.run(main())
+
+    return runner
@@ -0,0 +1,170 @@
+import asyncio
+import hashlib
+
+import pytest
+
+from app.content_store import ContentStore, content_path, parse_content_url
+from app.direct_uploads import LocalUploadBackend
+
+
+class Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class Database:
+    """stored_objects and its two RPCs, as in migration 0012"""
+
+    def __init__(self):
+        self.rows = {}
+
+    def rpc(self, name, params):
+        key = (params["p_bucket"], params["p_content_hash"])
+
+        class Call:
+            def execute(call):
+                if name == "acquire_stored_object":
+                    created = key not in self.rows
+                    row = self.rows.setdefault(key, {"path": params["p_path"], "ref_count": 0})
+                    row["ref_count"] += 1
+                    return Result([{"path": row["path"], "ref_count": row["ref_count"], "created": created}])
+                row = self.rows.get(key)
+                if row is None:
+                    return Result([])
+                row["ref_count"] -= 1
+                released = {"path": row["path"], "ref_count": row["ref_count"]}
+                if row["ref_count"] <= 0:
+                    del self.rows[key]
+                return Result([released])
+
+        return Call()
+
+    def table(self, name):
+        rows = self.rows
+
+        class Query:
+            filters = {}
+
+            def select(self, *columns):
+                return self
+
+            def eq(self, column, value):
+                self.filters = {**self.filters, column: value}
+                return self
+
+            def execute(self):
+                row = rows.get((self.filters["bucket"], self.filters["content_hash"]))
+                return Result([row] if row else [])
+
+        return Query()
+
+
+class Storage:
+    def __init__(self):
+        self.objects = {}
+        self.uploads = 0
+        self.removed = []
+
+    def public_url(self, bucket, path):
+        return f"https://project.supabase.co/storage/v1/object/public/{bucket}/{path}"
+
+    async def upload(self, bucket, path, content, content_type="application/octet-stream"):
+        self.uploads += 1
+        await asyncio.sleep(0.01)
+        if not isinstance(content, bytes):
+            content = b"".join([chunk async for chunk in content])
+        self.objects[(bucket, path)] = content
+        return self.public_url(bucket, path)
+
+    async def remove(self, bucket, paths):
+        for path in paths:
+            self.removed.append(path)
+            self.objects.pop((bucket, path), None)
+
+
+@pytest.fixture
+def store():
+    return ContentStore(Database(), Storage())
+
+
+def digest_of(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def test_copies_share_one_object(run, store):
+    content = b"forwarded photo"
+    digest = digest_of(content)
+
+    async def main():
+        return await asyncio.gather(*(store.store("incident_images", content, digest, "image/jpeg") for _ in range(5)))
+
+    stored = run(main())
+    assert store.storage.uploads == 1
+    assert {url for url, _ in stored} == {store.public_url("incident_images", digest)}
+    assert sorted(reused for _, reused in stored) == [False, True, True, True, True]
+    assert store.supabase.rows[("incident_images", digest)]["ref_count"] == 5
+    assert store.stats()["bytes_saved"] == 4 * len(content)
+
+
+def test_object_is_deleted_with_its_last_reference(run, store):
+    content = b"photo"
+    digest = digest_of(content)
+    run(store.store("community_images", content, digest))
+    url, _ = run(store.store("community_images", content, digest))
+
+    assert run(store.release_url(url)) is False
+    assert ("community_images", content_path(digest)) in store.storage.objects
+    assert run(store.release_url(url)) is True
+    assert store.storage.objects == {}
+    assert store.supabase.rows == {}
+
+
+def test_release_keeps_object_reacquired_meanwhile(run, store):
+    content = b"photo"
+    digest = digest_of(content)
+    run(store.store("community_images", content, digest))
+
+    # Another instance takes a reference between the release RPC and the delete
+    release_rpc = store.supabase.rpc
+
+    def rpc(name, params):
+        call = release_rpc(name, params)
+        if name != "release_stored_object":
+            return call
+
+        class Reacquired:
+            def execute(self):
+                result = call.execute()
+                release_rpc("acquire_stored_object", {**params, "p_path": content_path(digest)}).execute()
+                return result
+
+        return Reacquired()
+
+    store.supabase.rpc = rpc
+    assert run(store.release("community_images", digest)) is False
+    assert store.storage.removed == []
+
+
+def test_failed_upload_drops_its_reference(run, store):
+    async def broken(*args, **kwargs):
+        raise OSError("storage unreachable")
+
+    store.storage.upload = broken
+    with pytest.raises(OSError):
+        run(store.store("incident_images", b"photo", digest_of(b"photo")))
+    assert store.supabase.rows == {}
+
+
+def test_parse_content_url_forms(tmp_path):
+    digest = digest_of(b"photo")
+    supabase_url = f"https://project.supabase.co/storage/v1/object/public/incident_images/sha256/{digest[:2]}/{digest}"
+    local_url = f"/api/uploads/local/files/incident_images/sha256/{digest[:2]}/{digest}"
+    assert parse_content_url(supabase_url) == ("incident_images", content_path(digest), digest)
+    assert parse_content_url(local_url) == ("incident_images", content_path(digest), digest)
+    assert parse_content_url("https://project.supabase.co/storage/v1/object/public/incident_images/legacy.jpg") is None
+    assert parse_content_url(None) is None
+
+    local = ContentStore(Database(), LocalUploadBackend(str(tmp_path), ""))
+    remote = ContentStore(Database(), Storage())
+    assert local.serves(local_url) and not local.serves(supabase_url)
+    assert remote.serves(supabase_url) and not remote.serves(local_url)
@@ -0,0 +1,55 @@
+import random
+
+from app.escalation import TimingWheel
+
+
+def _fire_times(wheel: TimingWheel, ticks: int) -> dict:
+    fired = {}
+    for _ in range(ticks):
+        for key, value in wheel.tick():
+            fired[key] = (wheel.now, value)
+    return fired
+
+
+def test_timers_fire_on_their_tick_across_levels():
+    # 4 slots x 3 levels covers 64 ticks; later deadlines wait at the top level
+    wheel = TimingWheel(slots=4, levels=3)
+    deadlines = {f"t{ticks}": ticks for ticks in (1, 3, 4, 5, 15, 16, 17, 63, 64, 65, 100, 250)}
+    for key, ticks in deadlines.items():
+        wheel.schedule(key, ticks, value=ticks)
+
+    fired = _fire_times(wheel, 300)
+
+    assert fired == {key: (ticks, ticks) for key, ticks in deadlines.items()}
+    assert len(wheel) == 0
+
+
+def test_timers_scheduled_mid_rotation():
+    wheel = TimingWheel(slots=8, levels=3)
+    rng = random.Random(7)
+    expected = {}
+    for step in range(200):
+        if step % 5 == 0:
+            key = f"k{step}"
+            ticks = rng.randint(1, 700)
+            wheel.schedule(key, ticks)
+            expected[key] = wheel.now + ticks
+        for key, _ in wheel.tick():
+            assert wheel.now == expected.pop(key)
+    for key, (now, _) in _fire_times(wheel, 1000).items():
+        assert now == expected.pop(key)
+    assert not expected and len(wheel) == 0
+
+
+def test_cancel_and_reschedule():
+    wheel = TimingWheel(slots=4, levels=2)
+    wheel.schedule("a", 10)
+    wheel.schedule("b", 10)
+    assert wheel.cancel("a")
+    assert not wheel.cancel("a")
+    # Rescheduling replaces the earlier timer
+    wheel.schedule("b", 3)
+    assert "b" in wheel and "a" not in wheel
+
+    fired = _fire_times(wheel, 20)
+    assert fired == {"b": (3, None)}
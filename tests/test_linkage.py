@@ -0,0 +1,48 @@
+from app.linkage import FOUND, MISSING, LinkageIndex, Person, phonetic_code
+
+
+def test_transliteration_variants_share_a_code():
+    assert phonetic_code("mohammed") == phonetic_code("muhammad")
+    assert phonetic_code("lakshmi") == phonetic_code("laxmi")
+
+
+def test_report_matches_found_record_sharing_a_block():
+    index = LinkageIndex()
+    index.add(FOUND, Person("user", "u1", "Mohd Rafiq", age=34, area="Pune"))
+    index.add(FOUND, Person("user", "u2", "Sunita Devi", age=34, area="Pune"))
+
+    matches = index.add(MISSING, Person("missing_person", "m1", "Mohammed Rafiq", age=35, area="pune"))
+
+    assert [match["matched_id"] for match in matches] == ["u1"]
+    assert matches[0]["reasons"]["same_area"] is True
+    # Sunita Devi shares no block with the report, so she was never scored
+    assert index.compared == 1
+
+
+def test_matching_works_both_ways():
+    index = LinkageIndex()
+    assert index.add(MISSING, Person("missing_person", "m1", "Laxmi Patil", age=60, area="Satara")) == []
+    matches = index.add(FOUND, Person("safe_mark", "s1", "Lakshmi Patil", age=61, area="Satara"))
+    assert [(match["missing_person_id"], match["matched_id"]) for match in matches] == [("m1", "s1")]
+
+
+def test_neighbouring_age_band_is_probed():
+    index = LinkageIndex()
+    # 29 and 30 fall in different five-year bands; no area, one-word names
+    index.add(FOUND, Person("user", "u1", "Ramesh", age=29))
+    matches = index.add(MISSING, Person("missing_person", "m1", "Ramesh", age=30))
+    assert [match["matched_id"] for match in matches] == ["u1"]
+
+
+def test_blocks_stay_bounded_when_records_are_re_added():
+    index = LinkageIndex()
+    side = index.sides[FOUND]
+    for version in range(50):
+        index.add(FOUND, Person("user", "u1", f"Ramesh Kumar{'a' * (version % 3)}", age=20 + version, area=f"district {version}"))
+    person = side.people["user:u1"]
+    assert set(side.blocks) == set(person.index_keys())
+    assert all(block == {"user:u1"} for block in side.blocks.values())
+
+    assert index.remove(FOUND, "user:u1")
+    assert side.blocks == {} and side.people == {}
+    assert not index.remove(FOUND, "user:u1")
@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+import pytest
+
+from app.loop_monitor import BlockingCallError, LoopMonitor
+
+
+async def _monitored(monitor: LoopMonitor, work):
+    monitor.start()
+    try:
+        await asyncio.sleep(monitor.interval * 2)
+        await work()
+        await asyncio.sleep(monitor.interval * 3)
+    finally:
+        await monitor.stop()
+
+
+def test_strict_mode_lowers_threshold_to_strict_ms():
+    monitor = LoopMonitor(threshold=0.1, strict_ms=30)
+    assert monitor.strict == pytest.approx(0.03)
+    assert monitor.threshold == pytest.approx(0.03)
+    assert monitor.interval <= monitor.threshold / 2
+
+
+def test_check_raises_for_blocking_call():
+    monitor = LoopMonitor(strict_ms=50)
+
+    async def blocking():
+        time.sleep(0.3)
+
+    asyncio.run(_monitored(monitor, blocking))
+    assert monitor.stalls >= 1
+    with pytest.raises(BlockingCallError, match="blocking calls over 50ms"):
+        monitor.check()
+
+
+def test_check_passes_when_nothing_blocks():
+    monitor = LoopMonitor(strict_ms=50)
+
+    async def cooperative():
+        for _ in range(10):
+            await asyncio.sleep(0.01)
+
+    asyncio.run(_monitored(monitor, cooperative))
+    monitor.check()
+    assert monitor.violations == []
+
+
+def test_without_strict_mode_stalls_are_only_reported():
+    monitor = LoopMonitor(threshold=0.05)
+
+    async def blocking():
+        time.sleep(0.2)
+
+    asyncio.run(_monitored(monitor, blocking))
+    assert monitor.stalls >= 1
+    assert monitor.stats()["strict_ms"] is None
+    monitor.check()
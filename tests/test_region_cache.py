@@ -0,0 +1,141 @@
+import asyncio
+import json
+
+import pytest
+
+from app.region_cache import RegionalCache, parse_region_sizes
+from app.single_flight import SingleFlight
+
+
+def test_single_flight_collapses_concurrent_calls(run):
+    flights = SingleFlight()
+    calls = []
+
+    async def build():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"rows": [1, 2]}
+
+    async def main():
+        return await asyncio.gather(*(flights.do("list", "list:all", build) for _ in range(20)))
+
+    bodies = run(main())
+    assert len(calls) == 1
+    assert {json.loads(body)["rows"][1] for body in bodies} == {2}
+    assert flights.stats()["operations"]["list"]["collapsed"] == 19
+    assert flights.flights == {}
+
+
+def test_single_flight_shares_errors_then_retries(run):
+    flights = SingleFlight()
+    attempts = []
+
+    async def build():
+        attempts.append(1)
+        await asyncio.sleep(0.01)
+        if len(attempts) == 1:
+            raise RuntimeError("upstream down")
+        return {"ok": True}
+
+    async def main():
+        first = await asyncio.gather(*(flights.do("op", "k", build) for _ in range(3)), return_exceptions=True)
+        second = await flights.do("op", "k", build)
+        return first, second
+
+    first, second = run(main())
+    assert all(isinstance(result, RuntimeError) for result in first)
+    assert json.loads(second) == {"ok": True}
+    assert len(attempts) == 2
+
+
+def test_single_flight_timeout(run):
+    flights = SingleFlight(timeouts={"slow": 0.01})
+
+    async def build():
+        await asyncio.sleep(1)
+
+    with pytest.raises(asyncio.TimeoutError):
+        run(flights.do("slow", "k", build))
+    assert flights.counters["slow"]["timeouts"] == 1
+
+
+def test_regional_cache_caches_per_region(run):
+    cache = RegionalCache(ttl=60)
+    builds = []
+
+    def build_for(region):
+        async def build(flight_key):
+            builds.append(flight_key)
+            return {"region": region}
+        return build
+
+    async def main():
+        await cache.get_or_build("Pune", "feed", build_for("Pune"))
+        await cache.get_or_build("pune ", "feed", build_for("Pune"))
+        await cache.get_or_build("Nagpur", "feed", build_for("Nagpur"))
+        cache.invalidate("Nagpur")
+        await cache.get_or_build("Pune", "feed", build_for("Pune"))
+        await cache.get_or_build("Nagpur", "feed", build_for("Nagpur"))
+
+    run(main())
+    # Pune built once; Nagpur built again after its invalidation, in a new generation
+    assert builds == ["pune|0|feed", "nagpur|0|feed", "nagpur|1|feed"]
+
+
+def test_build_started_before_invalidation_is_not_joined_or_cached(run):
+    cache = RegionalCache(ttl=60)
+    flights = SingleFlight()
+    version = {"rows": "old"}
+
+    async def main():
+        building = asyncio.Event()
+
+        async def build():
+            snapshot = dict(version)
+            building.set()
+            await asyncio.sleep(0.05)
+            return snapshot
+
+        def read():
+            return cache.get_or_build("Pune", "feed", lambda flight_key: flights.do("feed", flight_key, build))
+
+        stale = asyncio.ensure_future(read())
+        await building.wait()
+        # A write lands while the first build is in flight
+        version["rows"] = "new"
+        cache.invalidate("Pune")
+        fresh = await read()
+        return json.loads(await stale), json.loads(fresh), json.loads(await read())
+
+    stale, fresh, cached = run(main())
+    assert stale == {"rows": "old"}
+    assert fresh == {"rows": "new"}
+    assert cached == {"rows": "new"}
+
+
+def test_invalidation_clears_global_partition_too(run):
+    cache = RegionalCache(ttl=60)
+
+    async def build(flight_key):
+        return {"key": flight_key}
+
+    async def main():
+        await cache.get_or_build(None, "all", build)
+        await cache.get_or_build("Thane", "feed", build)
+        await cache.get_or_build("Pune", "feed", build)
+        cache.invalidate("Thane")
+
+    run(main())
+    assert cache.partitions["*"].entries == {}
+    assert cache.partitions["thane"].entries == {}
+    assert "feed" in cache.partitions["pune"].entries
+
+
+def test_partition_budget_and_region_sizes():
+    assert parse_region_sizes("Pune:8MB, Kamrup Metropolitan:512kb") == {"pune": 8 * 1024 ** 2, "kamrup metropolitan": 512 * 1024}
+    cache = RegionalCache(default_capacity=100, capacities={"pune": 300})
+    partition = cache.partition("Pune")
+    for index in range(5):
+        partition.put(f"k{index}", b"x" * 100, ttl=60)
+    assert partition.size == 300 and list(partition.entries) == ["k2", "k3", "k4"]
+    assert cache.partition("Thane").capacity == 100
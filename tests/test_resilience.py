@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from postgrest.exceptions import APIError
+
+from app.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    UpstreamResponseError,
+    _execute,
+    is_permanent,
+    is_transient,
+    record_outcome,
+)
+
+
+def api_error(code=None, message="error") -> APIError:
+    return APIError({"code": code, "message": message})
+
+
+@pytest.mark.parametrize("error", [
+    CircuitOpenError("open"),
+    UpstreamResponseError("bad gateway page"),
+    asyncio.TimeoutError(),
+    httpx.ConnectError("refused"),
+    httpx.ReadTimeout("slow"),
+    ConnectionResetError(),
+    # PostgREST could not reach the database
+    api_error("PGRST000"),
+    api_error("PGRST003"),
+    # Connection and resource SQLSTATEs
+    api_error("08006"),
+    api_error("53300"),
+    api_error("57014"),
+    # Gateway errors with no PostgREST code, or only an HTTP status
+    api_error(None),
+    api_error("502"),
+    api_error(503),
+])
+def test_transient_errors(error):
+    assert is_transient(error)
+    assert not is_permanent(error)
+
+
+@pytest.mark.parametrize("code", ["23505", "23503", "22P02", "42501", "42P01", "28000", "P0001", "PGRST116", "PGRST204", "PGRST301", "400", 404])
+def test_client_errors_are_permanent(code):
+    error = api_error(code)
+    assert is_permanent(error)
+    assert not is_transient(error)
+
+
+@pytest.mark.parametrize("error", [KeyError("id"), ValueError("bad"), TypeError("oops")])
+def test_own_bugs_are_neither(error):
+    assert not is_transient(error)
+    assert not is_permanent(error)
+
+
+def test_record_outcome():
+    breaker = CircuitBreaker("test", failure_threshold=2)
+    record_outcome(breaker, httpx.ConnectError("refused"))
+    assert breaker.failures == 1
+    record_outcome(breaker, api_error("23505"))
+    assert breaker.failures == 0 and breaker.state == CircuitBreaker.CLOSED
+    record_outcome(breaker, api_error("PGRST000"))
+    record_outcome(breaker, api_error(None))
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_undecodable_response_is_an_upstream_failure():
+    class Query:
+        def execute(self):
+            return json.loads("<html>502 Bad Gateway</html>")
+
+    with pytest.raises(UpstreamResponseError) as raised:
+        _execute(Query())
+    assert is_transient(raised.value)
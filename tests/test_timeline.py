@@ -0,0 +1,126 @@
+import re
+
+import pytest
+
+from app.timeline import TimelineError, build_timeline, decode_cursor, encode_cursor
+
+_OR_KEYSET = re.compile(r'^created_at\.lt\."([^"]+)",and\(created_at\.eq\."([^"]+)",id\.lt\.(.+)\)$')
+
+
+class Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class Query:
+    """The subset of the PostgREST builder the timeline uses, over a list of rows"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.filters = []
+        self.size = None
+
+    def select(self, *columns):
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row[column] == value)
+        return self
+
+    def lt(self, column, value):
+        self.filters.append(lambda row: row[column] < value)
+        return self
+
+    def lte(self, column, value):
+        self.filters.append(lambda row: row[column] <= value)
+        return self
+
+    def or_(self, condition):
+        created_at, tied_at, row_id = _OR_KEYSET.match(condition).groups()
+        self.filters.append(lambda row: row["created_at"] < created_at or (row["created_at"] == tied_at and row["id"] < row_id))
+        return self
+
+    def order(self, column, desc=False):
+        return self
+
+    def limit(self, size):
+        self.size = size
+        return self
+
+    def execute(self):
+        rows = [row for row in self.rows if all(check(row) for check in self.filters)]
+        rows.sort(key=lambda row: (row["created_at"], row["id"]), reverse=True)
+        return Result(rows[:self.size])
+
+
+class Supabase:
+    def __init__(self, tables):
+        self.tables = tables
+
+    def table(self, name):
+        return Query(self.tables.get(name, []))
+
+
+async def read(query, name):
+    return query.execute()
+
+
+def _at(second: int) -> str:
+    return f"2024-03-01T10:{second // 60:02d}:{second % 60:02d}+00:00"
+
+
+@pytest.fixture
+def supabase():
+    tables = {"incidents": [], "community_posts": [], "sos_alerts": [], "safe_status": [], "missing_persons": []}
+    # Many posts, a few of everything else, and ties on created_at within and across tables
+    for index in range(57):
+        tables["community_posts"].append({"id": f"p{index:03d}", "user_id": "u1", "created_at": _at(index * 3), "message": "hi"})
+    for index in range(9):
+        tables["incidents"].append({"id": f"i{index:03d}", "user_id": "u1", "created_at": _at(index * 9), "location": "Pune"})
+    tables["incidents"].append({"id": "i100", "user_id": "u1", "created_at": _at(27), "location": "Pune"})
+    tables["sos_alerts"].append({"id": "s000", "user_id": "u1", "created_at": _at(27)})
+    tables["safe_status"].append({"id": "f000", "user_id": "u1", "created_at": _at(100)})
+    tables["incidents"].append({"id": "i999", "user_id": "other", "created_at": _at(5), "location": "Pune"})
+    return Supabase(tables)
+
+
+def _expected(supabase) -> list:
+    types = {"incidents": "incident", "community_posts": "community_post", "sos_alerts": "sos_alert",
+             "safe_status": "safe_mark", "missing_persons": "missing_person"}
+    items = [(row["created_at"], types[table], row["id"]) for table, rows in supabase.tables.items() for row in rows if row["user_id"] == "u1"]
+    return sorted(items, reverse=True)
+
+
+@pytest.mark.parametrize("limit", [1, 4, 7, 20])
+def test_pages_cover_every_item_once_in_order(run, supabase, limit):
+    seen, cursor = [], None
+    while True:
+        page = run(build_timeline(supabase, read, "u1", limit=limit, cursor=cursor))
+        assert page["count"] <= limit
+        seen.extend((item["created_at"], item["type"], item["id"]) for item in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == _expected(supabase)
+
+
+def test_first_page_reads_little_more_than_it_returns(run, supabase):
+    page = run(build_timeline(supabase, read, "u1", limit=10))
+    assert page["count"] == 10
+    assert sum(page["rows_read"].values()) <= 10 + 5 * 5
+    assert page["round_trips"] <= 7
+
+
+def test_type_filter(run, supabase):
+    page = run(build_timeline(supabase, read, "u1", limit=100, types=["incident"]))
+    assert {item["type"] for item in page["items"]} == {"incident"}
+    assert page["count"] == 10 and page["next_cursor"] is None
+
+
+def test_cursor_round_trip_and_errors(run):
+    item = {"created_at": _at(3), "type": "incident", "id": 42}
+    assert decode_cursor(encode_cursor(item)) == (_at(3), "incident", "42")
+    with pytest.raises(TimelineError):
+        decode_cursor("not-a-cursor")
+    with pytest.raises(TimelineError):
+        run(build_timeline(Supabase({}), read, "u1", types=["nope"]))
@@ -0,0 +1,131 @@
+import httpx
+import pytest
+from postgrest.exceptions import APIError
+
+from app.resilience import CircuitBreaker
+from app.write_spool import CriticalWriter, WriteSpool
+
+
+class Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class Upstream:
+    """Supabase stand-in: rows land in ``tables`` unless ``fail`` says otherwise"""
+
+    def __init__(self):
+        self.tables = {}
+        # row id -> exception raised while writing it (every time)
+        self.fail = {}
+        self.down = False
+
+    def table(self, name):
+        upstream = self
+
+        class Query:
+            def insert(self, row):
+                self.row = row
+                return self
+
+            def upsert(self, row, on_conflict=None, ignore_duplicates=False):
+                self.row = row
+                return self
+
+            def execute(self):
+                if upstream.down:
+                    raise httpx.ConnectError("connection refused")
+                if self.row["id"] in upstream.fail:
+                    raise upstream.fail[self.row["id"]]
+                rows = upstream.tables.setdefault(name, {})
+                rows.setdefault(self.row["id"], self.row)
+                return Result([self.row])
+
+        return Query()
+
+
+@pytest.fixture
+def upstream():
+    return Upstream()
+
+
+@pytest.fixture
+def writer(tmp_path, upstream):
+    spool = WriteSpool(str(tmp_path / "spool.sqlite3"))
+    yield CriticalWriter(upstream, CircuitBreaker("test", failure_threshold=100), spool, timeout=1.0)
+    spool.close()
+
+
+def test_insert_goes_upstream_when_healthy(run, writer, upstream):
+    written = run(writer.insert("sos_alerts", {"id": "a1", "user_id": "u1"}))
+    assert written["queued"] is False
+    assert "created_at" in written["row"]
+    assert list(upstream.tables["sos_alerts"]) == ["a1"]
+
+
+def test_outage_queues_then_replays_in_order(run, writer, upstream):
+    upstream.down = True
+    for index in range(3):
+        assert run(writer.insert("safe_status", {"id": f"s{index}", "user_id": "u1"}))["queued"]
+    upstream.down = False
+    # Queued rows go first: a later write is queued behind them to keep order
+    assert run(writer.insert("safe_status", {"id": "s3", "user_id": "u1"}))["queued"]
+    assert [row["id"] for row in run(writer.pending("safe_status"))] == ["s0", "s1", "s2", "s3"]
+
+    assert run(writer.replay()) == 4
+    assert list(upstream.tables["safe_status"]) == ["s0", "s1", "s2", "s3"]
+    assert writer.spool.depth() == 0
+    # Accepted rows keep the created_at they were accepted with
+    assert all(row["created_at"] for row in upstream.tables["safe_status"].values())
+
+
+def test_permanent_rejection_fails_the_request(run, writer, upstream):
+    upstream.fail["bad"] = APIError({"code": "23503", "message": "violates foreign key constraint"})
+    with pytest.raises(APIError):
+        run(writer.insert("sos_alerts", {"id": "bad", "user_id": "nobody"}))
+    assert writer.spool.depth() == 0
+
+
+@pytest.mark.parametrize("error", [
+    APIError({"code": "PGRST000", "message": "Could not connect to the database"}),
+    APIError({"code": None, "message": "Bad gateway"}),
+    httpx.ReadTimeout("timed out"),
+])
+def test_replay_stops_on_ambiguous_errors_without_setting_rows_aside(run, writer, upstream, error):
+    upstream.down = True
+    run(writer.insert("safe_status", {"id": "s0"}))
+    run(writer.insert("safe_status", {"id": "s1"}))
+    upstream.down = False
+    upstream.fail["s0"] = error
+
+    assert run(writer.replay()) == 0
+    assert writer.spool.depth() == 2
+    assert writer.spool.depth(failed=True) == 0
+
+    del upstream.fail["s0"]
+    assert run(writer.replay()) == 2
+
+
+def test_replay_sets_aside_rows_upstream_rejects(run, writer, upstream):
+    upstream.down = True
+    for index in range(3):
+        run(writer.insert("safe_status", {"id": f"s{index}"}))
+    upstream.down = False
+    upstream.fail["s1"] = APIError({"code": "23505", "message": "duplicate key"})
+
+    assert run(writer.replay()) == 2
+    assert list(upstream.tables["safe_status"]) == ["s0", "s2"]
+    assert writer.spool.depth() == 0
+    assert writer.spool.depth(failed=True) == 1
+
+
+def test_spool_keeps_one_copy_per_row(tmp_path):
+    spool = WriteSpool(str(tmp_path / "spool.sqlite3"))
+    assert spool.add("sos_alerts", {"id": "a1"})
+    assert not spool.add("sos_alerts", {"id": "a1"})
+    assert spool.depth("sos_alerts") == 1
+    spool.close()
+    # Still there after the process goes away
+    reopened = WriteSpool(str(tmp_path / "spool.sqlite3"))
+    assert [row for _, _, row in reopened.peek()] == [{"id": "a1"}]
+    reopened.close()